@@ -13,6 +13,16 @@ import PIL.Image
 import json
 import shutil
 from filelock import FileLock
+from speed_estimation import SpeedEstimator, load_calibration
+from zone_counter import ZoneCounter
+from overlay import OverlayRenderer
+from display_thread import DisplayThread
+from buffer_pool import FramePool, AssociationScratch, HELMET, LICENSE_PLATE
+from metrics_server import PipelineMetrics, MetricsServer
+from event_log import EventLog
+import sqlite_utils
+from traffic_aggregates import RollingCounts, VEHICLE_CLASSES
+from queue_estimator import QueueEstimator
 # import boto3
 # s3=boto3.resource('s3')
 
@@ -25,7 +35,7 @@ parser = argparse.ArgumentParser()
 parser.add_argument('--model', help='Path to YOLO model file (example: "runs/detect/train/weights/best.pt")',
                     required=True)
 parser.add_argument('--source', help='Image source, can be image file ("test.jpg"), \
-                    image folder ("test_dir"), video file ("testvid.mp4"), or index of USB camera ("usb0")', 
+                    image folder ("test_dir"), watched folder ("watch:test_dir"), video file ("testvid.mp4"), or index of USB camera ("usb0")', 
                     required=True)
 parser.add_argument('--thresh', help='Minimum confidence threshold for displaying detected objects (example: "0.4")',
                     default=0.5)
@@ -34,9 +44,26 @@ parser.add_argument('--resolution', help='Resolution in WxH to display inference
                     default=None)
 parser.add_argument('--record', help='Record results from video or webcam and save it as "demo1.avi". Must specify --resolution argument to record.',
                     action='store_true')
+parser.add_argument('--calibration', help='JSON file with the image-to-ground homography for each camera (used for speed). \
+                    Without it, 10 m per 25 px is assumed', default=None)
+parser.add_argument('--zones', help='JSON file with the counting lines and polygons for each camera. \
+                    Without it, the single line at y=490 is used', default=None)
+parser.add_argument('--render-every', help='Draw and display only every Nth frame (inference still runs on every frame)',
+                    type=int, default=1)
+parser.add_argument('--display-fps', help='Run the preview window on its own thread at this refresh rate (example: "15"). \
+                    Otherwise the window is refreshed once per inference frame', type=float, default=None)
+parser.add_argument('--event-log', help='Append speed, helmet and crossing events to this journal (example: "local_data/events.jsonl") \
+                    instead of rewriting the JSON files; run event_log.py to rebuild them', default=None)
+parser.add_argument('--sqlite', help='Also store speed, helmet, crossing and crop records in this SQLite file \
+                    (example: "local_data/traffic.sqlite")', default=None)
+parser.add_argument('--fsync', help='Event log fsync policy: "always", "batch" or "os"', default="batch")
+parser.add_argument('--metrics-port', help='Serve Prometheus metrics on http://127.0.0.1:<port>/metrics (example: "9101")',
+                    type=int, default=None)
 
 args = parser.parse_args()
 
+CAMERA_ID = 'R2' # camera / approach handled by this script
+
 
 # Parse user inputs
 model_path = args.model
@@ -58,7 +85,13 @@ labels = model.names
 img_ext_list = ['.jpg','.JPG','.jpeg','.JPEG','.png','.PNG','.bmp','.BMP']
 vid_ext_list = ['.avi','.mov','.mp4','.mkv','.wmv']
 
-if os.path.isdir(img_source):
+if img_source.startswith('watch:'):
+    source_type = 'watch'
+    watch_dir = img_source[6:]
+    if not os.path.isdir(watch_dir):
+        print(f'Watch folder {watch_dir} does not exist. Please try again.')
+        sys.exit(0)
+elif os.path.isdir(img_source):
     source_type = 'folder'
 elif os.path.isfile(img_source):
     _, ext = os.path.splitext(img_source)
@@ -74,7 +107,8 @@ elif 'usb' in img_source:
     usb_idx = int(img_source[3:])
 elif 'picamera' in img_source:
     source_type = 'picamera'
-    picam_idx = int(img_source[8:])
+    fake_picamera = img_source.startswith('fake') # "fakepicamera0" runs the capture path without a camera
+    picam_idx = int(img_source.split('picamera')[1] or 0)
 else:
     print(f'Input {img_source} is invalid. Please try again.')
     sys.exit(0)
@@ -97,7 +131,9 @@ if record:
     # Set up recording
     record_name = 'demo1.avi'
     record_fps = 30
-    recorder = cv2.VideoWriter(record_name, cv2.VideoWriter_fourcc(*'MJPG'), record_fps, (resW,resH))
+    # Encoding runs in its own process; frames are placed by their real timestamps
+    from async_recorder import AsyncRecorder
+    recorder = AsyncRecorder(record_name, (resW,resH), fps=record_fps)
 
 # Load or initialize image source
 if source_type == 'image':
@@ -109,6 +145,10 @@ elif source_type == 'folder':
         _, file_ext = os.path.splitext(file)
         if file_ext in img_ext_list:
             imgs_list.append(file)
+elif source_type == 'watch':
+    from folder_watch import FolderWatcher
+    watcher = FolderWatcher(watch_dir)
+    watcher.start()
 elif source_type == 'video' or source_type == 'usb':
 
     if source_type == 'video': cap_arg = img_source
@@ -121,10 +161,9 @@ elif source_type == 'video' or source_type == 'usb':
         ret = cap.set(4, resH)
 
 elif source_type == 'picamera':
-    from picamera2 import Picamera2
-    cap = Picamera2()
-    cap.configure(cap.create_video_configuration(main={"format": 'XRGB8888', "size": (resW, resH)}))
-    cap.start()
+    # Frames arrive in OpenCV's BGR layout, so they go to inference without a copy or conversion
+    from picam_capture import open_picamera, capture_bgr
+    cap = open_picamera((resW, resH), camera_num=picam_idx, fake=fake_picamera)
 
 # Set bounding box colors (using the Tableu 10 color scheme)
 # bbox_colors = [(164,120,87), (68,148,228), (93,97,209), (178,182,133), (88,159,106), 
@@ -142,52 +181,70 @@ img_count = 0
 points = []
 
 # Mouse callback function to get coordinates
+# (may run on the display thread, so it only records the point; picked points are drawn on every frame)
 def get_coordinates(event, x, y, flags, param):
-    global points, frame
+    global points
     if event == cv2.EVENT_LBUTTONDOWN:  # Left mouse button click
         points.append((x, y))
         print(f"Point {len(points)}: ({x}, {y})")
+################################################
 
-        # Draw a red dot at the clicked point
-        cv2.circle(frame, (x, y), 5, (0, 0, 255), -1)
+###### Zone counters (counting lines and polygons, per class and direction) ##########
+zone_counter=ZoneCounter.from_config(args.zones, CAMERA_ID, [labels[i] for i in sorted(labels)])
+class_counts_1={name:0 for name in labels.values()} # crossings of the first zone, for display
+volumes=RollingCounts() # crossings of the first zone per class over the last 1 / 15 / 60 minutes
+counting_zone=zone_counter.zone_names[0] if zone_counter.zone_names else None
+############### smoothed queue length, published as Q1 for the signal controller ###############
+queue_estimator=QueueEstimator()
+vehicle_class_ids=np.array([i for i in sorted(labels) if labels[i] in VEHICLE_CLASSES])
+if zone_counter.polygons: # vehicles inside the first polygon are the queue, its in/out crossings move it
+    queue_zone=zone_counter.zone_names[zone_counter.n_lines]
+    queue_in, queue_out=zone_counter.directions[zone_counter.n_lines]
+else: # vehicles in view short of the counting line are the queue, crossing it leaves it
+    queue_zone=counting_zone
+    queue_in, queue_out=None, (zone_counter.directions[0][0] if counting_zone else None)
+##################################################
 
-        # If two points are selected, draw a line
-        if len(points) == 2:
-            cv2.line(frame, points[0], points[1], (0, 255, 0), 2)
-        
-        cv2.imshow("YOLO detection results", frame)
-################################################
+############### overlay: zones and counter captions are rendered once and cached ###############
+overlay=OverlayRenderer(render_every=1 if source_type in ['image','folder'] else args.render_every)
+for line_start, line_end in zone_counter.lines:
+    overlay.add_line(line_start, line_end, (0,0,255), 3)
+for polygon in zone_counter.polygons:
+    overlay.add_polygon(polygon, (0,0,255), 2)
+counter_captions=[("with_helmet",'with Helmet: '),("without_helmet",'without Helmet: '),("car",'Car: '),
+                  ("bike",'Bike: '),("bus",'Bus: '),("truck",'Truck: ')]
+for k,(key,caption) in enumerate(counter_captions):
+    overlay.add_counter(key, caption, (10,80+20*k), .7, (255,0,0), 2)
+if source_type == 'video' or source_type == 'usb' or source_type == 'picamera' or source_type == 'watch':
+    overlay.add_text('R2', (30,20), .7, (0,0,0), 3)
+##################### preview window (own thread with --display-fps) ####################################
+display=None
+if args.display_fps:
+    display=DisplayThread("YOLO detection results", refresh_fps=args.display_fps, mouse_callback=get_coordinates)
+    display.start()
+else:
+    cv2.namedWindow("YOLO detection results")
+    cv2.setMouseCallback("YOLO detection results", get_coordinates)
 
-###### Dictionary to store obj counts by class ##########
-class_counts_1={  # for line 1
-    "license_plate":0,
-    "helmet":0,
-    "car":0,
-    "bike":0,
-    "bus":0,
-    "truck":0,
-}
-# class_counts_2={  # for line 2
-#     "license_plate":0
-# }
-# class_counts_helmet={  # only for line 1
-#     "helmet":0
-# }
-######### dict to keep track of obj ID's that have crossed the line ################
-crossed_ids=set()
+def show(frame):
+    if display is not None:
+        display.publish(frame)
+    else:
+        cv2.imshow('YOLO detection results',frame)
+
+def wait_key(delay=0):
+    """Next key press: from the display thread's queue, or cv2.waitKey when displaying inline"""
+    if display is not None:
+        return display.wait_key() if delay == 0 else display.get_key()
+    return cv2.waitKey(delay)
 ##################################################
 
-# line coordinates
+# speed trap line coordinates
 line1_x1=0 #243 
 line1_y1=490
 line1_x2=1280
 line1_y2=490
 
-# line2_x1=675
-# line2_y1=451
-# line2_x2=954
-# line2_y2=451
-
 ###################### store all detected images ###################
 output_dir="local_data/all_vehicle_detected_img"
 if not os.path.exists(output_dir):
@@ -210,9 +267,42 @@ track_sort_conf={} # vehicle track id
 track_conf={}
 
 ####################### track time to calculate speed ###########################
-time1={}
+speed_estimator=SpeedEstimator(load_calibration(args.calibration, CAMERA_ID))
+frame_pool=FramePool() # capture / resize buffers reused across frames
+association=AssociationScratch() # helmet / licence plate to vehicle matching
+draw_queue=[] # boxes to draw once this frame's crops have been saved
+approaching=set() # tracks seen in the band just before the line
 track_speed={}
 ###################################################################
+
+##################### metrics endpoint (--metrics-port) ####################################
+metrics=PipelineMetrics(CAMERA_ID) # the loop only updates counters, the server formats them when scraped
+if args.metrics_port:
+    metrics.watch_zone_counter(zone_counter)
+    if record: metrics.watch_recorder(recorder)
+    if source_type == 'watch': metrics.watch_folder(watcher)
+    MetricsServer(metrics, args.metrics_port, traffic_path=r"/home/pi/Desktop/stcnss/Smart-Traffic-Control-and-Surveillance-System/demo/traffic.json")
+###################################################################
+
+##################### event journal (--event-log) ####################################
+event_log=EventLog(args.event_log, fsync=args.fsync) if args.event_log else None
+if args.sqlite: sqlite_utils.configure(args.sqlite) # records are written by sqlite_utils' writer thread
+
+def record_events(kind, updates, load, save):
+    """Append {track_id: value} updates to the event journal, or merge them into the legacy JSON file"""
+    if event_log is not None:
+        for track_id, value in updates.items():
+            event_log.append(kind, CAMERA_ID, track_id, value, frame_time)
+    else:
+        data=load()
+        data.update({f"{track_id}": value for track_id, value in updates.items()})
+        save(data)
+    if args.sqlite:
+        save_record=sqlite_utils.save_speed_data if kind == "speed" else sqlite_utils.save_helmet_data
+        for track_id, value in updates.items():
+            save_record(track_id, value, camera=CAMERA_ID)
+###################################################################
+
 # Begin inference loop
 while True:
 
@@ -225,35 +315,51 @@ while True:
             sys.exit(0)
         img_filename = imgs_list[img_count]
         frame = cv2.imread(img_filename)
+        frame_time = os.path.getmtime(img_filename)
         img_count = img_count + 1
     
+    elif source_type == 'watch': # If source is a watched folder, wait for the next image to arrive
+        img_filename, frame = watcher.next_frame(timeout=0.5)
+        if frame is None:
+            if (wait_key(5) & 0xFF) in (ord('q'), ord('Q')):
+                break
+            continue
+        frame_time = os.path.getmtime(img_filename)
+
     elif source_type == 'video': # If source is a video, load next frame from video file
-        ret, frame = cap.read()
+        ret, frame = frame_pool.read(cap)
         if not ret:
             print('Reached end of the video file. Exiting program.')
             break
+        frame_time = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000 # position in the file, not processing time
     
     elif source_type == 'usb': # If source is a USB camera, grab frame from camera
-        ret, frame = cap.read()
+        ret, frame = frame_pool.read(cap)
         if (frame is None) or (not ret):
             print('Unable to read frames from the camera. This indicates the camera is disconnected or not working. Exiting program.')
             break
+        frame_time = time.monotonic()
 
     elif source_type == 'picamera': # If source is a Picamera, grab frames using picamera interface
-        frame_bgra = cap.capture_array()
-        frame = cv2.cvtColor(np.copy(frame_bgra), cv2.COLOR_BGRA2BGR)
+        frame, frame_time = capture_bgr(cap) # frame_time is the sensor timestamp
         if (frame is None):
             print('Unable to read frames from the Picamera. This indicates the camera is disconnected or not working. Exiting program.')
             break
 
     # Resize frame to desired display resolution
-    if resize == True:
-        frame = cv2.resize(frame,(resW,resH))
+    if resize == True and (frame.shape[1], frame.shape[0]) != (resW, resH):
+        frame = frame_pool.resize(frame,(resW,resH))
+    t_capture = time.perf_counter()
+    metrics.observe("capture", t_capture - t_start)
     
     ######################################
     # Run inference on frame
     # results = model(frame, verbose=False) # default 
     results=model.track(frame,persist=True) # by hariom
+    if source_type == 'watch':
+        watcher.mark_done(img_filename)
+    t_inference = time.perf_counter()
+    metrics.observe("inference", t_inference - t_capture)
     #######################################################
 
 
@@ -267,6 +373,45 @@ while True:
     else:
         continue
     #####################################
+    render=overlay.should_render() # draw and display this frame?
+
+    ########### update trajectories of all confident tracks in one pass ###########
+    boxes_xyxy=detections.xyxy.cpu().numpy()
+    confident=np.flatnonzero(detections.conf.cpu().numpy()>0.5)
+    active_ids=[track_ids[i] for i in confident]
+    centres=np.column_stack(((boxes_xyxy[confident,0]+boxes_xyxy[confident,2])/2, (boxes_xyxy[confident,1]+boxes_xyxy[confident,3])/2))
+    speed_estimator.update(active_ids,centres,frame_time)
+    frame_speeds=dict(zip(active_ids,speed_estimator.speeds(active_ids)))
+    ##############################################################################
+
+    ########### zone crossings of all confident tracks in one pass ###########
+    active_classes=detections.cls.cpu().numpy().astype(int)[confident]
+    crossings=zone_counter.update(active_ids,centres,active_classes)
+    arrivals=departures=0
+    for zone, track_id, classname, direction in crossings:
+        if zone == counting_zone:
+            volumes.add(classname, frame_time)
+        if zone == queue_zone and classname in VEHICLE_CLASSES:
+            arrivals+=direction == queue_in
+            departures+=direction == queue_out
+        if event_log is not None:
+            event_log.append("crossing", CAMERA_ID, track_id, direction, frame_time, zone=zone, cls=classname)
+        if args.sqlite:
+            sqlite_utils.save_crossing(track_id, CAMERA_ID, zone, classname, direction, frame_time)
+    if zone_counter.zone_names:
+        class_counts_1=zone_counter.class_counts(0)
+    lane_volumes=volumes.snapshot(frame_time)
+    if zone_counter.polygons:
+        waiting=int(zone_counter.occupancy[0,vehicle_class_ids].sum())
+    else: # vehicles in view that have not crossed the counting line yet, so a crossing leaves both the
+          # prediction (as a departure) and the observation
+        in_queue=np.isin(active_classes,vehicle_class_ids)
+        if counting_zone is not None:
+            in_queue&=~zone_counter.crossed(0,active_ids)
+        waiting=int(in_queue.sum())
+    queue_estimator.update(waiting, frame_time, arrivals, departures)
+    lane_queue=queue_estimator.value()
+    ##############################################################################
 
     # Initialize variable for basic object counting example
     object_count = 0
@@ -289,8 +434,7 @@ while True:
     def save_dict(data):
         with open(FILE_PATH, "w") as file:
             json.dump(data, file, indent=4)
-
-    helmet_dict=load_dict()
+        metrics.inc("json_writes_total", file="helmet_data")
 
     #################### json file to store speed data #############################
     FILE_PATH2= r"/home/pi/Desktop/stcnss/Smart-Traffic-Control-and-Surveillance-System/local_data/speed_data.json"
@@ -303,7 +447,7 @@ while True:
     def save_dict2(data2):
         with open(FILE_PATH2,"w") as file2:
             json.dump(data2,file2,indent=4)
-    speed_dict=load_dict2()
+        metrics.inc("json_writes_total", file="speed_data")
 
     ################# UPDATE TRAFFIC VOLUME TO JSON ####################
     FILE_PATH3 = r"/home/pi/Desktop/stcnss/Smart-Traffic-Control-and-Surveillance-System/demo/traffic.json"
@@ -312,7 +456,9 @@ while True:
 
     def load_dict3():
         try:
+            t_lock = time.perf_counter()
             with FileLock(LOCK_PATH3):  # Lock the file during reading
+                metrics.inc("lock_wait_seconds_total", time.perf_counter() - t_lock, file="traffic")
                 with open(FILE_PATH3, "r") as file3:
                     return json.load(file3)
         except (FileNotFoundError, json.JSONDecodeError) as e:
@@ -320,11 +466,21 @@ while True:
             return {}
 
     def save_dict3(data3):
+        """Merge this lane's keys into traffic.json; the controller's lamps and A<n> flags set in the meantime are kept"""
         try:
+            t_lock = time.perf_counter()
             with FileLock(LOCK_PATH3):  # Lock the file during writing
+                metrics.inc("lock_wait_seconds_total", time.perf_counter() - t_lock, file="traffic")
+                try:
+                    with open(FILE_PATH3, "r") as file3:
+                        current = json.load(file3)
+                except (FileNotFoundError, json.JSONDecodeError):
+                    current = {}
+                current.update(data3)
                 with open(TEMP_PATH3, "w") as temp_file:
-                    json.dump(data3, temp_file, indent=4)
+                    json.dump(current, temp_file, indent=4)
                 shutil.move(TEMP_PATH3, FILE_PATH3)  # Move the temporary file to the original file
+            metrics.inc("json_writes_total", file="traffic")
         except Exception as e:
             print(f"[ERROR] save_dict3: {e}")
             if os.path.exists(TEMP_PATH3):
@@ -363,19 +519,11 @@ while True:
     # def save_dict3(data3):
     #     with open(FILE_PATH3,"w") as file3:
     #         json.dump(data3,file3,indent=4)
-    traffic_vol_dict=load_dict3()
 
 
     ############### create lists to store track_id, and coordinates to check detected helmet or license_plate of which vehicle #############
-    cirx_special=[] # for helemt & license_plate
-    ciry_special=[] # for helemt & license_plate
-    classname_special=[] # for helemt & license
-    track_id_special=[] # for helmet & license
-    track_id_vehicle_special=[]
-    vehicle_xmin=[]
-    vehicle_ymin=[]
-    vehicle_xmax=[]
-    vehicle_ymax=[]
+    association.reset()
+    draw_queue.clear()
     ##################################################
 
     # Go through each detection and get bbox coords, confidence, and class
@@ -403,20 +551,14 @@ while True:
 
 
             ############## extract detected image and read it ##################
-            crop_img=frame[ymin:ymax, xmin:xmax].copy()
+            crop_img=frame[ymin:ymax, xmin:xmax] # view, nothing is drawn on the frame until the crops are saved
             # license_plate_gray=cv2.cvtColor(crop_img, cv2.COLOR_BGR2GRAY)
             # _, license_plate_thresh=cv2.threshold(license_plate_gray, 64, 255, cv2.THRESH_BINARY_INV)
             # output=reader.readtext(license_plate_thresh,detail=0)
             ######################################################
 
-            color = bbox_colors[classidx % 10]
-            cv2.rectangle(frame, (xmin,ymin), (xmax,ymax), color, 1)
-
-            label = f'ID: {track_id}, {classname}: {int(conf*100)}%'
-            labelSize, baseLine = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1) # Get font size
-            label_ymin = max(ymin, labelSize[1] + 10) # Make sure not to draw label too close to top of window
-            cv2.rectangle(frame, (xmin, label_ymin-labelSize[1]-10), (xmin+labelSize[0], label_ymin+baseLine-10), color, cv2.FILLED) # Draw white box to put label text in
-            cv2.putText(frame,label, (xmin, label_ymin-7), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1) # Draw label text
+            if render:
+                draw_queue.append(((xmin,ymin,xmax,ymax), bbox_colors[classidx % 10], f'ID: {track_id}, {classname}: {int(conf*100)}%', track_id))
             ###########################################
             cirx=(xmax+xmin)//2
             ciry=(ymax+ymin)//2
@@ -424,60 +566,26 @@ while True:
 
             ########################### speed ##################################
             if(cirx>=line1_x1 and cirx<=line1_x2 and ciry>465 and ciry<line1_y1):
-                if(track_id not in time1):
-                    time1[track_id]=time.time()
-            if(track_id in time1 and ciry>=line1_y1):
-                timeDiff=time.time()-time1[track_id]
-                speed=10/timeDiff # m/h
-                speed*=3.6 # km/h
-                if(track_id not in track_speed):
+                approaching.add(track_id)
+            if(track_id in approaching and ciry>=line1_y1 and track_id not in track_speed):
+                speed=frame_speeds.get(track_id,np.nan) # km/h, fitted over the track's trajectory
+                if(not np.isnan(speed)):
+                    approaching.discard(track_id)
                     track_speed[track_id]=speed
-                    speed_dict=load_dict2()
-                    speed_dict.update({(f"{track_id}"): int(speed)})
-                    save_dict2(speed_dict)
-            
-            if(track_id in track_speed):
-                if(track_speed[track_id]<=40):
-                    color=(0,255,0)
-                elif(track_speed[track_id]<=80):
-                    color=(0,255,255)
-                else:
-                    color=(0,0,255)
-                cv2.rectangle(frame, (xmin, label_ymin-labelSize[1]-30), (xmin+labelSize[0], label_ymin+baseLine-30), color, cv2.FILLED)
-                cv2.putText(frame,str(int(track_speed[track_id]))+' km/h',(xmin,label_ymin-28),cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+                    record_events("speed", {track_id: int(speed)}, load_dict2, save_dict2)
             #######################################################################
 
             
 
             ############### store class for check which license plate & helmet belong to which vehicle #########
             if(classname=="helmet" or classname=="license_plate"):
-                classname_special.append(classname)
                 # track centre and track id only of this frame to check which helmet or license plate belongs to trafic id ######################
-                cirx_special.append(float(cirx))
-                ciry_special.append(float(ciry))
-                track_id_special.append(track_id)
+                association.add_special(HELMET if classname=="helmet" else LICENSE_PLATE, cirx, ciry, track_id)
             ############## store vehicle data for check which helmet or license plate belongs to trafic id ###############################
             else:
-                track_id_vehicle_special.append(track_id)
-                vehicle_xmin.append(float(xmin))
-                vehicle_ymin.append(float(ymin))
-                vehicle_xmax.append(float(xmax))
-                vehicle_ymax.append(float(ymax))
+                association.add_vehicle(track_id, xmin, ymin, xmax, ymax)
             #############################################################################
 
-            # Check the obj is crossed the line
-            # Note for all line y is same
-            # for line1
-            # if(classname=="car" or classname=="bike" or classname=="bus" or classname=="truck"):
-            if ciry>line1_y1 and cirx>=line1_x1 and cirx<=line1_x2 and track_id not in crossed_ids:
-                crossed_ids.add(track_id)
-                class_counts_1[classname]+=1
-            #for line2
-            # if ciry<line2_y2 and cirx>=line2_x1 and cirx<=line2_x2 and track_id not in crossed_ids:
-            #     crossed_ids.add(track_id)
-            #     class_counts_2[classname]+=1
-            ############################################
-
             ########### Gemini API to extract text from crop_img ####################
             
             # def upload_file(path):
@@ -521,11 +629,11 @@ while True:
                 # ])
                 ############ update helmet_data.json #############
                 if(classname=="bike"):
-                    helmet_dict=load_dict()
-                    helmet_dict.update({(f"{track_id}"): False})
-                    save_dict(helmet_dict)
+                    record_events("helmet", {track_id: False}, load_dict, save_dict)
                 ###############################################
                 print(f"Saved: {vehicle_file}, conf: {conf:.2f}")
+                metrics.inc("crops_saved_total")
+                if args.sqlite: sqlite_utils.save_image_metadata(vehicle_file, track_id, CAMERA_ID, classname, conf, crop_img.shape)
                 # print(f"updated: helmet_data.json, track_id: {track_id}, License no. [{response.text}]")
 
             elif track_id in track_conf and conf > track_conf[track_id]:
@@ -548,11 +656,11 @@ while True:
                 # ])
                 ############ update helmet_data.json #############
                 if(classname=="bike"):
-                    helmet_dict=load_dict()
-                    helmet_dict.update({(f"{track_id}"): False})
-                    save_dict(helmet_dict)
+                    record_events("helmet", {track_id: False}, load_dict, save_dict)
                 ###############################################
                 print(f"Saved: {vehicle_file}, conf: {conf:.2f}")
+                metrics.inc("crops_saved_total")
+                if args.sqlite: sqlite_utils.save_image_metadata(vehicle_file, track_id, CAMERA_ID, classname, conf, crop_img.shape)
                 # print(f"updated: helmet_data.json, track_id: {track_id}, License no. [{response.text}]")
 
             ############################################################################
@@ -562,85 +670,75 @@ while True:
                 object_count = object_count + 1
 
             ################ UPDATE TRAFFIC_VOL_DICT ###################
-            traffic_vol_dict.update({"T2":object_count})
-            save_dict3(traffic_vol_dict)
+            save_dict3({"T2":object_count, "V2":lane_volumes, "Q2":lane_queue}) # only this lane's keys
             ##############################################################
 
     ############ check helemt and license plate belongs to which vehicle  ########################################
-    helmet_dict=load_dict()
-    # print(classname_special)
-    # print(cirx_special)
-    # print(ciry_special)
-    # print(track_id_vehicle_special)
-    # print(vehicle_xmin)
-    # print(vehicle_xmax)
-    for i in range(len(track_id_vehicle_special)):
-        for j in range(len(classname_special)):
-            # if((cirx_special[j]<=vehicle_xmax[i]) and (cirx_special[j]>=vehicle_xmin[i]) and (ciry_special[j]<=vehicle_ymax[i]) and (ciry_special[j]>=vehicle_ymin[i])):
-            if((cirx_special[j]<=vehicle_xmax[i]) and (cirx_special[j]>=vehicle_xmin[i])):
-                if(classname_special[j]=="helmet"):
-                    # update helmet_data.json
-                    helmet_dict=load_dict()
-                    helmet_dict.update({(f"{track_id_vehicle_special[i]}"): True})
-                    save_dict(helmet_dict)
-                if(classname_special[j]=="license_plate" and (ciry_special[j]<=vehicle_ymax[i]) and (ciry_special[j]>=vehicle_ymin[i])):
-                    license_file=f"{output_dir3}/{classname_special[j]}_{track_id_vehicle_special[i]}.jpg"
-                    image_path=f"{output_dir}/license_plate_{track_id_special[j]}.jpg"
-                    license_img=cv2.imread(image_path)
-                    cv2.imwrite(license_file,license_img)
+    helmet_ids, plate_pairs = association.match() # all vehicles against all helmets / plates in one pass
+    if helmet_ids:
+        # update helmet_data.json
+        record_events("helmet", {vehicle_id: True for vehicle_id in helmet_ids}, load_dict, save_dict)
+    for vehicle_id, plate_id in plate_pairs:
+        license_file=f"{output_dir3}/{sqlite_utils.plate_file_stem(vehicle_id, CAMERA_ID)}.jpg" # camera and run for the OCR
+        image_path=f"{output_dir}/license_plate_{plate_id}.jpg"
+        if os.path.exists(image_path):
+            shutil.copyfile(image_path, license_file) # same JPEG, no decode / re-encode
 
     ##############################################################################
 
-
-    
-    # Calculate and draw framerate (if using video, USB, or Picamera source)
-    if source_type == 'video' or source_type == 'usb' or source_type == 'picamera':
-        cv2.putText(frame, f'FPS: {avg_frame_rate:0.2f}', (10,20), cv2.FONT_HERSHEY_SIMPLEX, .7, (0,0,0), 2) # Draw framerate
-        cv2.putText(frame, f'R2', (30,20), cv2.FONT_HERSHEY_SIMPLEX, .7, (0,0,0), 3)
-    
-    # Display detection results
+    ############ draw boxes and speed tags now that the crops are saved ############
+    for box, color, label, track_id in draw_queue:
+        label_ymin, labelSize, baseLine = overlay.draw_box(frame, box, color, label)
+        if(track_id in track_speed):
+            if(track_speed[track_id]<=40):
+                color=(0,255,0)
+            elif(track_speed[track_id]<=80):
+                color=(0,255,255)
+            else:
+                color=(0,0,255)
+            cv2.rectangle(frame, (box[0], label_ymin-labelSize[1]-30), (box[0]+labelSize[0], label_ymin+baseLine-30), color, cv2.FILLED)
+            cv2.putText(frame,str(int(track_speed[track_id]))+' km/h',(box[0],label_ymin-28),cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+    ##############################################################################
+    t_postprocess = time.perf_counter()
+    metrics.observe("postprocess", t_postprocess - t_inference)
+    metrics.set("boxes", len(detections))
+    metrics.set("active_tracks", len(active_ids))
 
 
-    ##################### coordinates ####################################
-    cv2.namedWindow("YOLO detection results")
-    cv2.setMouseCallback("YOLO detection results", get_coordinates)
-    ##################### draw line ###############################
-    cv2.line(frame, (line1_x1, line1_y1) , (line1_x2, line1_y2), (0,0,255), 3) # (Hariom) draw horizontal line
-    # cv2.line(frame, (line2_x1, line2_y1) , (line2_x2, line2_y2), (0,0,255), 3) # (Hariom) draw horizontal line
-    ######################### class counts #############################
-    #for line 1
-    without_helmet=class_counts_1["bike"]-class_counts_1["helmet"]
-    # cv2.putText(frame, f'Up Side',  (10,60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,225,225), 2)
-    cv2.putText(frame, f'with Helmet: {class_counts_1["helmet"]}', (10,80), cv2.FONT_HERSHEY_SIMPLEX, .7, (255,0,0), 2)
-    cv2.putText(frame, f'without Helmet: {without_helmet}', (10,100), cv2.FONT_HERSHEY_SIMPLEX, .7, (255,0,0), 2)
-    cv2.putText(frame, f'Car: {class_counts_1["car"]}', (10,120), cv2.FONT_HERSHEY_SIMPLEX, .7, (255,0,0), 2)
-    cv2.putText(frame, f'Bike: {class_counts_1["bike"]}', (10,140), cv2.FONT_HERSHEY_SIMPLEX, .7, (255,0,0), 2)
-    cv2.putText(frame, f'Bus: {class_counts_1["bus"]}', (10,160), cv2.FONT_HERSHEY_SIMPLEX, .7, (255,0,0), 2)
-    cv2.putText(frame, f'Truck: {class_counts_1["truck"]}', (10,180), cv2.FONT_HERSHEY_SIMPLEX, .7, (255,0,0), 2)
-    # #for line 2 (not completed)
-    # cv2.putText(frame, f'Down Side',  (10,160), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,225,225), 2)
-    # cv2.putText(frame, f'with Helmet: {class_counts_2["helmet"]}', (10,180), cv2.FONT_HERSHEY_SIMPLEX, .7, (255,0,0), 2)
-    # cv2.putText(frame, f'without Helmet: {class_counts_2["helmet"]}', (10,180), cv2.FONT_HERSHEY_SIMPLEX, .7, (255,0,0), 2)
-    # cv2.putText(frame, f'license_plate: {class_counts_2["license_plate"]}', (10,200), cv2.FONT_HERSHEY_SIMPLEX, .7, (255,0,0), 2)
-    # cv2.putText(frame, f'Car: {class_counts_2["car"]}', (10,220), cv2.FONT_HERSHEY_SIMPLEX, .7, (255,0,0), 2)
-    # cv2.putText(frame, f'Bus: {class_counts_2["bus"]}', (10,240), cv2.FONT_HERSHEY_SIMPLEX, .7, (255,0,0), 2)
-    # cv2.putText(frame, f'Truck: {class_counts_2["truck"]}', (10,260), cv2.FONT_HERSHEY_SIMPLEX, .7, (255,0,0), 2)
-    ########################################################################
-
-    cv2.putText(frame, f'Objects: {object_count}', (10,40), cv2.FONT_HERSHEY_SIMPLEX, .7, (0,0,0), 2) # Draw total number of detected objects
-    cv2.imshow('YOLO detection results',frame) # Display image
-    if record: recorder.write(frame)
+    
+    # Display detection results (static zones and captions come from the cached overlay layer)
+    if render:
+        # Calculate and draw framerate (if using video, USB, or Picamera source)
+        if source_type == 'video' or source_type == 'usb' or source_type == 'picamera' or source_type == 'watch':
+            overlay.set_text("fps", f'FPS: {avg_frame_rate:0.2f}', (10,20), .7, (0,0,0), 2)
+        ######################### class counts #############################
+        without_helmet=class_counts_1["bike"]-class_counts_1["helmet"]
+        overlay.set_value("with_helmet", class_counts_1["helmet"])
+        overlay.set_value("without_helmet", without_helmet)
+        overlay.set_value("car", class_counts_1["car"])
+        overlay.set_value("bike", class_counts_1["bike"])
+        overlay.set_value("bus", class_counts_1["bus"])
+        overlay.set_value("truck", class_counts_1["truck"])
+        overlay.set_text("objects", f'Objects: {object_count}', (10,40), .7, (0,0,0), 2) # total number of detected objects
+        overlay.compose(frame)
+        ##################### picked coordinates ####################################
+        for point in points:
+            cv2.circle(frame, point, 5, (0, 0, 255), -1) # red dot at each clicked point
+        if len(points) >= 2:
+            cv2.line(frame, points[0], points[1], (0, 255, 0), 2)
+        show(frame) # Display image
+        if record: recorder.write(frame, frame_time)
 
     # If inferencing on individual images, wait for user keypress before moving to next image. Otherwise, wait 5ms before moving to next frame.
     if source_type == 'image' or source_type == 'folder':
-        key = cv2.waitKey()
-    elif source_type == 'video' or source_type == 'usb' or source_type == 'picamera':
-        key = cv2.waitKey(5)
+        key = wait_key()
+    elif source_type == 'video' or source_type == 'usb' or source_type == 'picamera' or source_type == 'watch':
+        key = wait_key(5 if render else 1)
     
     if key == ord('q') or key == ord('Q'): # Press 'q' to quit
         break
     elif key == ord('s') or key == ord('S'): # Press 's' to pause inference
-        cv2.waitKey()
+        wait_key()
     elif key == ord('p') or key == ord('P'): # Press 'p' to save a picture of results on this frame
         cv2.imwrite('capture.png',frame)
     
@@ -657,6 +755,9 @@ while True:
 
     # Calculate average FPS for past frames
     avg_frame_rate = np.mean(frame_rate_buffer)
+    metrics.observe("display", t_stop - t_postprocess)
+    metrics.inc("frames_total")
+    metrics.set("fps", avg_frame_rate)
 
 
 # Clean up
@@ -665,7 +766,12 @@ if source_type == 'video' or source_type == 'usb':
     cap.release()
 elif source_type == 'picamera':
     cap.stop()
+elif source_type == 'watch':
+    watcher.stop()
 if record: recorder.release()
+if event_log is not None: event_log.close()
+if args.sqlite: sqlite_utils.close()
+if display is not None: display.stop()
 cv2.destroyAllWindows()
 
 
@@ -0,0 +1,110 @@
+"""
+Asynchronous video recorder
+
+MJPG encoding runs in a separate process. Frames are copied into a small ring
+of shared-memory slots and only the slot index and the frame's source
+timestamp go through a queue, so the inference loop never waits on the
+encoder. The slots are used in ring order and the encoder hands them back in
+the same order, so a semaphore counting the free slots is all the writer needs
+to know the next one is free. When every slot is busy the frame is dropped
+instead of stalling inference.
+
+The encoder writes a constant-rate file: each frame is placed at the output
+frame index given by its timestamp, repeating the previous frame across gaps
+and skipping frames that land on an index already written, so playback speed
+matches reality whatever rate the pipeline ran at.
+"""
+
+import time
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+def _encode_loop(shm_name, slots, shape, path, fourcc, fps, max_gap, free_slots, filled, stats):
+    # free_slots: semaphore released once per slot the encoder is done with
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffers = np.ndarray((slots,) + shape, dtype=np.uint8, buffer=shm.buf)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (shape[1], shape[0]))
+    last = np.zeros(shape, dtype=np.uint8)
+    t0 = None
+    next_index = 0
+    written = duplicated = skipped = 0
+    while True:
+        item = filled.get()
+        if item is None:
+            break
+        slot, timestamp = item
+        if t0 is None:
+            t0 = timestamp
+        index = int(round((timestamp - t0) * fps))
+        if index < next_index:
+            # Another frame already covers this output index (pipeline faster than fps)
+            skipped += 1
+            free_slots.release()
+            continue
+        # Hold the previous frame across the gap (pipeline slower than fps, or a pause)
+        gap = min(index - next_index, int(max_gap * fps))
+        for _ in range(gap):
+            writer.write(last)
+            duplicated += 1
+        np.copyto(last, buffers[slot])
+        free_slots.release()
+        writer.write(last)
+        written += 1
+        next_index = index + 1
+    writer.release()
+    del buffers
+    shm.close()
+    stats.put({"encoded": written, "duplicated": duplicated, "skipped": skipped})
+
+class AsyncRecorder:
+    def __init__(self, path, size, fps=30, fourcc='MJPG', slots=8, max_gap=5.0):
+        width, height = size
+        self.shape = (height, width, 3)
+        self.slots = slots
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * height * width * 3)
+        self.buffers = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.free_slots = mp.Semaphore(slots) # unlike a queue, acquire() sees a released slot at once
+        self.next_slot = 0
+        self.filled = mp.Queue()
+        self.stats = mp.Queue()
+        self.submitted = 0
+        self.dropped = 0
+        self.process = mp.Process(target=_encode_loop, daemon=True, args=(
+            self.shm.name, slots, self.shape, path, fourcc, fps, max_gap, self.free_slots, self.filled, self.stats))
+        self.process.start()
+
+    def write(self, frame, timestamp=None):
+        """Queue a frame for encoding; returns False if it was dropped because the encoder is behind"""
+        if not self.free_slots.acquire(block=False):
+            self.dropped += 1
+            return False
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.slots
+        if frame.shape == self.shape:
+            np.copyto(self.buffers[slot], frame)
+        else:
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=self.buffers[slot])
+        self.filled.put((slot, time.monotonic() if timestamp is None else timestamp))
+        self.submitted += 1
+        return True
+
+    def release(self):
+        """Finish encoding and print how many frames were encoded, duplicated, skipped and dropped"""
+        self.filled.put(None)
+        try:
+            stats = self.stats.get(timeout=30)
+        except queue.Empty:
+            stats = {"encoded": 0, "duplicated": 0, "skipped": 0}
+            print("[ERROR] Recorder process did not finish")
+        self.process.join(timeout=5)
+        del self.buffers
+        self.shm.close()
+        self.shm.unlink()
+        stats["dropped"] = self.dropped
+        print(f"Recorder: {self.submitted} frames submitted, {stats['encoded']} encoded, "
+              f"{stats['duplicated']} duplicated, {stats['skipped']} skipped (output index already written), "
+              f"{stats['dropped']} dropped (encoder busy)")
+        return stats
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+"""
+Headless batch detection for image folders
+
+Decodes images on a worker pool, runs the YOLO model on batches of frames and
+appends one JSON line per image (class counts, saved crops, helmet and license
+plate associations) to a results file. No window is opened, so archived
+snapshots can be backfilled on a server or over SSH.
+
+Usage:
+    python batch_detect.py --model best.pt --source snapshots/ --results results.jsonl
+    python batch_detect.py --model best.pt --source snapshots/ --cache .detection_cache
+"""
+
+import os
+import sys
+import argparse
+import time
+import json
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import cv2
+import numpy as np
+from detection_cache import DetectionCache, content_key
+
+IMG_EXT_LIST = ['.jpg','.JPG','.jpeg','.JPEG','.png','.PNG','.bmp','.BMP']
+VEHICLE_CLASSES = ("car", "bike", "bus", "truck")
+COUNT_CLASSES = ("license_plate", "helmet", "car", "bike", "bus", "truck")
+CACHE_MIN_CONF = 0.1 # with --cache, inference always runs at this floor and --thresh may not go below it
+
+def list_images(folder):
+    """List image files in a folder (sorted by name)"""
+    images = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_file() and os.path.splitext(entry.name)[1] in IMG_EXT_LIST:
+                images.append(entry.path)
+    images.sort()
+    return images
+
+def load_image(path, cache=None, need_frame=True):
+    """Read an image file, returning (content key, decoded frame)
+
+    With a detection cache, images that are already cached are only hashed and
+    not decoded unless the frame is needed (e.g. to save crops).
+    """
+    if cache is None:
+        return None, cv2.imread(path)
+    data = np.fromfile(path, dtype=np.uint8)
+    key = content_key(data)
+    if key in cache and not need_frame:
+        return key, None
+    return key, cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+def decode_batches(paths, batch_size, pool, cache=None, need_frame=True, prefetch=2):
+    """Yield (paths, keys, frames) batches, decoding ahead of the consumer on the pool"""
+    pending = deque()
+    next_idx = 0
+    max_pending = batch_size * (prefetch + 1)
+    while next_idx < len(paths) or pending:
+        # cv2.imread/imdecode and hashlib release the GIL, so threads work in parallel
+        while next_idx < len(paths) and len(pending) < max_pending:
+            path = paths[next_idx]
+            pending.append((path, pool.submit(load_image, path, cache, need_frame)))
+            next_idx += 1
+        batch_paths = []
+        batch_keys = []
+        batch_frames = []
+        while pending and len(batch_paths) < batch_size:
+            path, future = pending.popleft()
+            try:
+                key, frame = future.result()
+            except OSError as e:
+                print(f"[WARN] Unable to read {path}: {e}")
+                continue
+            if frame is None and (cache is None or key not in cache):
+                print(f"[WARN] Unable to decode {path}, skipping")
+                continue
+            batch_paths.append(path)
+            batch_keys.append(key)
+            batch_frames.append(frame)
+        if batch_paths:
+            yield batch_paths, batch_keys, batch_frames
+
+def run_inference(model, frames, min_thresh):
+    """Run the detector on a batch of frames and return raw (N, 6) detections per frame
+
+    Each row is xmin, ymin, xmax, ymax, conf, class index.
+    """
+    results = model.predict(frames, conf=min_thresh, verbose=False)
+    raw = []
+    for result in results:
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            raw.append(np.zeros((0, 6), dtype=np.float32))
+            continue
+        raw.append(np.hstack((
+            boxes.xyxy.cpu().numpy(),
+            boxes.conf.cpu().numpy().reshape(-1, 1),
+            boxes.cls.cpu().numpy().reshape(-1, 1),
+        )).astype(np.float32))
+    return raw
+
+def associate(classnames, boxes):
+    """Match helmets and license plates to vehicles in one frame
+
+    Uses the same rules as the R scripts: a helmet belongs to a vehicle when its
+    centre x lies inside the vehicle's x range, a license plate when its centre
+    lies inside the vehicle box. Returns {vehicle index: {"helmet", "license_plate"}}.
+    """
+    centres = np.column_stack(((boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2)) \
+        if len(boxes) else np.zeros((0, 2))
+    vehicles = [i for i, name in enumerate(classnames) if name in VEHICLE_CLASSES]
+    specials = [i for i, name in enumerate(classnames) if name in ("helmet", "license_plate")]
+    matches = {}
+    for v in vehicles:
+        xmin, ymin, xmax, ymax = boxes[v, :4]
+        match = {"helmet": False if classnames[v] == "bike" else None, "license_plate": None}
+        for s in specials:
+            cirx, ciry = centres[s]
+            if cirx < xmin or cirx > xmax:
+                continue
+            if classnames[s] == "helmet":
+                match["helmet"] = True
+            elif ymin <= ciry <= ymax and match["license_plate"] is None:
+                match["license_plate"] = s
+        matches[v] = match
+    return matches
+
+def build_record(path, frame, raw, labels, min_thresh, crop_dir, pool):
+    """Turn raw detections for one image into its results record, and queue its crop writes
+
+    Returns (record, writes) with writes a list of (detection, future); see finish_record().
+    """
+    keep = raw[raw[:, 4] > min_thresh]
+    boxes = keep[:, :4].astype(int)
+    classnames = [labels[int(c)] for c in keep[:, 5]]
+    counts = {name: 0 for name in COUNT_CLASSES}
+    stem = os.path.splitext(os.path.basename(path))[0]
+    detections = []
+    writes = []
+    for i, classname in enumerate(classnames):
+        counts[classname] = counts.get(classname, 0) + 1
+        xmin, ymin, xmax, ymax = boxes[i]
+        detection = {
+            "class": classname,
+            "conf": round(float(keep[i, 4]), 2),
+            "box": [int(xmin), int(ymin), int(xmax), int(ymax)],
+        }
+        if crop_dir and frame is not None:
+            height, width = frame.shape[:2]
+            x0, x1 = max(0, min(xmin, width)), max(0, min(xmax, width)) # boxes can reach past the frame
+            y0, y1 = max(0, min(ymin, height)), max(0, min(ymax, height))
+            if x1 > x0 and y1 > y0:
+                crop_file = os.path.join(crop_dir, f"{stem}_{classname}_{i}.jpg")
+                detection["crop"] = crop_file
+                writes.append((detection, pool.submit(cv2.imwrite, crop_file, frame[y0:y1, x0:x1])))
+        detections.append(detection)
+    vehicles = []
+    for v, match in associate(classnames, boxes).items():
+        vehicles.append({
+            "detection": v,
+            "class": classnames[v],
+            "helmet": match["helmet"],
+            "license_plate": match["license_plate"],
+        })
+    record = {
+        "image": path,
+        "object_count": sum(counts[name] for name in VEHICLE_CLASSES),
+        "counts": counts,
+        "detections": detections,
+        "vehicles": vehicles,
+    }
+    return record, writes
+
+def finish_record(record, writes):
+    """Wait for a record's crop writes; a crop that failed is reported and left out of the record"""
+    failed = 0
+    for detection, future in writes:
+        try:
+            ok = future.result()
+        except Exception as e: # e.g. cv2.error
+            ok = False
+            print(f"[ERROR] Writing {detection['crop']}: {e}")
+        if not ok:
+            del detection["crop"]
+            failed += 1
+    if failed:
+        print(f"[WARN] {failed} crop(s) of {record['image']} were not written")
+    return record
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', help='Path to YOLO model file (example: "runs/detect/train/weights/best.pt")',
+                        required=True)
+    parser.add_argument('--source', help='Image folder to process (example: "snapshots")', required=True)
+    parser.add_argument('--results', help='JSON Lines file to append per-image results to', default='batch_results.jsonl')
+    parser.add_argument('--crops', help='Folder to save detection crops into (crops are not saved if omitted)',
+                        default=None)
+    parser.add_argument('--thresh', help='Minimum confidence threshold for detections (example: "0.4")',
+                        type=float, default=0.5)
+    parser.add_argument('--batch', help='Number of images per inference batch', type=int, default=16)
+    parser.add_argument('--cache', help=f'Folder for the detection cache; cached images skip inference on later runs '
+                                        f'(needs --thresh of at least {CACHE_MIN_CONF})',
+                        default=None)
+    parser.add_argument('--cache-size', help='Detection cache size cap in MB', type=float, default=512)
+    parser.add_argument('--clear-cache', help='Invalidate the detection cache before running', action='store_true')
+    parser.add_argument('--workers', help='Number of decode/encode worker threads', type=int,
+                        default=os.cpu_count() or 4)
+    args = parser.parse_args()
+    if args.cache and args.thresh < CACHE_MIN_CONF:
+        parser.error(f"--thresh below {CACHE_MIN_CONF} needs a run without --cache (cached detections stop at that confidence)")
+
+    if not os.path.exists(args.model):
+        print('ERROR: Model path is invalid or model was not found. Make sure the model filename was entered correctly.')
+        sys.exit(0)
+    if not os.path.isdir(args.source):
+        print(f'Input {args.source} is not a folder. Please try again.')
+        sys.exit(0)
+    if args.crops and not os.path.exists(args.crops):
+        os.makedirs(args.crops)
+
+    from ultralytics import YOLO
+    model = YOLO(args.model, task='detect')
+    labels = model.names
+
+    cache = None
+    if args.cache:
+        # Raw detections are always inferred and cached at the same confidence floor, so every entry holds
+        # everything any allowed --thresh can ask for
+        cache = DetectionCache(args.cache, args.model, max_mb=args.cache_size, variant=f"conf{CACHE_MIN_CONF}")
+        if args.clear_cache:
+            cache.invalidate()
+        print(f"Detection cache: {cache.stats()}")
+    infer_thresh = CACHE_MIN_CONF if cache else args.thresh
+
+    imgs_list = list_images(args.source)
+    print(f"Found {len(imgs_list)} images in {args.source}")
+
+    processed = 0
+    unwritten = deque() # (record, crop writes) in image order, written once their crops are on disk
+    t_start = time.perf_counter()
+    t_report = t_start
+    with ThreadPoolExecutor(max_workers=args.workers) as pool, open(args.results, "a") as results_file:
+        for batch_paths, batch_keys, batch_frames in decode_batches(imgs_list, args.batch, pool,
+                                                                    cache, need_frame=bool(args.crops)):
+            raw = [cache.get(key) if cache else None for key in batch_keys]
+            misses = [i for i, dets in enumerate(raw) if dets is None]
+            if misses:
+                for i in misses:
+                    if batch_frames[i] is None: # evicted between the decode check and the lookup
+                        batch_frames[i] = cv2.imread(batch_paths[i])
+                inferred = run_inference(model, [batch_frames[i] for i in misses], infer_thresh)
+                for i, dets in zip(misses, inferred):
+                    raw[i] = dets
+                    if cache:
+                        cache.put(batch_keys[i], dets)
+            if cache:
+                cache.flush()
+            for path, frame, dets in zip(batch_paths, batch_frames, raw):
+                unwritten.append(build_record(path, frame, dets, labels, args.thresh, args.crops, pool))
+            while unwritten and all(future.done() for _, future in unwritten[0][1]):
+                results_file.write(json.dumps(finish_record(*unwritten.popleft())) + "\n")
+            processed += len(batch_paths)
+
+            now = time.perf_counter()
+            if now - t_report >= 5:
+                results_file.flush()
+                print(f"Processed {processed}/{len(imgs_list)} images, {processed / (now - t_start):.1f} img/s")
+                t_report = now
+        while unwritten:
+            results_file.write(json.dumps(finish_record(*unwritten.popleft())) + "\n")
+
+    if cache:
+        print(f"Detection cache: {cache.stats()}")
+        cache.close()
+    elapsed = time.perf_counter() - t_start
+    print(f"Processed {processed} images in {elapsed:.1f} s ({processed / max(elapsed, 1e-9):.1f} img/s)")
+    print(f"Results written to {args.results}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Reusable frame buffers and per-frame scratch arrays
+
+The detection loop used to allocate a new frame on every cap.read() and
+cv2.resize(), a copy of every crop whether it was saved or not, and nine Python
+lists to match helmets and licence plates to vehicles. FramePool keeps the
+capture and resize destinations alive between frames, crops are plain views
+into the frame (cv2.imwrite reads them directly, so only saved crops cost
+anything), and AssociationScratch keeps the matching data in preallocated
+arrays that grow only when a frame has more detections than any before it.
+
+Arrays handed out by the pool are overwritten by the next frame: anything that
+must outlive the frame (display, recorder) copies it, as they already do.
+
+Allocation benchmark (old vs pooled per-frame path on synthetic frames):
+
+    python buffer_pool.py --frames 300 --boxes 20
+"""
+
+import gc
+import time
+import tracemalloc
+import cv2
+import numpy as np
+
+HELMET = 0
+LICENSE_PLATE = 1
+
+class FramePool:
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        """Named buffer of the given shape, reallocated only when the shape changes"""
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer
+
+    def read(self, cap, name="capture"):
+        """cap.read() into the pooled capture buffer"""
+        buffer = self._buffers.get(name)
+        ret, frame = cap.read(buffer) if buffer is not None else cap.read()
+        if ret and frame is not None:
+            self._buffers[name] = frame # OpenCV reallocates if the stream size changed
+        return ret, frame
+
+    def resize(self, frame, size, name="resized", interpolation=cv2.INTER_LINEAR):
+        """cv2.resize into the pooled buffer for this (width, height)"""
+        dst = self.get(name, (size[1], size[0]) + frame.shape[2:], frame.dtype)
+        cv2.resize(frame, size, dst=dst, interpolation=interpolation)
+        return dst
+
+class AssociationScratch:
+    """Helmet / licence plate centres and vehicle boxes of one frame, in reused arrays"""
+
+    def __init__(self, capacity=64):
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        old_special = getattr(self, "special", None)
+        old_vehicle = getattr(self, "vehicle", None)
+        self.capacity = capacity
+        self.special = np.empty((capacity, 4), dtype=np.float64) # kind, cx, cy, track_id
+        self.vehicle = np.empty((capacity, 5), dtype=np.float64) # track_id, xmin, ymin, xmax, ymax
+        self._within = np.empty((capacity, capacity), dtype=bool)
+        self._test = np.empty((capacity, capacity), dtype=bool)
+        if old_special is not None:
+            self.special[:self.n_special] = old_special[:self.n_special]
+            self.vehicle[:self.n_vehicle] = old_vehicle[:self.n_vehicle]
+        else:
+            self.reset()
+
+    def reset(self):
+        self.n_special = 0
+        self.n_vehicle = 0
+
+    def add_special(self, kind, cx, cy, track_id):
+        if self.n_special == self.capacity:
+            self._allocate(self.capacity * 2)
+        self.special[self.n_special] = (kind, cx, cy, track_id)
+        self.n_special += 1
+
+    def add_vehicle(self, track_id, xmin, ymin, xmax, ymax):
+        if self.n_vehicle == self.capacity:
+            self._allocate(self.capacity * 2)
+        self.vehicle[self.n_vehicle] = (track_id, xmin, ymin, xmax, ymax)
+        self.n_vehicle += 1
+
+    def match(self):
+        """Returns (vehicle ids wearing a helmet, [(vehicle id, licence plate id), ...])
+
+        A helmet belongs to a vehicle when its centre is within the vehicle's x
+        range, a licence plate when its centre is inside the vehicle's box.
+        """
+        nv, ns = self.n_vehicle, self.n_special
+        if not nv or not ns:
+            return [], []
+        special = self.special[:ns]
+        vehicle = self.vehicle[:nv]
+        within = self._within[:nv, :ns]
+        test = self._test[:nv, :ns]
+        np.greater_equal(special[None, :, 1], vehicle[:, None, 1], out=within)
+        np.less_equal(special[None, :, 1], vehicle[:, None, 3], out=test)
+        within &= test
+        kind = special[:, 0]
+
+        np.logical_and(within, kind == HELMET, out=test)
+        helmet_ids = vehicle[test.any(axis=1), 0].astype(int).tolist()
+
+        np.greater_equal(special[None, :, 2], vehicle[:, None, 2], out=test)
+        within &= test
+        np.less_equal(special[None, :, 2], vehicle[:, None, 4], out=test)
+        within &= test
+        within &= kind == LICENSE_PLATE
+        vi, si = np.nonzero(within)
+        plate_pairs = list(zip(vehicle[vi, 0].astype(int).tolist(), special[si, 3].astype(int).tolist()))
+        return helmet_ids, plate_pairs
+
+def _synthetic_boxes(rng, n, size):
+    w, h = size
+    x0 = rng.integers(0, w - 200, n)
+    y0 = rng.integers(0, h - 200, n)
+    boxes = np.column_stack((x0, y0, x0 + rng.integers(20, 200, n), y0 + rng.integers(20, 200, n)))
+    kinds = rng.integers(0, 4, n) # 0 helmet, 1 licence plate, else vehicle
+    return boxes, kinds
+
+def _old_frame(src, size, boxes, kinds, saved):
+    frame = cv2.resize(src, size)
+    cirx_special, ciry_special, classname_special, track_id_special = [], [], [], []
+    track_id_vehicle_special, vehicle_xmin, vehicle_ymin, vehicle_xmax, vehicle_ymax = [], [], [], [], []
+    kept = []
+    for i, ((xmin, ymin, xmax, ymax), kind) in enumerate(zip(boxes.tolist(), kinds.tolist())):
+        crop_img = frame[ymin:ymax, xmin:xmax].copy()
+        if i < saved:
+            kept.append(crop_img.sum()) # stands in for cv2.imwrite
+        if kind < 2:
+            classname_special.append(kind)
+            cirx_special.append(float((xmin + xmax) // 2))
+            ciry_special.append(float((ymin + ymax) // 2))
+            track_id_special.append(i)
+        else:
+            track_id_vehicle_special.append(i)
+            vehicle_xmin.append(float(xmin))
+            vehicle_ymin.append(float(ymin))
+            vehicle_xmax.append(float(xmax))
+            vehicle_ymax.append(float(ymax))
+    matches = []
+    for i in range(len(track_id_vehicle_special)):
+        for j in range(len(classname_special)):
+            if vehicle_xmin[i] <= cirx_special[j] <= vehicle_xmax[i]:
+                if classname_special[j] == HELMET:
+                    matches.append(track_id_vehicle_special[i])
+                elif vehicle_ymin[i] <= ciry_special[j] <= vehicle_ymax[i]:
+                    matches.append((track_id_vehicle_special[i], track_id_special[j]))
+    return matches
+
+def _pooled_frame(pool, scratch, src, size, boxes, kinds, saved):
+    frame = pool.resize(src, size)
+    scratch.reset()
+    kept = []
+    for i, ((xmin, ymin, xmax, ymax), kind) in enumerate(zip(boxes.tolist(), kinds.tolist())):
+        crop_img = frame[ymin:ymax, xmin:xmax]
+        if i < saved:
+            kept.append(crop_img.sum())
+        if kind < 2:
+            scratch.add_special(kind, (xmin + xmax) // 2, (ymin + ymax) // 2, i)
+        else:
+            scratch.add_vehicle(i, xmin, ymin, xmax, ymax)
+    return scratch.match()
+
+def _measure(name, step, frames):
+    step(0) # warm up (the pool allocates its buffers on the first frame)
+    gc.collect()
+    collections = sum(s["collections"] for s in gc.get_stats())
+    tracemalloc.start()
+    peak = 0
+    t = time.perf_counter()
+    for k in range(frames):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        step(k)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    elapsed = time.perf_counter() - t
+    tracemalloc.stop()
+    collections = sum(s["collections"] for s in gc.get_stats()) - collections
+    print(f"{name:<8} {elapsed / frames * 1000:7.3f} ms/frame  peak transient {peak / 1e6:6.2f} MB/frame  "
+          f"{collections} GC collections")
+
+def benchmark(size=(1280, 720), frames=300, boxes_per_frame=20, saved=3):
+    rng = np.random.default_rng(0)
+    src = rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    boxes = [_synthetic_boxes(rng, boxes_per_frame, size) for _ in range(16)]
+    pool = FramePool()
+    scratch = AssociationScratch()
+    print(f"{frames} frames, 1920x1080 -> {size[0]}x{size[1]}, {boxes_per_frame} boxes, {saved} crops saved per frame")
+    _measure("old", lambda k: _old_frame(src, size, *boxes[k % 16], saved), frames)
+    _measure("pooled", lambda k: _pooled_frame(pool, scratch, src, size, *boxes[k % 16], saved), frames)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resolution', help='Resolution in WxH (example: "1280x720")', default="1280x720")
+    parser.add_argument('--frames', help='Number of frames to run', type=int, default=300)
+    parser.add_argument('--boxes', help='Detections per frame', type=int, default=20)
+    args = parser.parse_args()
+    benchmark(tuple(int(v) for v in args.resolution.split('x')), args.frames, args.boxes)
@@ -0,0 +1,126 @@
+"""
+On-disk cache of raw detections for image-folder runs
+
+Entries are keyed by the SHA-1 of the image file contents and stored under the
+SHA-256 of the model file, so re-running a folder after changing only the
+counting or association logic skips inference for images that were already
+seen. The cache lives in a single SQLite file, is capped in size and evicts
+least recently used entries first. Entries made with a different model file are
+dropped when the cache is opened.
+"""
+
+import os
+import hashlib
+import sqlite3
+import time
+from collections import OrderedDict
+import numpy as np
+
+CACHE_FILE = "detection_cache.sqlite"
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hash a (model) file in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def content_key(data):
+    """Cache key for the raw bytes of an image file"""
+    return hashlib.sha1(data).hexdigest()
+
+class DetectionCache:
+    """LRU-capped store of raw (N, 6) float32 detections per image"""
+
+    def __init__(self, cache_dir, model_path, max_mb=512, variant=""):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.model_key = file_sha256(model_path) + (f"@{variant}" if variant else "")
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}
+        self._conn = sqlite3.connect(os.path.join(cache_dir, CACHE_FILE))
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS detections (
+            model TEXT NOT NULL,
+            key TEXT NOT NULL,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (model, key))""")
+        # Entries from another model file can never be hit again
+        stale = self._conn.execute("DELETE FROM detections WHERE model != ?", (self.model_key,)).rowcount
+        if stale > 0:
+            print(f"Detection cache: dropped {stale} entries from a previous model")
+        self._conn.commit()
+
+        # In-memory LRU index (oldest first) so lookups and eviction stay O(1)
+        self._index = OrderedDict()
+        self._total = 0
+        for key, size in self._conn.execute(
+                "SELECT key, size FROM detections WHERE model = ? ORDER BY last_used", (self.model_key,)):
+            self._index[key] = size
+            self._total += size
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get(self, key):
+        """Return cached detections for an image key, or None"""
+        if key not in self._index:
+            self.misses += 1
+            return None
+        row = self._conn.execute("SELECT data FROM detections WHERE model = ? AND key = ?",
+                                 (self.model_key, key)).fetchone()
+        if row is None:
+            self._total -= self._index.pop(key)
+            self.misses += 1
+            return None
+        self._index.move_to_end(key)
+        self._touched[key] = time.time()
+        self.hits += 1
+        return np.frombuffer(row[0], dtype=np.float32).reshape(-1, 6)
+
+    def put(self, key, detections):
+        """Store raw detections for an image key, evicting old entries past the size cap"""
+        data = np.ascontiguousarray(detections, dtype=np.float32).tobytes()
+        if key in self._index:
+            self._total -= self._index.pop(key)
+        self._conn.execute("INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?)",
+                           (self.model_key, key, data, len(data), time.time()))
+        self._index[key] = len(data)
+        self._total += len(data)
+        self._touched.pop(key, None)
+        while self._total > self.max_bytes and len(self._index) > 1:
+            old_key, old_size = self._index.popitem(last=False)
+            self._total -= old_size
+            self._touched.pop(old_key, None)
+            self._conn.execute("DELETE FROM detections WHERE model = ? AND key = ?", (self.model_key, old_key))
+
+    def flush(self):
+        """Persist access times and pending inserts"""
+        if self._touched:
+            self._conn.executemany("UPDATE detections SET last_used = ? WHERE model = ? AND key = ?",
+                                   [(t, self.model_key, key) for key, t in self._touched.items()])
+            self._touched.clear()
+        self._conn.commit()
+
+    def invalidate(self):
+        """Drop every cached entry (e.g. after retraining under the same file name)"""
+        self._conn.execute("DELETE FROM detections")
+        self._conn.commit()
+        self._index.clear()
+        self._touched.clear()
+        self._total = 0
+
+    def close(self):
+        self.flush()
+        self._conn.execute("PRAGMA optimize")
+        self._conn.close()
+
+    def stats(self):
+        return f"{len(self._index)} entries, {self._total / 1e6:.1f} MB, {self.hits} hits, {self.misses} misses"
@@ -0,0 +1,85 @@
+"""
+Preview window on its own thread
+
+The inference loop publishes annotated frames into a single-slot buffer
+(triple-buffered, so publishing never waits for imshow) and the display thread
+shows the latest one at its own refresh rate. Key presses are forwarded to the
+inference loop through a queue, and the mouse callback is registered from the
+display thread so it keeps firing while the loop is busy.
+
+Note: HighGUI windows must be driven from a non-main thread here, which works
+with the GTK/Qt backends on Linux (Raspberry Pi OS) but not on macOS.
+"""
+
+import time
+import queue
+import threading
+import cv2
+import numpy as np
+
+class DisplayThread(threading.Thread):
+    def __init__(self, window_name, refresh_fps=30, mouse_callback=None):
+        super().__init__(daemon=True)
+        self.window_name = window_name
+        self.period = 1.0 / max(refresh_fps, 1)
+        self.mouse_callback = mouse_callback
+        self.keys = queue.Queue()
+        self._lock = threading.Lock()
+        self._spare = None     # written by publish()
+        self._latest = None    # newest complete frame
+        self._shown = None     # owned by the display thread
+        self._new_frame = False
+        self._stop_event = threading.Event()
+
+    def publish(self, frame):
+        """Hand the latest annotated frame to the display (copied, so the caller may reuse it)"""
+        if self._spare is None or self._spare.shape != frame.shape:
+            self._spare = np.empty_like(frame)
+        np.copyto(self._spare, frame)
+        with self._lock:
+            self._spare, self._latest = self._latest, self._spare
+            self._new_frame = True
+
+    def get_key(self):
+        """Next key pressed in the window, or -1"""
+        try:
+            return self.keys.get_nowait()
+        except queue.Empty:
+            return -1
+
+    def wait_key(self):
+        """Block until a key is pressed in the window"""
+        while self.is_alive():
+            try:
+                return self.keys.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return -1
+
+    def run(self):
+        cv2.namedWindow(self.window_name)
+        if self.mouse_callback is not None:
+            cv2.setMouseCallback(self.window_name, self.mouse_callback)
+        next_tick = time.perf_counter()
+        while not self._stop_event.is_set():
+            with self._lock:
+                if self._new_frame:
+                    self._shown, self._latest = self._latest, self._shown
+                    self._new_frame = False
+                    frame = self._shown
+                else:
+                    frame = None
+            if frame is not None:
+                cv2.imshow(self.window_name, frame)
+            next_tick += self.period
+            wait_ms = max(1, int((next_tick - time.perf_counter()) * 1000))
+            key = cv2.waitKey(wait_ms)
+            if key != -1:
+                self.keys.put(key & 0xFF)
+            if time.perf_counter() - next_tick > self.period:
+                next_tick = time.perf_counter() # fell behind, don't try to catch up
+        cv2.destroyWindow(self.window_name)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=2)
@@ -0,0 +1,184 @@
+"""
+Append-only event journal
+
+Every detection outcome (speed, helmet, licence plate, zone crossing) is one
+JSON line with the wall-clock time, event type, camera, track id, value and
+the source frame time:
+
+    {"t": 1718000000.12, "type": "speed", "camera": "R1", "track_id": 12, "value": 47, "frame_time": 83.4}
+
+Writers buffer lines and append them with a single os.write() on an O_APPEND
+descriptor, so several processes can share one journal and the cost of an
+event does not depend on how many came before it. fsync policy:
+
+    "always"  write and fsync every event
+    "batch"   write and fsync every `batch_size` events or `flush_interval` seconds (default)
+    "os"      write in batches, leave syncing to the OS
+
+A timer writes a partial batch once it is `flush_interval` seconds old, so
+events are not held back when traffic stops, and the journal is flushed at
+exit.
+
+The legacy JSON maps (speed_data.json, helmet_data.json, new_license_data.json)
+are rebuilt by the compaction job, which replays only the lines appended since
+its last run (the byte offset is kept next to the journal):
+
+    python event_log.py --journal local_data/events.jsonl --every 2
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+
+FSYNC_POLICIES = ("always", "batch", "os")
+# event type -> legacy map it is compacted into
+LEGACY_MAPS = {
+    "speed": "local_data/speed_data.json",
+    "helmet": "local_data/helmet_data.json",
+    "plate": "server/vehicle_data_with_helmet/new_license_data.json",
+}
+
+class EventLog:
+    def __init__(self, path, fsync="batch", batch_size=64, flush_interval=1.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.fsync = fsync
+        self.batch_size = 1 if fsync == "always" else batch_size
+        self.flush_interval = flush_interval
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.timer = None # flushes a partial batch once it is flush_interval old
+        self.lock = threading.Lock()
+        self.written = 0
+        atexit.register(self.close)
+
+    def append(self, event, camera, track_id, value, frame_time=None, **extra):
+        record = {"t": round(time.time(), 3), "type": event, "camera": camera, "track_id": track_id,
+                  "value": value, "frame_time": frame_time}
+        record.update(extra)
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.lock:
+            self.pending.append(line)
+            if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                self._flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending or self.fd is None:
+            return
+        data = "".join(self.pending).encode()
+        self.pending.clear()
+        os.write(self.fd, data) # one append per batch keeps lines from different writers whole
+        if self.fsync != "os":
+            os.fsync(self.fd)
+        self.written += len(data)
+
+    def close(self):
+        if self.fd is None:
+            return
+        self.flush()
+        os.close(self.fd)
+        self.fd = None
+        atexit.unregister(self.close)
+
+def read_events(path, offset=0):
+    """Yield (event, end offset) for every complete line after `offset`"""
+    with open(path, "rb") as file:
+        file.seek(offset)
+        for line in file:
+            if not line.endswith(b"\n"):
+                break # partial line still being written
+            offset += len(line)
+            try:
+                yield json.loads(line), offset
+            except json.JSONDecodeError as e:
+                print(f"[ERROR] event_log: skipping bad line at {offset - len(line)}: {e}")
+
+def _load_map(path):
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _save_map(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file, indent=4)
+    os.replace(temp_path, path) # readers never see a half-written map
+
+def compact(journal_path, maps=None, offset_path=None):
+    """Apply journal lines appended since the last run to the legacy maps; returns events applied"""
+    maps = LEGACY_MAPS if maps is None else maps
+    offset_path = offset_path or journal_path + ".offset"
+    try:
+        with open(offset_path, "r") as file:
+            offset = int(file.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        offset = 0
+    if not os.path.exists(journal_path):
+        return 0
+    if os.path.getsize(journal_path) < offset:
+        offset = 0 # journal was rotated
+
+    current = {}
+    applied = 0
+    end = offset
+    for event, end in read_events(journal_path, offset):
+        path = maps.get(event.get("type"))
+        if path is None:
+            continue
+        if path not in current:
+            current[path] = _load_map(path)
+        current[path][f"{event['track_id']}"] = event["value"]
+        applied += 1
+
+    for path, data in current.items():
+        _save_map(path, data)
+    if end != offset:
+        with open(offset_path + ".tmp", "w") as file:
+            file.write(str(end))
+        os.replace(offset_path + ".tmp", offset_path)
+    return applied
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Compact the event journal into the legacy JSON maps")
+    parser.add_argument('--journal', help='Event journal written by the R scripts (--event-log)', default="local_data/events.jsonl")
+    parser.add_argument('--speed', help='speed_data.json to maintain', default=LEGACY_MAPS["speed"])
+    parser.add_argument('--helmet', help='helmet_data.json to maintain', default=LEGACY_MAPS["helmet"])
+    parser.add_argument('--plates', help='new_license_data.json to maintain', default=LEGACY_MAPS["plate"])
+    parser.add_argument('--every', help='Keep running and compact every N seconds', type=float, default=None)
+    args = parser.parse_args()
+    maps = {"speed": args.speed, "helmet": args.helmet, "plate": args.plates}
+    try:
+        while True:
+            applied = compact(args.journal, maps)
+            if applied or not args.every:
+                print(f"Compacted {applied} events from {args.journal}")
+            if not args.every:
+                break
+            time.sleep(args.every)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,191 @@
+"""
+Folder-watch image source
+
+Processes images dropped into a directory by the roadside snapshot cameras as
+they arrive. Files already in the folder are picked up once at startup (one
+os.scandir pass, oldest first), later files come from watchdog events, so the
+directory is never re-listed however many files it holds. Images are decoded on
+a small worker pool with a bounded number in flight and handed out in arrival
+order. Processed file names are appended to a manifest so a restart skips them.
+Names of files removed from the folder are forgotten, and the manifest is
+rewritten with only the files still there, at startup and whenever it has grown
+to twice that, so neither grows with the camera's whole history.
+
+Used by the R scripts with --source watch:<folder>.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+IMG_EXT_LIST = ['.jpg','.JPG','.jpeg','.JPEG','.png','.PNG','.bmp','.BMP']
+MANIFEST_NAME = ".processed_manifest"
+MANIFEST_SLACK = 1024 # stale manifest lines tolerated before a rewrite, on top of the live ones
+
+def read_when_complete(path, retries=10, delay=0.1):
+    """Decode an image, retrying while the camera is still writing it"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None # removed before we got to it
+    if st.st_size > 0 and time.time() - st.st_mtime >= delay: # finished a while ago (e.g. the startup backlog)
+        frame = cv2.imread(path)
+        if frame is not None:
+            return frame
+    last_size = -1
+    for _ in range(retries):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None # removed before we got to it
+        if size > 0 and size == last_size:
+            frame = cv2.imread(path)
+            if frame is not None:
+                return frame
+        last_size = size
+        time.sleep(delay)
+    return cv2.imread(path)
+
+class new_image_handler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.add(event.src_path)
+
+    def on_moved(self, event): # cameras that write to a temp name and rename
+        if not event.is_directory:
+            self.watcher.forget(event.src_path)
+            self.watcher.add(event.dest_path)
+
+    def on_deleted(self, event): # the camera rotating out old snapshots
+        if not event.is_directory:
+            self.watcher.forget(event.src_path)
+
+class FolderWatcher:
+    def __init__(self, folder, manifest_path=None, workers=2, max_inflight=4):
+        self.folder = folder
+        self.manifest_path = manifest_path or os.path.join(folder, MANIFEST_NAME)
+        self.max_inflight = max_inflight
+        self.pending = deque()   # paths waiting to be decoded, in arrival order
+        self.inflight = deque()  # (path, future) being decoded, in arrival order
+        self.seen = set()        # names queued or processed
+        self.done = set()        # names processed (what the manifest holds)
+        self.manifest_lines = 0
+        self.cond = threading.Condition()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.observer = None
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as file:
+                self.done.update(line.rstrip("\n") for line in file)
+        self.seen.update(self.done)
+        self.manifest = open(self.manifest_path, "a")
+
+    def start(self):
+        """Queue the backlog already in the folder and start watching for new files"""
+        # Start watching first so files arriving during the scan are not missed (seen dedups)
+        self.observer = Observer()
+        self.observer.schedule(new_image_handler(self), self.folder, recursive=False)
+        self.observer.start()
+
+        backlog = []
+        present = set()
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if os.path.splitext(entry.name)[1] not in IMG_EXT_LIST:
+                    continue
+                present.add(entry.name)
+                if entry.name in self.seen:
+                    continue
+                try:
+                    backlog.append((entry.stat().st_mtime, entry.name, entry.path))
+                except OSError:
+                    continue
+        with self.cond:
+            # names of files no longer in the folder will never come up again
+            gone = self.done - present
+            self.done -= gone
+            self.seen -= gone
+            self._rewrite_manifest()
+        backlog.sort()
+        for _, _, path in backlog:
+            self.add(path)
+        print(f"Watching folder: {self.folder} ({len(backlog)} unprocessed images, {len(self.done)} already done)")
+
+    def add(self, path):
+        name = os.path.basename(path)
+        if os.path.splitext(name)[1] not in IMG_EXT_LIST:
+            return
+        with self.cond:
+            if name in self.seen:
+                return
+            self.seen.add(name)
+            self.pending.append(path)
+            self.cond.notify()
+
+    def forget(self, path):
+        """A file left the folder: drop its name, so a new file with the same name is processed"""
+        name = os.path.basename(path)
+        with self.cond:
+            self.seen.discard(name)
+            self.done.discard(name)
+
+    def _fill(self):
+        while self.pending and len(self.inflight) < self.max_inflight:
+            path = self.pending.popleft()
+            self.inflight.append((path, self.pool.submit(read_when_complete, path)))
+
+    def next_frame(self, timeout=None):
+        """Return (path, frame) for the next image in arrival order, or (None, None) on timeout"""
+        while True:
+            with self.cond:
+                if not self.inflight and not self.pending:
+                    self.cond.wait(timeout)
+                self._fill()
+                if not self.inflight:
+                    return None, None
+                path, future = self.inflight.popleft()
+                self._fill()
+            frame = future.result()
+            if frame is not None:
+                return path, frame
+            print(f"[WARN] Unable to read {path}, skipping")
+            self.mark_done(path)
+
+    def mark_done(self, path):
+        """Record a processed file in the manifest"""
+        name = os.path.basename(path)
+        with self.cond:
+            if name not in self.seen: # removed from the folder while it was processed
+                return
+            self.done.add(name)
+            self.manifest.write(name + "\n")
+            self.manifest.flush()
+            self.manifest_lines += 1
+            if self.manifest_lines > 2 * len(self.done) + MANIFEST_SLACK:
+                self._rewrite_manifest()
+
+    def _rewrite_manifest(self):
+        """Replace the manifest with the processed files still in the folder (called with the lock held)"""
+        self.manifest.close()
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, "w") as file:
+            file.write("".join(name + "\n" for name in self.done))
+        os.replace(temp_path, self.manifest_path)
+        self.manifest = open(self.manifest_path, "a")
+        self.manifest_lines = len(self.done)
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        self.pool.shutdown(wait=False)
+        with self.cond:
+            self.manifest.close()
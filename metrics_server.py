@@ -0,0 +1,265 @@
+"""
+Local Prometheus metrics endpoint
+
+Each R script can serve http://<host>:<port>/metrics in the Prometheus text
+format (--metrics-port 9101). The detection loop only bumps counters, sets
+gauges and writes stage latencies into fixed-size rings; everything else
+(quantiles, zone totals, recorder queue depth, lane counts and the signal
+phase from traffic.json) is computed by the HTTP thread when it is scraped.
+
+Run on its own it serves just the lane / signal metrics, as an aggregator for
+the signal controller host:
+
+    python metrics_server.py --port 9100 --traffic /path/to/traffic.json
+    python metrics_server.py --check           # scrape once with a live recorder and zone counter
+"""
+
+import re
+import json
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+PREFIX = "traffic"
+
+# name -> (type, help)
+METRICS = {
+    "frames_total": ("counter", "Frames processed"),
+    "fps": ("gauge", "Average pipeline frames per second"),
+    "boxes": ("gauge", "Detections in the last frame"),
+    "active_tracks": ("gauge", "Confident tracks in the last frame"),
+    "stage_seconds": ("summary", "Per-frame latency of each pipeline stage"),
+    "crops_saved_total": ("counter", "Crops written to disk"),
+    "json_writes_total": ("counter", "JSON state file writes"),
+    "lock_wait_seconds_total": ("counter", "Time spent waiting for JSON file locks"),
+    "crossings_total": ("counter", "Zone crossings by zone, class and direction"),
+    "recorder_slots_in_use": ("gauge", "Frames waiting in the recorder's encode queue"),
+    "recorder_dropped_total": ("counter", "Frames dropped because the recorder was busy"),
+    "watch_backlog": ("gauge", "Images waiting to be processed in the watched folder"),
+    "lane_vehicles": ("gauge", "Vehicle count per lane from traffic.json (T1..Tn)"),
+    "lane_queue": ("gauge", "Smoothed queue length per lane from traffic.json (Q1..Qn)"),
+    "lane_volume": ("gauge", "Counting-line crossings per lane, class and trailing window (V1..Vn)"),
+    "emergency_active": ("gauge", "Emergency vehicle flag per lane from traffic.json (A1..An)"),
+    "signal_lamp": ("gauge", "Signal lamp state per approach and colour from traffic.json"),
+    "signal_green_approach": ("gauge", "Approach currently showing green (0 if none)"),
+    "signal_countdown_seconds": ("gauge", "Countdown of the current phase (C in traffic.json)"),
+}
+QUANTILES = (0.5, 0.95, 0.99)
+LAMP_COLORS = {"R": "red", "Y": "yellow", "G": "green"}
+TRAFFIC_KEY = re.compile(r"^([TQVARYG])(\d+)$")
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class _Latency:
+    """Sum, count and the last `window` samples of one stage"""
+    def __init__(self, window):
+        self.samples = np.zeros(window, dtype=np.float64)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+        self.total += seconds
+
+class PipelineMetrics:
+    def __init__(self, camera, window=256):
+        self.camera = camera
+        self.window = window
+        self.values = defaultdict(float) # (name, labels) -> value
+        self.stages = {}
+        self._collectors = []
+
+    ############ hot path ############
+    def inc(self, name, value=1, **labels):
+        self.values[(name, tuple(sorted(labels.items())))] += value
+
+    def set(self, name, value, **labels):
+        self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, stage, seconds):
+        latency = self.stages.get(stage)
+        if latency is None:
+            latency = self.stages[stage] = _Latency(self.window)
+        latency.observe(seconds)
+
+    ############ read at scrape time ############
+    def add_collector(self, collect):
+        """collect() -> iterable of (name, labels dict, value), called on every scrape"""
+        self._collectors.append(collect)
+
+    def watch_zone_counter(self, zone_counter):
+        def collect():
+            counts = zone_counter.counts.copy()
+            for z, zone in enumerate(zone_counter.zone_names):
+                for c, cls in enumerate(zone_counter.class_names):
+                    for d, direction in enumerate(zone_counter.directions[z]):
+                        yield "crossings_total", {"zone": zone, "class": cls, "direction": direction}, counts[z, c, d]
+        self.add_collector(collect)
+
+    def watch_recorder(self, recorder):
+        def collect():
+            try:
+                free = recorder.free_slots.get_value() # a semaphore counting the free slots
+            except NotImplementedError: # macOS
+                free = recorder.slots
+            yield "recorder_slots_in_use", {}, recorder.slots - free
+            yield "recorder_dropped_total", {}, recorder.dropped
+        self.add_collector(collect)
+
+    def watch_folder(self, watcher):
+        self.add_collector(lambda: [("watch_backlog", {}, len(watcher.pending) + len(watcher.inflight))])
+
+    def samples(self):
+        """(name, labels tuple, value) for everything recorded or collected"""
+        camera = (("camera", self.camera),)
+        for (name, labels), value in list(self.values.items()):
+            yield name, camera + labels, value
+        for stage, latency in list(self.stages.items()):
+            labels = camera + (("stage", stage),)
+            n = min(latency.count, self.window)
+            if n:
+                for q, v in zip(QUANTILES, np.quantile(latency.samples[:n], QUANTILES)):
+                    yield "stage_seconds", labels + (("quantile", str(q)),), v
+            yield "stage_seconds_sum", labels, latency.total
+            yield "stage_seconds_count", labels, latency.count
+        for collect in self._collectors:
+            for name, labels, value in collect():
+                yield name, camera + tuple(sorted(labels.items())), value
+
+def traffic_samples(path):
+    """Lane counts, emergency flags and lamp states read from traffic.json"""
+    try:
+        with open(path, "r") as file:
+            traffic = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"[ERROR] metrics: {e}")
+        return
+    green = 0
+    for key, value in traffic.items():
+        match = TRAFFIC_KEY.match(key)
+        if not match:
+            continue
+        kind, lane = match.groups()
+        if kind == "T":
+            yield "lane_vehicles", (("lane", lane),), value
+        elif kind == "Q":
+            yield "lane_queue", (("lane", lane),), value
+        elif kind == "V":
+            for window, counts in value.items():
+                for cls, count in counts.items():
+                    yield "lane_volume", (("lane", lane), ("window", window), ("class", cls)), count
+        elif kind == "A":
+            yield "emergency_active", (("lane", lane),), int(bool(value))
+        else:
+            yield "signal_lamp", (("approach", lane), ("color", LAMP_COLORS[kind])), int(bool(value))
+            if kind == "G" and value and not green:
+                green = int(lane)
+    yield "signal_green_approach", (), green
+    if "C" in traffic:
+        yield "signal_countdown_seconds", (), traffic["C"]
+
+def render(samples):
+    """Prometheus text exposition of (name, labels tuple, value) samples"""
+    families = defaultdict(list)
+    for name, labels, value in samples:
+        base = re.sub(r"_(sum|count)$", "", name) if name not in METRICS else name
+        families[base].append(f"{PREFIX}_{name}{_labels(labels)} {float(value):g}")
+    lines = []
+    for base, rows in families.items():
+        kind, help_text = METRICS.get(base, ("untyped", base))
+        lines.append(f"# HELP {PREFIX}_{base} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{base} {kind}")
+        lines.extend(rows)
+    return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """Serves /metrics from a daemon thread"""
+
+    def __init__(self, metrics=None, port=9101, host="127.0.0.1", traffic_path=None):
+        self.metrics = metrics
+        self.traffic_path = traffic_path
+        server = self
+
+        class handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = server.scrape().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"Metrics on http://{host}:{self.httpd.server_port}/metrics")
+
+    def scrape(self):
+        samples = []
+        if self.metrics is not None:
+            samples.extend(self.metrics.samples())
+        if self.traffic_path:
+            samples.extend(traffic_samples(self.traffic_path))
+        return render(samples)
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def check():
+    """Scrape a server fed by a live AsyncRecorder and ZoneCounter, as an R script with --record does"""
+    import os
+    import tempfile
+    import urllib.request
+    from async_recorder import AsyncRecorder
+    from zone_counter import ZoneCounter, DEFAULT_ZONES
+    metrics = PipelineMetrics("R1")
+    recorder = AsyncRecorder(os.path.join(tempfile.mkdtemp(), "check.avi"), (320, 240), slots=4)
+    metrics.watch_recorder(recorder)
+    metrics.watch_zone_counter(ZoneCounter(DEFAULT_ZONES, ["car"]))
+    server = MetricsServer(metrics, port=0)
+    try:
+        frame = np.zeros((240, 320, 3), dtype=np.uint8)
+        for k in range(8):
+            recorder.write(frame, k / 30)
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.httpd.server_port}/metrics", timeout=5) as response:
+            body = response.read().decode()
+    finally:
+        server.stop()
+        recorder.release()
+    for name in ("recorder_slots_in_use", "recorder_dropped_total", "crossings_total"):
+        if f"{PREFIX}_{name}" not in body:
+            raise SystemExit(f"check failed: {PREFIX}_{name} missing from the scrape")
+    print("\n".join(line for line in body.splitlines() if line.startswith(f"{PREFIX}_recorder")))
+    print("check passed")
+
+if __name__ == "__main__":
+    import time
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', help='Port to serve /metrics on', type=int, default=9100)
+    parser.add_argument('--host', help='Address to bind (use 0.0.0.0 to allow remote scrapes)', default="127.0.0.1")
+    parser.add_argument('--traffic', help='traffic.json with lane counts and signal state', default="traffic.json")
+    parser.add_argument('--check', help='Scrape once with a live recorder and zone counter and exit', action='store_true')
+    args = parser.parse_args()
+    if args.check:
+        check()
+        raise SystemExit
+    MetricsServer(port=args.port, host=args.host, traffic_path=args.traffic)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,151 @@
+"""
+Cached overlay rendering for the detection window
+
+Static elements (counting zones, counter captions, camera name) are drawn once
+into a cached layer and pasted onto each frame with one masked copy per region.
+Dynamic text (counter values, FPS) is re-rendered only when its string changes
+and pasted from a small cached patch. Text metrics are memoised, and the
+renderer can skip frames so display runs at a lower rate than inference.
+"""
+
+from functools import lru_cache
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+LINE = cv2.LINE_8 # cached patches need hard edges (no anti-aliasing against the background)
+
+@lru_cache(maxsize=4096)
+def text_size(text, scale=0.5, thickness=1):
+    """Memoised cv2.getTextSize -> ((width, height), baseline)"""
+    return cv2.getTextSize(text, FONT, scale, thickness)
+
+def _render_text(text, scale, color, thickness):
+    """Render text into a tight (patch, mask) pair; returns (patch, mask, ascent)"""
+    (w, h), baseline = text_size(text, scale, thickness)
+    pad = 2 * thickness + 4 # strokes spill past the getTextSize box
+    height, width = h + baseline + 2 * pad, w + 2 * pad
+    patch = np.zeros((height, width, 3), dtype=np.uint8)
+    mask = np.zeros((height, width), dtype=np.uint8)
+    org = (pad, pad + h)
+    cv2.putText(patch, text, org, FONT, scale, color, thickness, LINE)
+    cv2.putText(mask, text, org, FONT, scale, 255, thickness, LINE)
+    return patch, mask, pad + h
+
+def _paste(frame, x, y, patch, mask):
+    """Copy the masked pixels of a patch onto the frame at (x, y), clipped to the frame"""
+    H, W = frame.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + patch.shape[1], W), min(y + patch.shape[0], H)
+    if x0 >= x1 or y0 >= y1:
+        return
+    px, py = x0 - x, y0 - y
+    # cv2.copyTo writes straight into the frame view
+    cv2.copyTo(patch[py:py + y1 - y0, px:px + x1 - x0], mask[py:py + y1 - y0, px:px + x1 - x0], frame[y0:y1, x0:x1])
+
+def _merge_boxes(boxes):
+    """Merge overlapping (x0, y0, x1, y1) boxes"""
+    merged = []
+    for box in sorted(boxes):
+        for i, other in enumerate(merged):
+            if box[0] <= other[2] and other[0] <= box[2] and box[1] <= other[3] and other[1] <= box[3]:
+                merged[i] = (min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3]))
+                break
+        else:
+            merged.append(box)
+    if len(merged) < len(boxes):
+        return _merge_boxes(merged)
+    return merged
+
+class OverlayRenderer:
+    def __init__(self, render_every=1):
+        self.render_every = max(1, int(render_every))
+        self.frame_idx = 0
+        self._static_ops = []
+        self._static_shape = None
+        self._static_regions = [] # (x, y, patch, mask)
+        self._dynamic = {} # key -> [text, org, scale, color, thickness, patch, mask, ascent]
+
+    ############ static layer ############
+    def add_line(self, p1, p2, color, thickness=1):
+        self._static_ops.append((cv2.line, (p1, p2, color, thickness, LINE)))
+        self._static_shape = None
+
+    def add_polygon(self, points, color, thickness=1):
+        self._static_ops.append((cv2.polylines, ([np.int32(points)], True, color, thickness, LINE)))
+        self._static_shape = None
+
+    def add_text(self, text, org, scale, color, thickness=1):
+        self._static_ops.append((cv2.putText, (text, org, FONT, scale, color, thickness, LINE)))
+        self._static_shape = None
+
+    def add_counter(self, key, caption, org, scale, color, thickness=1):
+        """Static caption with a dynamic value drawn right after it (see set_value)"""
+        self.add_text(caption, org, scale, color, thickness)
+        # Offset of the first glyph after the caption (getTextSize of the caption alone pads the end)
+        w = text_size(caption + "0", scale, thickness)[0][0] - text_size("0", scale, thickness)[0][0]
+        self._dynamic[key] = [None, (org[0] + w, org[1]), scale, color, thickness, None, None, 0]
+
+    def _build_static(self, shape):
+        layer = np.zeros(shape, dtype=np.uint8)
+        mask = np.zeros(shape[:2], dtype=np.uint8)
+        boxes = []
+        for draw, args in self._static_ops:
+            draw(layer, *args)
+            # Same primitive with a single-channel colour marks the pixels it touched
+            op_mask = np.zeros(shape[:2], dtype=np.uint8)
+            if draw is cv2.putText:
+                draw(op_mask, *args[:4], 255, *args[5:])
+            else:
+                draw(op_mask, *args[:-3], 255, *args[-2:])
+            x, y, w, h = cv2.boundingRect(op_mask)
+            if w and h:
+                boxes.append((x, y, x + w, y + h))
+            mask |= op_mask
+        self._static_regions = [(x0, y0, layer[y0:y1, x0:x1].copy(), mask[y0:y1, x0:x1].copy())
+                                for x0, y0, x1, y1 in _merge_boxes(boxes)]
+        self._static_shape = shape
+
+    ############ dynamic text ############
+    def set_value(self, key, value):
+        """Update a counter value; it is re-rendered only if its text changed"""
+        item = self._dynamic[key]
+        text = str(value)
+        if text != item[0]:
+            item[0] = text
+            item[5], item[6], item[7] = _render_text(text, item[2], item[3], item[4])
+
+    def set_text(self, key, text, org, scale, color, thickness=1):
+        """Free-standing dynamic text (e.g. FPS)"""
+        if key not in self._dynamic:
+            self._dynamic[key] = [None, org, scale, color, thickness, None, None, 0]
+        self._dynamic[key][1] = org
+        self.set_value(key, text)
+
+    ############ per frame ############
+    def should_render(self):
+        """True on the frames that should be drawn and displayed"""
+        render = self.frame_idx % self.render_every == 0
+        self.frame_idx += 1
+        return render
+
+    def draw_box(self, frame, box, color, label):
+        """Bounding box with a filled label above it; returns (label_ymin, label_size, baseline)"""
+        xmin, ymin, xmax, ymax = box
+        cv2.rectangle(frame, (xmin, ymin), (xmax, ymax), color, 1)
+        labelSize, baseLine = text_size(label, 0.5, 1)
+        label_ymin = max(ymin, labelSize[1] + 10) # Make sure not to draw label too close to top of window
+        cv2.rectangle(frame, (xmin, label_ymin-labelSize[1]-10), (xmin+labelSize[0], label_ymin+baseLine-10), color, cv2.FILLED)
+        cv2.putText(frame, label, (xmin, label_ymin-7), FONT, 0.5, (0, 0, 0), 1)
+        return label_ymin, labelSize, baseLine
+
+    def compose(self, frame):
+        """Paste the static layer and all dynamic text onto the frame"""
+        if self._static_shape != frame.shape:
+            self._build_static(frame.shape)
+        for x, y, patch, mask in self._static_regions:
+            _paste(frame, x, y, patch, mask)
+        for text, org, scale, color, thickness, patch, mask, ascent in self._dynamic.values():
+            if patch is not None:
+                _paste(frame, org[0] - (2 * thickness + 4), org[1] - ascent, patch, mask)
+        return frame
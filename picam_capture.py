@@ -0,0 +1,141 @@
+"""
+Picamera capture straight into OpenCV's BGR layout
+
+Picamera2's "RGB888" format is 24 bits per pixel stored in B, G, R byte order,
+which is exactly what OpenCV and the YOLO model expect. Requesting it removes
+the np.copy() and BGRA->BGR conversion that the XRGB8888 path needed, so the
+array Picamera2 hands back goes to inference as is (a strided view if the
+camera pads its rows).
+
+FakePicamera2 implements the parts of the Picamera2 API used here and produces
+synthetic frames, so the capture path can be run and benchmarked without a
+camera:
+
+    python picam_capture.py --resolution 1280x720
+"""
+
+import time
+import numpy as np
+
+CAPTURE_FORMAT = "RGB888" # BGR byte order in memory
+
+class _FakeRequest:
+    def __init__(self, camera, array):
+        self.camera = camera
+        self.array = array
+        self.metadata = {"SensorTimestamp": time.monotonic_ns()}
+
+    def make_array(self, name="main"):
+        return self.array.copy() # like Picamera2, the array outlives the request
+
+    def get_metadata(self):
+        return self.metadata
+
+    def release(self):
+        pass
+
+class FakePicamera2:
+    """Stand-in for picamera2.Picamera2 that generates moving test frames"""
+
+    def __init__(self, camera_num=0, fps=None):
+        self.camera_num = camera_num
+        self.fps = fps
+        self.config = None
+        self.frames = []
+        self.index = 0
+        self.started = False
+        self.last = 0.0
+
+    def create_video_configuration(self, main=None, **kwargs):
+        main = dict(main or {})
+        main.setdefault("format", "XBGR8888")
+        main.setdefault("size", (1280, 720))
+        return {"main": main}
+
+    def configure(self, config):
+        self.config = config
+        width, height = config["main"]["size"]
+        channels = 3 if config["main"]["format"] in ("RGB888", "BGR888") else 4
+        # Row stride padded to 64 bytes like the real ISP output
+        stride = -(-width * channels // 64) * 64
+        x = np.arange(width, dtype=np.uint16)
+        self.frames = []
+        for k in range(8):
+            buffer = np.zeros((height, stride), dtype=np.uint8)
+            image = buffer[:, :width * channels].reshape(height, width, channels)
+            image[:] = ((x[None, :, None] + k * 16 + np.arange(channels) * 40) % 256).astype(np.uint8)
+            self.frames.append(image)
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.started = False
+
+    def _next(self):
+        if self.fps:
+            delay = self.last + 1.0 / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.last = time.monotonic()
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return frame
+
+    def capture_array(self, name="main"):
+        return self._next().copy()
+
+    def capture_request(self, name="main"):
+        return _FakeRequest(self, self._next())
+
+def open_picamera(size, camera_num=0, fake=False):
+    """Start a Picamera2 (or FakePicamera2) delivering BGR frames of the given (width, height)"""
+    if fake:
+        camera = FakePicamera2(camera_num)
+    else:
+        from picamera2 import Picamera2
+        camera = Picamera2(camera_num)
+    camera.configure(camera.create_video_configuration(main={"format": CAPTURE_FORMAT, "size": size}))
+    camera.start()
+    return camera
+
+def capture_bgr(camera):
+    """Return (BGR frame, capture time in seconds) without any extra copy or conversion"""
+    request = camera.capture_request()
+    try:
+        frame = request.make_array("main")
+        timestamp = request.get_metadata().get("SensorTimestamp")
+    finally:
+        request.release()
+    return frame, (timestamp / 1e9 if timestamp else time.monotonic())
+
+def benchmark(size=(1280, 720), frames=300):
+    """Compare the old XRGB8888 + copy + cvtColor path with the native BGR path on fake frames"""
+    import cv2
+
+    old = FakePicamera2()
+    old.configure(old.create_video_configuration(main={"format": 'XRGB8888', "size": size}))
+    old.start()
+    t = time.perf_counter()
+    for _ in range(frames):
+        frame_bgra = old.capture_array()
+        frame = cv2.cvtColor(np.copy(frame_bgra), cv2.COLOR_BGRA2BGR)
+    old_ms = (time.perf_counter() - t) / frames * 1000
+
+    new = open_picamera(size, fake=True)
+    t = time.perf_counter()
+    for _ in range(frames):
+        frame, _ = capture_bgr(new)
+    new_ms = (time.perf_counter() - t) / frames * 1000
+
+    print(f"{size[0]}x{size[1]}, {frames} frames")
+    print(f"XRGB8888 + copy + cvtColor: {old_ms:.2f} ms/frame")
+    print(f"RGB888 (BGR) direct:        {new_ms:.2f} ms/frame ({frame.shape}, contiguous={frame.flags.c_contiguous})")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resolution', help='Resolution in WxH (example: "1280x720")', default="1280x720")
+    parser.add_argument('--frames', help='Number of frames to capture', type=int, default=300)
+    args = parser.parse_args()
+    benchmark(tuple(int(v) for v in args.resolution.split('x')), args.frames)
@@ -0,0 +1,49 @@
+"""
+Smoothed queue length per lane
+
+The raw per-frame vehicle count jumps with detector noise (a missed box, a
+truck split in two), which makes the controller's green-time choice flap.
+QueueEstimator keeps one number per lane that moves with the traffic but not
+with the noise:
+
+    predicted = queue + arrivals - departures          (vehicles in minus out since last frame)
+    queue     = predicted + alpha * (observed - predicted)
+
+where alpha = 1 - exp(-dt / time_constant), so the estimate follows the
+observed count with a time constant in seconds whatever the frame rate, while
+line crossings move it immediately. Arrival and departure rates are kept as
+EWMAs in vehicles per second. Each update is O(1).
+"""
+
+import math
+
+class QueueEstimator:
+    def __init__(self, time_constant=3.0, rate_time_constant=30.0):
+        self.time_constant = time_constant
+        self.rate_time_constant = rate_time_constant
+        self.queue = 0.0
+        self.arrival_rate = 0.0   # vehicles / s
+        self.departure_rate = 0.0 # vehicles / s
+        self.last_time = None
+
+    def update(self, observed, t, arrivals=0, departures=0):
+        """Fold in one frame: vehicles seen in the zone, and crossings into / out of it since the last frame"""
+        if self.last_time is None:
+            self.queue = float(observed)
+            self.last_time = t
+            return self.queue
+        dt = t - self.last_time
+        if dt <= 0:
+            dt = 1e-3 # same timestamp, or a new video starting again from 0
+        self.last_time = t
+        predicted = max(0.0, self.queue + arrivals - departures)
+        alpha = 1.0 - math.exp(-dt / self.time_constant)
+        self.queue = predicted + alpha * (observed - predicted)
+        beta = 1.0 - math.exp(-dt / self.rate_time_constant)
+        self.arrival_rate += beta * (arrivals / dt - self.arrival_rate)
+        self.departure_rate += beta * (departures / dt - self.departure_rate)
+        return self.queue
+
+    def value(self, digits=1):
+        """Queue estimate as published in traffic.json (Q1..Q4)"""
+        return round(self.queue, digits)
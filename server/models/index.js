@@ -2,10 +2,18 @@ const mongoose = require('mongoose');
 
 // Define mongoose schemas and models for the application
 const speedDataSchema = new mongoose.Schema({
-  vehicleId: { 
+  // track ids restart with every detector run, so a record is unique per camera and run
+  camera: {
     type: String,
-    required: true,
-    unique: true
+    default: null
+  },
+  runId: {
+    type: String,
+    default: null
+  },
+  vehicleId: {
+    type: String,
+    required: true
   },
   speed: {
     type: Number,
@@ -16,12 +24,20 @@ const speedDataSchema = new mongoose.Schema({
     default: Date.now 
   }
 });
+speedDataSchema.index({ camera: 1, runId: 1, vehicleId: 1 }, { unique: true });
 
 const licensePlateSchema = new mongoose.Schema({
+  camera: {
+    type: String,
+    default: null
+  },
+  runId: {
+    type: String,
+    default: null
+  },
   plateId: {
     type: String,
-    required: true,
-    unique: true
+    required: true
   },
   plateNumber: {
     type: String,
@@ -32,12 +48,20 @@ const licensePlateSchema = new mongoose.Schema({
     default: Date.now 
   }
 });
+licensePlateSchema.index({ camera: 1, runId: 1, plateId: 1 }, { unique: true });
 
 const helmetDataSchema = new mongoose.Schema({
+  camera: {
+    type: String,
+    default: null
+  },
+  runId: {
+    type: String,
+    default: null
+  },
   vehicleId: {
     type: String,
-    required: true,
-    unique: true
+    required: true
   },
   isWearingHelmet: {
     type: Boolean,
@@ -48,6 +72,7 @@ const helmetDataSchema = new mongoose.Schema({
     default: Date.now 
   }
 });
+helmetDataSchema.index({ camera: 1, runId: 1, vehicleId: 1 }, { unique: true });
 
 const vehicleImageSchema = new mongoose.Schema({
   filename: {
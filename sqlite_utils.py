@@ -0,0 +1,382 @@
+"""
+SQLite event store for field units without MongoDB
+
+Same save API as mongo_utils (save_speed_data, save_helmet_data,
+save_license_plate_data) plus zone crossings and image metadata, stored in
+one local SQLite file. Saves are queued and written by a single writer thread
+in batched transactions (WAL mode, synchronous=NORMAL), so callers never wait
+on the SD card. Speed, helmet and plate records are upserted per vehicle /
+plate id like the MongoDB collections, keyed together with the camera and the
+run (RUN_ID, one per process): track ids are only unique within one detector
+run, and restart at 1. Crossings and image metadata are appended, tagged
+with the run. Rows carry a `synced` flag and sync_to_mongo() pushes the unsynced
+ones with bulk upserts once MongoDB is reachable.
+
+    python sqlite_utils.py --benchmark 20000   # insert throughput
+    python sqlite_utils.py --sync --every 60   # push to MongoDB every minute
+"""
+
+import os
+import re
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from datetime import datetime
+
+DB_PATH = os.path.join("local_data", "traffic.sqlite")
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.5 # seconds a save may wait in the queue before its batch is committed
+RUN_ID = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}" # track ids restart with every detector run
+PLATE_FILE = re.compile(r"^(?P<camera>[^_]+)_(?P<run_id>[^_]+)_license_plate_(?P<vehicle_id>.+)$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS speed_data (
+    camera TEXT NOT NULL, run_id TEXT NOT NULL, vehicle_id TEXT NOT NULL, speed REAL, timestamp REAL,
+    synced INTEGER DEFAULT 0, PRIMARY KEY (camera, run_id, vehicle_id));
+CREATE TABLE IF NOT EXISTS helmet_data (
+    camera TEXT NOT NULL, run_id TEXT NOT NULL, vehicle_id TEXT NOT NULL, is_wearing_helmet INTEGER, timestamp REAL,
+    synced INTEGER DEFAULT 0, PRIMARY KEY (camera, run_id, vehicle_id));
+CREATE TABLE IF NOT EXISTS license_plate_data (
+    camera TEXT NOT NULL, run_id TEXT NOT NULL, plate_id TEXT NOT NULL, plate_number TEXT, timestamp REAL,
+    synced INTEGER DEFAULT 0, PRIMARY KEY (camera, run_id, plate_id));
+CREATE TABLE IF NOT EXISTS crossings (
+    id INTEGER PRIMARY KEY, vehicle_id TEXT, camera TEXT, zone TEXT, class TEXT, direction TEXT,
+    frame_time REAL, timestamp REAL, synced INTEGER DEFAULT 0, run_id TEXT);
+CREATE TABLE IF NOT EXISTS image_metadata (
+    id INTEGER PRIMARY KEY, path TEXT, vehicle_id TEXT, camera TEXT, class TEXT, confidence REAL,
+    width INTEGER, height INTEGER, timestamp REAL, synced INTEGER DEFAULT 0, run_id TEXT);
+CREATE INDEX IF NOT EXISTS speed_timestamp ON speed_data (timestamp);
+CREATE INDEX IF NOT EXISTS speed_camera ON speed_data (camera, timestamp);
+CREATE INDEX IF NOT EXISTS helmet_timestamp ON helmet_data (timestamp);
+CREATE INDEX IF NOT EXISTS helmet_camera ON helmet_data (camera, timestamp);
+CREATE INDEX IF NOT EXISTS plate_number ON license_plate_data (plate_number);
+CREATE INDEX IF NOT EXISTS plate_timestamp ON license_plate_data (timestamp);
+CREATE INDEX IF NOT EXISTS speed_run ON speed_data (run_id, vehicle_id);
+CREATE INDEX IF NOT EXISTS crossings_vehicle ON crossings (vehicle_id);
+CREATE INDEX IF NOT EXISTS crossings_camera ON crossings (camera, timestamp);
+CREATE INDEX IF NOT EXISTS image_vehicle ON image_metadata (vehicle_id);
+CREATE INDEX IF NOT EXISTS image_camera ON image_metadata (camera, timestamp);
+"""
+for _table in ("speed_data", "helmet_data", "license_plate_data", "crossings", "image_metadata"):
+    SCHEMA += f"CREATE INDEX IF NOT EXISTS {_table}_unsynced ON {_table} (synced) WHERE synced = 0;\n"
+
+UPSERT_SPEED = """INSERT INTO speed_data (vehicle_id, speed, camera, run_id, timestamp, synced) VALUES (?, ?, ?, ?, ?, 0)
+    ON CONFLICT(camera, run_id, vehicle_id) DO UPDATE SET speed=excluded.speed, timestamp=excluded.timestamp, synced=0"""
+UPSERT_HELMET = """INSERT INTO helmet_data (vehicle_id, is_wearing_helmet, camera, run_id, timestamp, synced) VALUES (?, ?, ?, ?, ?, 0)
+    ON CONFLICT(camera, run_id, vehicle_id) DO UPDATE SET is_wearing_helmet=excluded.is_wearing_helmet,
+    timestamp=excluded.timestamp, synced=0"""
+UPSERT_PLATE = """INSERT INTO license_plate_data (plate_id, plate_number, camera, run_id, timestamp, synced) VALUES (?, ?, ?, ?, ?, 0)
+    ON CONFLICT(camera, run_id, plate_id) DO UPDATE SET plate_number=excluded.plate_number,
+    timestamp=excluded.timestamp, synced=0"""
+INSERT_CROSSING = """INSERT INTO crossings (vehicle_id, camera, zone, class, direction, frame_time, timestamp, run_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+INSERT_IMAGE = """INSERT INTO image_metadata (path, vehicle_id, camera, class, confidence, width, height, timestamp, run_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+# tables that were keyed on the id alone before the camera / run key: table -> id column, value column
+KEYED_TABLES = {"speed_data": ("vehicle_id", "speed"), "helmet_data": ("vehicle_id", "is_wearing_helmet"),
+                "license_plate_data": ("plate_id", "plate_number")}
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def _migrate(conn):
+    """Bring a database from before the camera / run key up to date; returns the tables to copy back"""
+    old = []
+    with conn:
+        for table in KEYED_TABLES:
+            columns = _columns(conn, table)
+            if columns and "run_id" not in columns:
+                conn.execute(f"ALTER TABLE {table} RENAME TO {table}_v1")
+                for (index,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+                                             "AND sql IS NOT NULL", (f"{table}_v1",)).fetchall():
+                    conn.execute(f"DROP INDEX {index}") # the new table gets the same index names
+                old.append(table)
+        for table in ("crossings", "image_metadata"):
+            columns = _columns(conn, table)
+            if columns and "run_id" not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN run_id TEXT")
+    return old
+
+def _copy_back(conn, tables):
+    """Rows from before the migration keep their ids under run 'legacy'"""
+    with conn:
+        for table in tables:
+            key, column = KEYED_TABLES[table]
+            conn.execute(f"INSERT INTO {table} (camera, run_id, {key}, {column}, timestamp, synced) "
+                         f"SELECT COALESCE(camera, ''), 'legacy', {key}, {column}, timestamp, synced FROM {table}_v1")
+            conn.execute(f"DROP TABLE {table}_v1")
+
+def connect(path=None):
+    """New connection with WAL and the schema in place"""
+    path = path or DB_PATH
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL") # durable at checkpoints, no fsync per commit
+    old = _migrate(conn)
+    conn.executescript(SCHEMA)
+    _copy_back(conn, old)
+    return conn
+
+class _Writer(threading.Thread):
+    """Drains the save queue into batched transactions"""
+
+    def __init__(self, path):
+        super().__init__(daemon=True)
+        self.conn = connect(path)
+        self.queue = queue.Queue()
+        self.committed = 0
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None) # stop after this batch
+                    self.queue.task_done()
+                    break
+                batch.append(item)
+            self._commit(batch)
+            for _ in batch:
+                self.queue.task_done()
+        self.conn.close()
+
+    def _commit(self, batch):
+        by_statement = {}
+        for sql, params in batch:
+            by_statement.setdefault(sql, []).append(params)
+        try:
+            with self.conn: # one transaction per batch
+                for sql, rows in by_statement.items():
+                    self.conn.executemany(sql, rows)
+            self.committed += len(batch)
+        except sqlite3.Error as e:
+            print(f"Error saving {len(batch)} records to SQLite: {e}")
+
+_writer = None
+_writer_lock = threading.Lock()
+_local = threading.local()
+
+def configure(path):
+    """Use a different database file (call before the first save)"""
+    global DB_PATH
+    DB_PATH = path
+
+def _enqueue(sql, params):
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                try:
+                    writer = _Writer(DB_PATH)
+                except sqlite3.Error as e:
+                    print(f"SQLite connection error: {e}")
+                    return False
+                writer.start()
+                atexit.register(close)
+                _writer = writer
+    _writer.queue.put((sql, params))
+    return True
+
+def flush():
+    """Block until every queued save is committed"""
+    if _writer is not None:
+        _writer.queue.join()
+
+def close():
+    """Commit pending saves and stop the writer thread"""
+    global _writer
+    if _writer is None:
+        return
+    _writer.queue.put(None)
+    _writer.join(timeout=30)
+    _writer = None
+    atexit.unregister(close)
+
+def save_speed_data(vehicle_id, speed, camera=None):
+    """Save speed data to SQLite"""
+    return _enqueue(UPSERT_SPEED, (str(vehicle_id), float(speed), camera or "", RUN_ID, time.time()))
+
+def save_license_plate_data(plate_id, plate_number, camera=None, run_id=None):
+    """Save license plate data to SQLite (under another process's run with `run_id`, e.g. the detector's)"""
+    return _enqueue(UPSERT_PLATE, (str(plate_id), plate_number, camera or "", run_id or RUN_ID, time.time()))
+
+def plate_file_stem(vehicle_id, camera, run_id=None):
+    """Name for a vehicle's plate crop that carries its record key, so the OCR process can store the plate
+    under the detector's (camera, run, vehicle id)"""
+    return f"{camera}_{run_id or RUN_ID}_license_plate_{vehicle_id}"
+
+def parse_plate_file(stem):
+    """(camera, run_id, vehicle_id) from a plate crop name, or None for an old license_plate_<id> name"""
+    match = PLATE_FILE.match(stem)
+    return (match["camera"], match["run_id"], match["vehicle_id"]) if match else None
+
+def save_helmet_data(vehicle_id, is_wearing_helmet, camera=None):
+    """Save helmet data to SQLite"""
+    return _enqueue(UPSERT_HELMET, (str(vehicle_id), int(bool(is_wearing_helmet)), camera or "", RUN_ID, time.time()))
+
+def save_crossing(vehicle_id, camera, zone, class_name, direction, frame_time=None):
+    """Save one zone crossing to SQLite"""
+    return _enqueue(INSERT_CROSSING, (str(vehicle_id), camera, zone, class_name, direction, frame_time, time.time(), RUN_ID))
+
+def save_image_metadata(path, vehicle_id, camera, class_name, confidence, shape):
+    """Save where a crop was written and what it shows"""
+    return _enqueue(INSERT_IMAGE, (path, str(vehicle_id), camera, class_name, float(confidence),
+                                   int(shape[1]), int(shape[0]), time.time(), RUN_ID))
+
+############ queries ############
+def _reader():
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != DB_PATH:
+        conn = _local.conn = connect(DB_PATH)
+        _local.path = DB_PATH
+    return conn
+
+def get_speed(vehicle_id, camera=None, run_id=None):
+    """Speed of a track from this run (or `run_id`), on any camera unless one is given"""
+    sql = "SELECT speed FROM speed_data WHERE run_id = ? AND vehicle_id = ?"
+    params = [run_id or RUN_ID, str(vehicle_id)]
+    if camera is not None:
+        sql += " AND camera = ?"
+        params.append(camera)
+    row = _reader().execute(sql + " ORDER BY timestamp DESC LIMIT 1", params).fetchone()
+    return row[0] if row else None
+
+def find_plate(plate_number):
+    """(camera, run id, plate id) of plates whose OCR text matches (SQL LIKE pattern, e.g. 'MH12%')"""
+    rows = _reader().execute("SELECT camera, run_id, plate_id FROM license_plate_data WHERE plate_number LIKE ? "
+                             "ORDER BY timestamp", (plate_number,)).fetchall()
+    return [tuple(row) for row in rows]
+
+def crossings_since(timestamp, camera=None):
+    sql = "SELECT vehicle_id, camera, zone, class, direction, frame_time, timestamp FROM crossings WHERE timestamp >= ?"
+    params = [timestamp]
+    if camera is not None:
+        sql += " AND camera = ?"
+        params.append(camera)
+    return _reader().execute(sql + " ORDER BY timestamp", params).fetchall()
+
+############ sync to MongoDB ############
+def _ensure_mongo_key(collection, mongo_key):
+    """Unique index on (camera, runId, id), replacing a unique index on the id alone (the old server schema)"""
+    for name, index in collection.index_information().items():
+        if index.get("unique") and [field for field, _ in index["key"]] == [mongo_key]:
+            collection.drop_index(name)
+            print(f"MongoDB: dropped unique index {name} on {collection.name}.{mongo_key} (now unique per camera and run)")
+    collection.create_index([("camera", 1), ("runId", 1), (mongo_key, 1)], unique=True)
+
+def sync_to_mongo(limit=5000):
+    """Push unsynced rows to MongoDB; returns the number of rows synced (False if MongoDB is unreachable)"""
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+    from mongo_utils import get_database
+    db = get_database()
+    if db is None:
+        return False
+    conn = _reader()
+    synced = 0
+    upserts = [
+        ("speed_data", "vehicle_id", "speed", "vehicleId", "speed", float),
+        ("helmet_data", "vehicle_id", "is_wearing_helmet", "vehicleId", "isWearingHelmet", bool),
+        ("license_plate_data", "plate_id", "plate_number", "plateId", "plateNumber", str),
+    ]
+    try:
+        for table, key, column, mongo_key, mongo_field, cast in upserts:
+            rows = conn.execute(f"SELECT camera, run_id, {key}, {column}, timestamp FROM {table} WHERE synced = 0 LIMIT ?",
+                                (limit,)).fetchall()
+            if not rows:
+                continue
+            # the same key as the SQLite row: track ids only identify a vehicle within one camera's run
+            _ensure_mongo_key(db[table], mongo_key)
+            failed = set()
+            try:
+                db[table].bulk_write([
+                    UpdateOne({"camera": camera, "runId": run_id, mongo_key: row_id},
+                              {"$set": {mongo_field: cast(value), "timestamp": datetime.fromtimestamp(timestamp)}},
+                              upsert=True)
+                    for camera, run_id, row_id, value, timestamp in rows
+                ], ordered=False)
+            except BulkWriteError as e: # the other writes of an unordered batch went through
+                failed = {error["index"] for error in e.details["writeErrors"]}
+                print(f"Error syncing {len(failed)} {table} rows to MongoDB: {e.details['writeErrors'][0]['errmsg']}")
+            done = [(row[0], row[1], row[2], row[4]) for i, row in enumerate(rows) if i not in failed]
+            with conn:
+                # rows updated again since the SELECT keep synced = 0
+                conn.executemany(f"UPDATE {table} SET synced = 1 WHERE camera = ? AND run_id = ? AND {key} = ? AND timestamp = ?",
+                                 done)
+            synced += len(done)
+        for table in ("crossings", "image_metadata"):
+            cursor = conn.execute(f"SELECT * FROM {table} WHERE synced = 0 LIMIT ?", (limit,))
+            columns = [c[0] for c in cursor.description]
+            rows = cursor.fetchall()
+            if not rows:
+                continue
+            documents = []
+            for row in rows:
+                document = dict(zip(columns, row))
+                document.pop("synced")
+                document["timestamp"] = datetime.fromtimestamp(document["timestamp"])
+                documents.append(document)
+            db[table].insert_many(documents, ordered=False)
+            with conn:
+                conn.executemany(f"UPDATE {table} SET synced = 1 WHERE id = ?", [(row[0],) for row in rows])
+            synced += len(rows)
+    except Exception as e:
+        print(f"Error syncing to MongoDB: {e}")
+    print(f"Synced {synced} records to MongoDB")
+    return synced
+
+def benchmark(n=20000):
+    """Queue n mixed saves and time until they are committed"""
+    t = time.perf_counter()
+    for i in range(n):
+        kind = i % 4
+        if kind == 0:
+            save_speed_data(i, 40 + i % 50, camera="R1")
+        elif kind == 1:
+            save_helmet_data(i, i % 2 == 0, camera="R1")
+        elif kind == 2:
+            save_crossing(i, "R1", "line1", "car", "down", i / 30)
+        else:
+            save_license_plate_data(f"license_plate_{i}", f"MH12AB{i:04d}", camera="R1")
+    queued = time.perf_counter() - t
+    flush()
+    elapsed = time.perf_counter() - t
+    print(f"{n} saves: queued in {queued * 1000:.0f} ms, committed in {elapsed * 1000:.0f} ms "
+          f"({n / elapsed:.0f} records/s) -> {DB_PATH}")
+    t = time.perf_counter()
+    for i in range(0, n, 4):
+        get_speed(i)
+    print(f"{n // 4} lookups by vehicle id: {(time.perf_counter() - t) / (n // 4) * 1e6:.1f} us each")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', help='SQLite database file', default=DB_PATH)
+    parser.add_argument('--benchmark', help='Time N inserts', type=int, default=None)
+    parser.add_argument('--sync', help='Push unsynced rows to MongoDB', action='store_true')
+    parser.add_argument('--every', help='With --sync, keep syncing every N seconds', type=float, default=None)
+    args = parser.parse_args()
+    configure(args.db)
+    if args.benchmark:
+        benchmark(args.benchmark)
+        close()
+    if args.sync:
+        while True:
+            sync_to_mongo()
+            if not args.every:
+                break
+            time.sleep(args.every)
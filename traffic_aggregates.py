@@ -0,0 +1,81 @@
+"""
+Rolling traffic volumes per lane and class
+
+Counting-line crossings are added to fixed-width time buckets in a ring that
+covers the longest window. A running sum is kept for every window and updated
+as buckets enter and leave it, so adding a crossing is O(1) and reading the
+last minute / 15 minutes / hour does not rescan anything.
+
+Each R script publishes its lane's volumes next to the raw count in
+traffic.json, e.g. for R1:
+
+    "V1": {"1m": {"car": 4, "bike": 2, "bus": 0, "truck": 1},
+           "15m": {...}, "60m": {...}}
+"""
+
+import numpy as np
+
+WINDOWS = {"1m": 60, "15m": 900, "60m": 3600}
+VEHICLE_CLASSES = ["car", "bike", "bus", "truck"]
+
+class RollingCounts:
+    def __init__(self, class_names=VEHICLE_CLASSES, windows=WINDOWS, bucket_seconds=10):
+        self.class_names = list(class_names)
+        self.class_index = {name: i for i, name in enumerate(self.class_names)}
+        self.window_names = list(windows)
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = [max(1, int(round(seconds / bucket_seconds))) for seconds in windows.values()]
+        self.n_buckets = max(self.window_buckets)
+        self.buckets = np.zeros((self.n_buckets, len(self.class_names)), dtype=np.int64)
+        self.sums = np.zeros((len(self.window_buckets), len(self.class_names)), dtype=np.int64)
+        self.head = None # absolute index of the newest bucket
+        self.start = None
+
+    def _advance(self, t):
+        bucket = int(t // self.bucket_seconds)
+        if self.head is None:
+            self.head = bucket
+            self.start = t
+            return
+        if bucket <= self.head:
+            return # same bucket, or the clock went backwards (new video): keep counting in the newest bucket
+        if bucket - self.head >= self.n_buckets:
+            self.buckets[:] = 0
+            self.sums[:] = 0
+            self.head = bucket
+            return
+        while self.head < bucket:
+            self.head += 1
+            for w, k in enumerate(self.window_buckets):
+                # bucket head-k has just left window w (for the longest window that is the slot being reused)
+                self.sums[w] -= self.buckets[(self.head - k) % self.n_buckets]
+            self.buckets[self.head % self.n_buckets] = 0
+
+    def add(self, class_name, t, count=1):
+        """Record `count` crossings of `class_name` at time t (seconds); other classes are ignored"""
+        c = self.class_index.get(class_name)
+        if c is None:
+            return
+        self._advance(t)
+        self.buckets[self.head % self.n_buckets, c] += count
+        self.sums[:, c] += count
+
+    def totals(self, t, window="1m"):
+        """{class: crossings in the window ending at t}"""
+        self._advance(t)
+        return dict(zip(self.class_names, self.sums[self.window_names.index(window)].tolist()))
+
+    def rate(self, t, window="15m", class_name=None):
+        """Vehicles per minute over the window (or since the first crossing, if that is shorter)"""
+        self._advance(t)
+        w = self.window_names.index(window)
+        count = self.sums[w].sum() if class_name is None else self.sums[w, self.class_index[class_name]]
+        if self.start is None:
+            return 0.0
+        span = min(self.window_buckets[w] * self.bucket_seconds, max(t - self.start, self.bucket_seconds))
+        return float(count) * 60.0 / span
+
+    def snapshot(self, t):
+        """{window: {class: count}} for every window, as published in traffic.json"""
+        self._advance(t)
+        return {name: dict(zip(self.class_names, self.sums[w].tolist())) for w, name in enumerate(self.window_names)}
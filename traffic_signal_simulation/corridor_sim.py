@@ -0,0 +1,266 @@
+"""
+Vectorised simulation of many junctions
+
+The state of N four-approach junctions lives in NumPy arrays (queues,
+controller state, timers) and every junction advances with the same few
+array operations per time step. The controller is SignalFSM's state machine
+with the default bucketed policy, written over arrays: for the same lane
+counts at the same times it shows the same lamps as signal_fsm.SignalFSM
+(emergency preemption is not modelled here).
+
+Links connect an approach's discharge to an approach of another junction
+after a travel time; a fraction of the vehicles goes on, the rest turn off
+and leave. grid(rows, cols) builds a street grid (rows=1 is a corridor):
+approaches 0..3 are the traffic heading east, south, west and north, fed from
+outside at the edges of the grid and by the neighbouring junction inside it.
+
+    python corridor_sim.py --rows 1 --cols 20 --hours 24         # a 20-junction corridor for a day
+    python corridor_sim.py --rows 50 --cols 100 --benchmark      # steps per second for 5000 junctions
+"""
+
+import numpy as np
+from signal_policies import GREEN_TIMES, LONGEST_GREEN
+
+ALL_RED, GREEN, YELLOW, IDLE = range(4)
+STATE_NAMES = ("ALL_RED", "GREEN", "YELLOW", "IDLE") # the SignalFSM states
+N_APPROACHES = 4
+EAST, SOUTH, WEST, NORTH = range(N_APPROACHES)
+
+_LIMITS = np.array([limit for limit, _ in GREEN_TIMES])
+_SECONDS = np.array([seconds for _, seconds in GREEN_TIMES] + [LONGEST_GREEN], dtype=np.float64)
+
+def green_times(counts):
+    """signal_policies.green_time() over an array of counts"""
+    return _SECONDS[np.searchsorted(_LIMITS, counts, side="left")]
+
+class VectorController:
+    """SignalFSM (bucketed policy) for N junctions at once"""
+
+    def __init__(self, n, yellow_time=3, all_red_time=0, min_green=5):
+        self.n = n
+        self.yellow_time = yellow_time
+        self.all_red_time = all_red_time
+        self.min_green = min_green
+        self.rows = np.arange(n)
+        self.state = np.full(n, ALL_RED, dtype=np.int8)
+        self.lane = np.full(n, -1, dtype=np.int64)
+        self.next_lane = np.full(n, -1, dtype=np.int64)
+        self.extended = np.zeros(n, dtype=bool)
+        self.deadline = np.zeros(n)        # inf while idle
+        self.green_start = np.zeros(n)
+        self.countdown = np.zeros(n)
+        self.transitions = 0
+
+    def _green_time(self, idx, counts, lanes):
+        return np.maximum(green_times(counts[idx, lanes]), self.min_green)
+
+    def step(self, now, counts):
+        """Advance every junction to time `now` with counts of shape (n, approaches)"""
+        demand = counts.max(axis=1) > 0
+        best = counts.argmax(axis=1)
+
+        # GREEN: extend once while this lane still has the most traffic, otherwise yellow
+        idx = np.flatnonzero((self.state == GREEN) & (now >= self.deadline))
+        if len(idx):
+            lanes = self.lane[idx]
+            extend = ~self.extended[idx] & (counts[idx, lanes] > 0) & (best[idx] == lanes)
+            e = idx[extend]
+            self.extended[e] = True
+            self.countdown[e] = self._green_time(e, counts, self.lane[e]) + self.yellow_time
+            self.deadline[e] = now + self.countdown[e] - self.yellow_time
+            y = idx[~extend]
+            runner_up = counts[y].copy()
+            runner_up[np.arange(len(y)), self.lane[y]] = -1
+            choice = np.where(best[y] == self.lane[y], runner_up.argmax(axis=1), best[y])
+            self.next_lane[y] = np.where(demand[y], choice, -1)
+            self.deadline[y] = now + self.yellow_time
+            self.state[y] = YELLOW
+            self.transitions += len(idx)
+
+        # YELLOW -> ALL_RED
+        idx = np.flatnonzero((self.state == YELLOW) & (now >= self.deadline))
+        if len(idx):
+            self.lane[idx] = -1
+            self.deadline[idx] = now + self.all_red_time
+            self.state[idx] = ALL_RED
+            self.transitions += len(idx)
+
+        # ALL_RED -> IDLE without demand, else the chosen (or busiest) lane goes green; IDLE -> GREEN on demand
+        cleared = ((self.state == ALL_RED) & (now >= self.deadline)) | (self.state == IDLE)
+        idle = np.flatnonzero(cleared & ~demand & (self.state == ALL_RED))
+        if len(idle):
+            self.next_lane[idle] = -1
+            self.deadline[idle] = np.inf
+            self.state[idle] = IDLE
+            self.transitions += len(idle)
+        idx = np.flatnonzero(cleared & demand)
+        if len(idx):
+            lanes = np.where(self.next_lane[idx] >= 0, self.next_lane[idx], best[idx])
+            self.lane[idx] = lanes
+            self.next_lane[idx] = -1
+            self.extended[idx] = False
+            self.green_start[idx] = now
+            self.countdown[idx] = self._green_time(idx, counts, lanes)
+            self.deadline[idx] = now + self.countdown[idx] - self.yellow_time
+            self.state[idx] = GREEN
+            self.transitions += len(idx)
+
+    def discharging(self):
+        """(n, approaches) bool: approaches whose vehicles may go (green, or still yellow)"""
+        moving = np.zeros((self.n, N_APPROACHES), dtype=bool)
+        idx = np.flatnonzero((self.state == GREEN) | (self.state == YELLOW))
+        moving[idx, self.lane[idx]] = True
+        return moving
+
+    def lamps(self, k):
+        """Junction k's lamps in SignalFSM.lamps form"""
+        lamps = {}
+        for a in range(N_APPROACHES):
+            lamps[f"R{a+1}"], lamps[f"Y{a+1}"], lamps[f"G{a+1}"] = True, False, False
+        lane, state = self.lane[k], self.state[k]
+        if lane >= 0:
+            on = "Y" if state == YELLOW else "G"
+            lamps[f"R{lane+1}"] = False
+            lamps[f"{on}{lane+1}"] = True
+            if state == YELLOW and self.next_lane[k] >= 0:
+                lamps[f"R{self.next_lane[k]+1}"] = False
+                lamps[f"Y{self.next_lane[k]+1}"] = True
+        lamps["C"] = int(self.countdown[k]) if self.countdown[k] == int(self.countdown[k]) else self.countdown[k]
+        return lamps
+
+def grid(rows, cols, travel_time=30, through=0.7):
+    """Links of a rows x cols street grid: (src junction, src approach, dst junction, dst approach, travel steps, fraction)"""
+    links = []
+    for r in range(rows):
+        for c in range(cols):
+            j = r * cols + c
+            if c + 1 < cols:
+                links.append((j, EAST, j + 1, EAST))
+            if c > 0:
+                links.append((j, WEST, j - 1, WEST))
+            if r + 1 < rows:
+                links.append((j, SOUTH, j + cols, SOUTH))
+            if r > 0:
+                links.append((j, NORTH, j - cols, NORTH))
+    return [(src, a, dst, b, travel_time, through) for src, a, dst, b in links]
+
+def edge_rates(rows, cols, main=8.0, side=2.0):
+    """(n, approaches) external arrivals per minute: main road flows east/west, side streets south/north, entering at the edges"""
+    rates = np.zeros((rows, cols, N_APPROACHES))
+    rates[:, 0, EAST] = main
+    rates[:, -1, WEST] = main
+    rates[0, :, SOUTH] = side
+    rates[-1, :, NORTH] = side
+    return rates.reshape(rows * cols, N_APPROACHES)
+
+class NetworkSimulation:
+    def __init__(self, n, links, rates, dt=1.0, headway=2.0, lost_time=2.0, seed=0, controller=None):
+        self.n = n
+        self.dt = dt
+        self.headway = headway
+        self.lost_time = lost_time
+        self.rng = np.random.default_rng(seed)
+        self.controller = controller or VectorController(n)
+        self.rates = np.asarray(rates, dtype=np.float64) / 60.0 * dt # arrivals per step
+        self.queues = np.zeros((n, N_APPROACHES), dtype=np.int64)
+        self.credit = np.zeros((n, N_APPROACHES))                 # departures earned by green time
+        links = np.asarray(links, dtype=np.float64).reshape(-1, 6)
+        self.link_src = (links[:, 0] * N_APPROACHES + links[:, 1]).astype(np.int64)
+        self.link_dst = (links[:, 2] * N_APPROACHES + links[:, 3]).astype(np.int64)
+        self.link_steps = np.maximum(1, np.round(links[:, 4] / dt)).astype(np.int64)
+        self.link_fraction = links[:, 5]
+        # vehicles on the road between junctions, by the step they arrive at
+        self.in_transit = np.zeros((int(self.link_steps.max(initial=1)) + 1, n * N_APPROACHES), dtype=np.int64)
+        self.t = 0
+        self.now = 0.0
+        self.entered = 0
+        self.departed = 0
+        self.exited = 0
+        self.wait = 0.0 # vehicle-seconds spent queueing
+        self.max_queue = np.zeros(n, dtype=np.int64)
+
+    def step(self):
+        ring = len(self.in_transit)
+        flat = self.queues.reshape(-1)
+        # arrivals from outside and from upstream junctions
+        external = self.rng.poisson(self.rates)
+        self.entered += int(external.sum())
+        self.queues += external
+        slot = self.t % ring
+        flat += self.in_transit[slot]
+        self.in_transit[slot] = 0
+
+        self.controller.step(self.now, self.queues)
+
+        # discharge at the saturation headway once the start-up lost time is over
+        moving = self.controller.discharging()
+        moving &= (self.now - self.controller.green_start >= self.lost_time)[:, None]
+        self.credit = np.where(moving, self.credit + self.dt / self.headway, 0.0)
+        departures = np.minimum(self.queues, self.credit.astype(np.int64))
+        self.credit -= departures
+        self.credit[self.queues == departures] = 0.0 # no banking green time on an empty lane
+        self.queues -= departures
+        self.departed += int(departures.sum())
+
+        # part of the departures continue to the next junction
+        sent = self.rng.binomial(departures.reshape(-1)[self.link_src], self.link_fraction)
+        np.add.at(self.in_transit, ((self.t + self.link_steps) % ring, self.link_dst), sent)
+        self.exited += int(departures.sum()) - int(sent.sum())
+
+        np.maximum(self.max_queue, self.queues.max(axis=1), out=self.max_queue)
+        self.wait += float(self.queues.sum()) * self.dt
+        self.t += 1
+        self.now += self.dt
+
+    def run(self, seconds):
+        for _ in range(int(round(seconds / self.dt))):
+            self.step()
+        return self.report()
+
+    def report(self):
+        hours = self.now / 3600.0
+        return {
+            "junctions": self.n,
+            "simulated_hours": hours,
+            "entered": self.entered,
+            "exited": self.exited,
+            "departures_per_junction_hour": self.departed / max(self.n * hours, 1e-9),
+            "avg_delay_per_stop": self.wait / max(self.departed, 1),
+            "max_queue": int(self.max_queue.max(initial=0)),
+            "waiting_at_end": int(self.queues.sum()),
+            "in_transit_at_end": int(self.in_transit.sum()),
+            "transitions": self.controller.transitions,
+        }
+
+def benchmark(rows, cols, steps=600, seed=0):
+    import time
+    sim = NetworkSimulation(rows * cols, grid(rows, cols), edge_rates(rows, cols), seed=seed)
+    sim.run(60) # warm up
+    t = time.perf_counter()
+    for _ in range(steps):
+        sim.step()
+    elapsed = time.perf_counter() - t
+    print(f"{rows * cols} junctions: {steps / elapsed:.0f} steps/s, "
+          f"{rows * cols * steps / elapsed:.0f} junction-steps/s")
+
+if __name__ == "__main__":
+    import json
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', help='Junctions north-south', type=int, default=1)
+    parser.add_argument('--cols', help='Junctions east-west', type=int, default=20)
+    parser.add_argument('--hours', help='Simulated hours', type=float, default=24)
+    parser.add_argument('--main', help='Arrivals per minute entering along the main (east-west) roads', type=float, default=8.0)
+    parser.add_argument('--side', help='Arrivals per minute entering along the side (north-south) streets', type=float, default=2.0)
+    parser.add_argument('--travel-time', help='Seconds between neighbouring junctions', type=float, default=30)
+    parser.add_argument('--through', help='Fraction of vehicles going on to the next junction', type=float, default=0.7)
+    parser.add_argument('--seed', help='Random seed', type=int, default=0)
+    parser.add_argument('--benchmark', help='Measure steps per second instead', action='store_true')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.rows, args.cols)
+    else:
+        n = args.rows * args.cols
+        sim = NetworkSimulation(n, grid(args.rows, args.cols, args.travel_time, args.through),
+                                edge_rates(args.rows, args.cols, args.main, args.side), seed=args.seed)
+        print(json.dumps(sim.run(args.hours * 3600), indent=4))
@@ -0,0 +1,244 @@
+"""
+Discrete-event simulation of the junction on a virtual clock
+
+The controller is the same SignalFSM that simulation.py runs, stepped at
+every event instead of on the wall clock, so a day of operation takes seconds.
+Vehicles arrive per approach as Poisson processes (or replayed from a
+recorded trace), queue, and leave while their approach is green or yellow at
+the saturation headway after a start-up lost time. The controller sees the queue
+lengths as the lane counts, and emergency vehicles raise the lane's A flag
+until they are through.
+
+    python des_simulation.py --hours 24 --rates 6,3,8,2 --emergencies-per-day 6
+    python des_simulation.py --trace ../local_data/events.jsonl
+
+Trace files are JSON lines, either crossing events from the event journal
+(event_log.py; camera R1..R4 is approach 1..4) or traffic.json snapshots with
+a time field "t" and T1..T4, where every increase of Tn counts as arrivals.
+"""
+
+import heapq
+import json
+import math
+import random
+from collections import deque
+import numpy as np
+from signal_fsm import SignalFSM, GREEN, YELLOW, EMERGENCY
+
+ARRIVAL, DISCHARGE, CONTROL, EMERGENCY_ARRIVAL = range(4) # also the order of events at the same instant
+
+def load_trace(path, n_approaches=4):
+    """[(time, approach)] arrivals from a journal or snapshot trace, starting at time 0"""
+    arrivals = []
+    last = None
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("type") == "crossing":
+                camera = str(record.get("camera") or "")
+                if camera[1:].isdigit() and 1 <= int(camera[1:]) <= n_approaches:
+                    arrivals.append((float(record["t"]), int(camera[1:]) - 1))
+            elif "T1" in record and "t" in record:
+                counts = [record.get(f"T{i+1}", 0) for i in range(n_approaches)]
+                if last is not None:
+                    for lane, (new, old) in enumerate(zip(counts, last)):
+                        arrivals.extend((float(record["t"]), lane) for _ in range(max(0, new - old)))
+                last = counts
+    arrivals.sort()
+    if arrivals:
+        t0 = arrivals[0][0]
+        arrivals = [(t - t0, lane) for t, lane in arrivals]
+    return arrivals
+
+class JunctionSimulation:
+    def __init__(self, rates=(0.1, 0.1, 0.1, 0.1), trace=None, emergencies_per_day=0.0,
+                 headway=2.0, lost_time=2.0, seed=0, fsm=None):
+        self.n = len(rates) if trace is None else max(4, len(rates))
+        self.rates = list(rates) # vehicles per second per approach
+        self.trace = trace
+        self.emergency_rate = emergencies_per_day / 86400.0
+        self.headway = headway
+        self.lost_time = lost_time
+        self.rng = random.Random(seed)
+        self.fsm = fsm or SignalFSM(self.n)
+        self.events = []
+        self.seq = 0
+        self.now = 0.0
+        self.queues = [deque() for _ in range(self.n)] # arrival times of waiting vehicles
+        self.counts = [0] * self.n
+        self.flags = [0] * self.n # emergency vehicles waiting per approach; they overtake the queue
+        self.green = None         # approach currently discharging
+        self.epoch = 0            # bumps on every green change, stale discharge events are ignored
+        self.discharging = [False] * self.n
+        self.delays = [[] for _ in range(self.n)]
+        self.max_queue = [0] * self.n
+        self.arrived = [0] * self.n
+        self.emergency_raised = [deque() for _ in range(self.n)]
+        self.response_times = []
+        self.green_changes = 0
+        self.last_control = None
+
+    def _push(self, t, kind, lane=0, token=0):
+        self.seq += 1
+        heapq.heappush(self.events, (t, kind, self.seq, lane, token))
+
+    def _schedule_arrivals(self, end):
+        if self.trace is not None:
+            for t, lane in self.trace:
+                if t <= end:
+                    self._push(t, ARRIVAL, lane)
+        else:
+            for lane, rate in enumerate(self.rates):
+                if rate > 0:
+                    self._push(self.rng.expovariate(rate), ARRIVAL, lane)
+        if self.emergency_rate > 0:
+            self._push(self.rng.expovariate(self.emergency_rate), EMERGENCY_ARRIVAL)
+
+    ############ events ############
+    def _arrival(self, lane):
+        self.queues[lane].append(self.now)
+        self.arrived[lane] += 1
+        self.counts[lane] += 1
+        self.max_queue[lane] = max(self.max_queue[lane], self.counts[lane])
+        if self.trace is None:
+            self._push(self.now + self.rng.expovariate(self.rates[lane]), ARRIVAL, lane)
+        if lane == self.green and not self.discharging[lane]:
+            self._push(self.now + self.headway, DISCHARGE, lane, self.epoch)
+            self.discharging[lane] = True
+
+    def _emergency_arrival(self):
+        lane = self.rng.randrange(self.n)
+        self.flags[lane] += 1
+        self.emergency_raised[lane].append(self.now)
+        self._push(self.now + self.rng.expovariate(self.emergency_rate), EMERGENCY_ARRIVAL)
+        if lane == self.green:
+            self.response_times.append(0.0)
+            self.emergency_raised[lane].popleft()
+            if not self.discharging[lane]:
+                self._push(self.now + self.headway, DISCHARGE, lane, self.epoch)
+                self.discharging[lane] = True
+
+    def _discharge(self, lane, token):
+        if token != self.epoch or lane != self.green:
+            return
+        if self.flags[lane]:
+            self.flags[lane] -= 1
+        elif self.queues[lane]:
+            self.counts[lane] -= 1
+            self.delays[lane].append(self.now - self.queues[lane].popleft())
+        else:
+            self.discharging[lane] = False
+            return
+        self._push(self.now + self.headway, DISCHARGE, lane, token)
+
+    ############ controller ############
+    def _control(self):
+        self.fsm.step(self.now, self.counts, self.flags)
+        state = self.fsm.state
+        green = self.fsm.lane if state in (GREEN, YELLOW, EMERGENCY) else None # vehicles keep going on yellow
+        if green != self.green:
+            self.green = green
+            self.epoch += 1
+            self.green_changes += 1
+            self.discharging = [False] * self.n
+            if green is not None:
+                while self.emergency_raised[green]:
+                    self.response_times.append(self.now - self.emergency_raised[green].popleft())
+                if self.queues[green] or self.flags[green]:
+                    self._push(self.now + self.lost_time + self.headway, DISCHARGE, green, self.epoch)
+                    self.discharging[green] = True
+        deadline = self.fsm.next_deadline()
+        if deadline is not None and deadline != self.last_control:
+            self.last_control = deadline
+            self._push(deadline, CONTROL)
+
+    def run(self, seconds):
+        """Simulate `seconds` of operation; returns the report dict"""
+        self._schedule_arrivals(seconds)
+        self._control()
+        handlers = {
+            ARRIVAL: lambda lane, token: self._arrival(lane),
+            DISCHARGE: self._discharge,
+            CONTROL: lambda lane, token: None,
+            EMERGENCY_ARRIVAL: lambda lane, token: self._emergency_arrival(),
+        }
+        while self.events:
+            t, kind, _, lane, token = heapq.heappop(self.events)
+            if t > seconds:
+                break
+            self.now = t
+            handlers[kind](lane, token)
+            self._control()
+        self.now = seconds
+        return self.report(seconds)
+
+    def report(self, seconds):
+        lanes = []
+        for lane in range(self.n):
+            delays = np.asarray(self.delays[lane])
+            lanes.append({
+                "arrived": self.arrived[lane],
+                "departed": len(delays),
+                "throughput_per_hour": len(delays) * 3600.0 / seconds,
+                "avg_delay": float(delays.mean()) if len(delays) else 0.0,
+                "p95_delay": float(np.percentile(delays, 95)) if len(delays) else 0.0,
+                "max_queue": self.max_queue[lane],
+                "queue_at_end": self.counts[lane],
+            })
+        all_delays = np.concatenate([np.asarray(d) for d in self.delays]) if any(self.delays) else np.zeros(0)
+        response = np.asarray(self.response_times)
+        return {
+            "simulated_hours": seconds / 3600.0,
+            "lanes": lanes,
+            "throughput_per_hour": len(all_delays) * 3600.0 / seconds,
+            "avg_delay": float(all_delays.mean()) if len(all_delays) else 0.0,
+            "max_queue": max(self.max_queue),
+            "green_changes": self.green_changes,
+            "fsm_transitions": self.fsm.transitions,
+            "emergencies": len(response),
+            "emergency_response_avg": float(response.mean()) if len(response) else None,
+            "emergency_response_max": float(response.max()) if len(response) else None,
+        }
+
+def print_report(report, elapsed=None):
+    speed = f" in {elapsed:.2f} s ({report['simulated_hours'] * 3600 / elapsed:.0f}x real time)" if elapsed else ""
+    print(f"Simulated {report['simulated_hours']:.1f} h{speed}")
+    print(f"{'lane':>4} {'arrived':>8} {'departed':>8} {'veh/h':>7} {'avg delay':>9} {'p95 delay':>9} {'max queue':>9}")
+    for k, lane in enumerate(report["lanes"]):
+        print(f"{k+1:>4} {lane['arrived']:>8} {lane['departed']:>8} {lane['throughput_per_hour']:>7.0f} "
+              f"{lane['avg_delay']:>8.1f}s {lane['p95_delay']:>8.1f}s {lane['max_queue']:>9}")
+    print(f"total throughput {report['throughput_per_hour']:.0f} veh/h, average delay {report['avg_delay']:.1f} s, "
+          f"max queue {report['max_queue']}, {report['green_changes']} green changes")
+    if report["emergencies"]:
+        print(f"{report['emergencies']} emergencies, response avg {report['emergency_response_avg']:.1f} s, "
+              f"max {report['emergency_response_max']:.1f} s")
+
+if __name__ == "__main__":
+    import time
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', help='Simulated time in hours', type=float, default=24)
+    parser.add_argument('--rates', help='Arrivals per minute for each approach (example: "6,3,8,2")', default="6,3,8,2")
+    parser.add_argument('--trace', help='Replay arrivals from an event journal or traffic.json snapshot trace', default=None)
+    parser.add_argument('--emergencies-per-day', help='Average number of emergency vehicles per day', type=float, default=6)
+    parser.add_argument('--headway', help='Saturation headway in seconds', type=float, default=2.0)
+    parser.add_argument('--lost-time', help='Start-up lost time at the beginning of green, in seconds', type=float, default=2.0)
+    parser.add_argument('--seed', help='Random seed', type=int, default=0)
+    parser.add_argument('--json', help='Print the report as JSON', action='store_true')
+    args = parser.parse_args()
+    rates = [float(r) / 60.0 for r in args.rates.split(',')]
+    trace = load_trace(args.trace, len(rates)) if args.trace else None
+    seconds = args.hours * 3600
+    if trace:
+        seconds = min(seconds, math.ceil(trace[-1][0]) + 60)
+    sim = JunctionSimulation(rates, trace, args.emergencies_per_day, args.headway, args.lost_time, args.seed)
+    t = time.perf_counter()
+    report = sim.run(seconds)
+    elapsed = time.perf_counter() - t
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print_report(report, elapsed)
@@ -0,0 +1,173 @@
+"""
+GPIO access for the signal display
+
+LgpioGPIO drives the Raspberry Pi pins through lgpio; SimulatedGPIO keeps the
+pin levels in memory and records every write and every level change with a
+perf_counter timestamp, so watch_signals.py can run, be profiled and be tuned
+without a Pi. Both have the same small interface:
+
+    claim_output(pin)          write(pin, level)
+    group_claim_output(pins)   group_write(first_pin, bits)   bit i -> pins[i]
+    close()
+
+watch_signals.py picks the simulated backend with GPIO_BACKEND=sim.
+
+The benchmark runs the real watch_signals display path on the simulated
+backend against a signal_state.bin written in a temporary folder, and reports
+the multiplex refresh rate, the refresh jitter and the lamp-update latency
+from a signal-state write to the lamp pins changing:
+
+    python gpio_hal.py --seconds 10 --changes 50
+"""
+
+import os
+import time
+import threading
+from collections import deque
+
+class LgpioGPIO:
+    def __init__(self, chip=0):
+        import lgpio
+        self.lgpio = lgpio
+        self.handle = lgpio.gpiochip_open(chip)
+
+    def claim_output(self, pin):
+        self.lgpio.gpio_claim_output(self.handle, pin)
+
+    def write(self, pin, level):
+        self.lgpio.gpio_write(self.handle, pin, level)
+
+    def group_claim_output(self, pins):
+        self.lgpio.gpio_group_claim_output(self.handle, pins)
+
+    def group_write(self, first_pin, bits):
+        self.lgpio.gpio_group_write(self.handle, first_pin, bits)
+
+    def close(self):
+        self.lgpio.gpiochip_close(self.handle)
+
+class SimulatedGPIO:
+    """In-memory pins; `writes` holds (time, pin or group leader, value), `transitions` (time, pin, level)"""
+
+    def __init__(self, history=200000):
+        self.levels = {}
+        self.groups = {}
+        self.writes = deque(maxlen=history)
+        self.transitions = deque(maxlen=history)
+        self.lock = threading.Lock()
+
+    def claim_output(self, pin):
+        if pin in self.levels:
+            raise RuntimeError(f"GPIO {pin} already claimed")
+        self.levels[pin] = 0
+
+    def group_claim_output(self, pins):
+        for pin in pins:
+            self.claim_output(pin)
+        self.groups[pins[0]] = list(pins)
+
+    def _set(self, t, pin, level):
+        if self.levels[pin] != level:
+            self.levels[pin] = level
+            self.transitions.append((t, pin, level))
+
+    def write(self, pin, level):
+        t = time.perf_counter()
+        with self.lock:
+            self.writes.append((t, pin, level))
+            self._set(t, pin, 1 if level else 0)
+
+    def group_write(self, first_pin, bits):
+        t = time.perf_counter()
+        with self.lock:
+            self.writes.append((t, first_pin, bits))
+            for i, pin in enumerate(self.groups[first_pin]):
+                self._set(t, pin, (bits >> i) & 1)
+
+    def close(self):
+        pass
+
+def open_gpio(simulated=None, chip=0):
+    """lgpio on the Pi, or SimulatedGPIO when asked for (default: GPIO_BACKEND=sim in the environment)"""
+    if simulated is None:
+        simulated = os.environ.get("GPIO_BACKEND", "lgpio") == "sim"
+    return SimulatedGPIO() if simulated else LgpioGPIO(chip)
+
+############ benchmark ############
+class _Phase:
+    """Enough of SignalFSM for SignalStateWriter.publish()"""
+    yellow_time = 3
+
+    def __init__(self, n_approaches=4):
+        self.n = n_approaches
+        self.state = "GREEN"
+        self.lane = 0
+        self.countdown = 20
+        self.deadline = 0.0
+        self.lamps = {}
+
+    def next_deadline(self):
+        return self.deadline
+
+    def go(self, lane, now):
+        self.lane = lane
+        self.deadline = now + self.countdown - self.yellow_time
+        self.lamps = {f"{c}{k+1}": (c == "G") == (k == lane) for c in "RG" for k in range(self.n)}
+
+def benchmark(seconds=10.0, changes=50):
+    import sys
+    import tempfile
+    import importlib
+    import numpy as np
+    folder = tempfile.mkdtemp(prefix="signals_")
+    os.environ["GPIO_BACKEND"] = "sim"
+    os.environ["SIGNAL_FOLDER"] = folder
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    watch_signals = importlib.import_module("watch_signals")
+    from signal_state import SignalStateWriter
+    gpio = watch_signals.gpio
+    lamp_pins = set(watch_signals.traffic_lights)
+    observer = watch_signals.start_watching()
+    writer = SignalStateWriter(watch_signals.STATE_PATH)
+    phase = _Phase()
+
+    latencies = []
+    interval = seconds / changes
+    start = time.perf_counter()
+    for k in range(changes):
+        lane = k % phase.n
+        phase.go(lane, time.monotonic())
+        green_pin = watch_signals.traffic_lights[phase.n + lane]
+        sent = time.perf_counter()
+        writer.publish(phase)
+        while time.perf_counter() - sent < 1.0: # the lamp must come on through the file event
+            if gpio.levels[green_pin]:
+                break
+            time.sleep(0.0002)
+        switched = [t for t, pin, level in list(gpio.transitions) if pin == green_pin and level and t >= sent]
+        latencies.append((switched[0] - sent) * 1000 if switched else float("nan"))
+        time.sleep(max(0.0, start + (k + 1) * interval - time.perf_counter()))
+    watch_signals.display.running = False
+    observer.stop()
+    observer.join()
+
+    leader = watch_signals.SEGMENT_GROUP[0]
+    ticks = np.array([t for t, pin, _ in list(gpio.writes) if pin == leader])
+    periods = np.diff(ticks) * 1000
+    latencies = np.array(latencies)
+    lamp_writes = sum(1 for _, pin, _ in list(gpio.writes) if pin in lamp_pins)
+    print(f"display: {len(ticks) / (ticks[-1] - ticks[0]):.1f} digit refreshes/s "
+          f"(target {1 / watch_signals.display.period:.0f}), period {periods.mean():.3f} ms, "
+          f"jitter std {periods.std():.3f} ms, p99 |error| {np.percentile(np.abs(periods - periods.mean()), 99):.3f} ms, "
+          f"max {periods.max():.3f} ms")
+    print(f"lamps: {changes} state changes, {lamp_writes} lamp writes, latency p50 {np.nanpercentile(latencies, 50):.2f} ms, "
+          f"p95 {np.nanpercentile(latencies, 95):.2f} ms, max {np.nanmax(latencies):.2f} ms, "
+          f"{int(np.isnan(latencies).sum())} missed")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', help='Benchmark duration', type=float, default=10)
+    parser.add_argument('--changes', help='Signal state changes to publish', type=int, default=50)
+    args = parser.parse_args()
+    benchmark(args.seconds, args.changes)
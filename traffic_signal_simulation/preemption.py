@@ -0,0 +1,167 @@
+"""
+Emergency preemption channel
+
+Detectors and operators raise or clear an emergency for an approach with one
+UDP datagram to the controller instead of waiting for the next traffic.json
+read:
+
+    {"id": "...", "lane": 2, "action": "raise" | "clear", "sent": <time.time() at the sender>}
+
+PreemptionServer (started by simulation.py) sets A<lane> in traffic.json,
+queues the request and wakes the controller loop; once the controller has stepped and written the
+lamps it replies to the sender with the resulting state and the end-to-end
+latency, and appends the request to the preemption log (JSON lines):
+
+    {"id", "lane", "action", "sent", "received", "switched", "state", "green", "latency_ms", "handling_ms"}
+
+latency_ms is measured from the sender's clock (meaningful on the same host
+or with NTP), handling_ms from the moment the datagram arrived.
+
+Operator tool:
+
+    python preemption.py raise 2               # emergency on approach 2
+    python preemption.py clear 2
+    python preemption.py bench --count 100     # round-trip latency against a running controller
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from collections import deque
+
+DEFAULT_PORT = 9200
+ACTIONS = ("raise", "clear")
+
+class PreemptionServer:
+    def __init__(self, on_request, host="127.0.0.1", port=DEFAULT_PORT, log_path=None, n_approaches=4, wake=None):
+        """on_request(lane, active) is called from the listener thread for every valid request,
+        wake() once the request is pending, so the controller never sees the flag without the request"""
+        self.on_request = on_request
+        self.wake = wake
+        self.n_approaches = n_approaches
+        self.log_path = log_path
+        self.pending = deque() # requests applied, waiting for the controller to switch
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.running = True
+        self.thread = threading.Thread(target=self._listen, daemon=True)
+        self.thread.start()
+        print(f"Preemption channel on udp://{host}:{self.sock.getsockname()[1]}")
+
+    def _listen(self):
+        while self.running:
+            try:
+                data, address = self.sock.recvfrom(4096)
+            except OSError:
+                break # socket closed
+            received = time.time()
+            try:
+                request = json.loads(data)
+                lane = int(request["lane"])
+                action = request.get("action", "raise")
+                if action not in ACTIONS or not 1 <= lane <= self.n_approaches:
+                    raise ValueError(f"bad request {request}")
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply(address, {"ok": False, "error": str(e)})
+                continue
+            request.update(lane=lane, action=action, received=received, address=address)
+            request.setdefault("id", uuid.uuid4().hex)
+            request.setdefault("sent", received)
+            self.on_request(lane, action == "raise")
+            self.pending.append(request) # only now, so complete() answers with lamps that reflect it
+            if self.wake is not None:
+                self.wake()
+
+    def _reply(self, address, message):
+        try:
+            self.sock.sendto(json.dumps(message).encode(), address)
+        except OSError as e:
+            print(f"[ERROR] preemption reply: {e}")
+
+    def complete(self, state, lane, count=None):
+        """Called by the controller after it stepped and wrote the lamps: log and answer the first `count`
+        requests taken in (those pending before it read traffic.json), or all of them"""
+        switched = time.time()
+        records = []
+        count = len(self.pending) if count is None else count
+        for _ in range(count):
+            request = self.pending.popleft()
+            record = {
+                "id": request["id"],
+                "lane": request["lane"],
+                "action": request["action"],
+                "sent": request["sent"],
+                "received": request["received"],
+                "switched": switched,
+                "state": state,
+                "green": lane,
+                "latency_ms": round((switched - request["sent"]) * 1000, 3),
+                "handling_ms": round((switched - request["received"]) * 1000, 3),
+            }
+            self._reply(request["address"], dict(record, ok=True))
+            records.append(record)
+            print(f"Preemption {record['action']} approach {record['lane']}: {state}, {record['latency_ms']:.1f} ms")
+        if records and self.log_path:
+            with open(self.log_path, "a") as file:
+                file.write("".join(json.dumps(record) + "\n" for record in records))
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+
+def send_preemption(lane, action="raise", host="127.0.0.1", port=DEFAULT_PORT, timeout=1.0, retries=2):
+    """Raise or clear an emergency on approach `lane` (1-based); returns the controller's reply, or None if it did not answer"""
+    request = {"id": uuid.uuid4().hex, "lane": lane, "action": action}
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        for _ in range(retries + 1):
+            request["sent"] = time.time()
+            sock.sendto(json.dumps(request).encode(), (host, port))
+            try:
+                while True:
+                    reply = json.loads(sock.recv(4096))
+                    if reply.get("id") == request["id"] or not reply.get("ok", True):
+                        return reply
+            except socket.timeout:
+                continue
+    return None
+
+def bench(count, lane, host, port):
+    """Raise and clear `count` times and report the end-to-end switching latency"""
+    import numpy as np
+    latencies = []
+    for k in range(count):
+        for action in ACTIONS:
+            reply = send_preemption(lane, action, host, port)
+            if reply is None or not reply.get("ok"):
+                print(f"no answer ({reply})")
+                return
+            latencies.append(reply["latency_ms"])
+    latencies = np.asarray(latencies)
+    print(f"{len(latencies)} requests: p50 {np.percentile(latencies, 50):.2f} ms, "
+          f"p95 {np.percentile(latencies, 95):.2f} ms, max {latencies.max():.2f} ms, "
+          f"{(latencies > 100).sum()} over 100 ms")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('action', choices=ACTIONS + ("bench",), help='Raise or clear an emergency, or measure latency')
+    parser.add_argument('lane', help='Approach number (1-4)', type=int, nargs='?', default=1)
+    parser.add_argument('--host', help='Controller address', default=os.environ.get("PREEMPT_HOST", "127.0.0.1"))
+    parser.add_argument('--port', help='Controller preemption port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--count', help='Raise/clear pairs for bench', type=int, default=50)
+    args = parser.parse_args()
+    if args.action == "bench":
+        bench(args.count, args.lane, args.host, args.port)
+    else:
+        reply = send_preemption(args.lane, args.action, args.host, args.port)
+        if reply is None:
+            print("Controller did not answer")
+        elif not reply.get("ok"):
+            print(f"Rejected: {reply.get('error')}")
+        else:
+            print(f"{args.action} approach {args.lane}: {reply['state']}"
+                  f"{'' if reply['green'] is None else ' approach ' + str(reply['green'])}, {reply['latency_ms']:.1f} ms")
@@ -0,0 +1,254 @@
+"""
+Signal controller as an explicit finite-state machine
+
+States:
+
+    ALL_RED    every approach red for the clearance time, then the next green
+    GREEN      one approach green until its green time (minus the yellow) is up
+    YELLOW     the green approach yellow; the approach that goes next shows yellow too
+    EMERGENCY  the approach with an emergency vehicle green, every other red
+    IDLE       all red, waiting for any approach to report traffic
+
+An emergency preempts a running green through its yellow (the emergency
+approach shows yellow alongside), then the all-red clearance; only from all
+red or idle does the emergency green come up directly. The hold ends through a
+yellow as well.
+
+Transitions are the TRANSITIONS table: (states, condition, next state,
+action), checked in order; the first one whose condition holds fires.
+step() is pure: it only looks at the time and inputs it is given, so the same
+inputs always give the same lamps, it can be driven by a real clock or a
+simulated one, and it runs in constant memory for any number of phases.
+
+Which approach goes next, for how long, and whether a green is extended is
+up to the policy (signal_policies.py). The default, BucketedPolicy, is the old
+find_max() rule: up to 3 vehicles 5 s, up to 5 10 s, up to 7 15 s, more 20 s;
+a lane still holding the most traffic when its green ends is extended once,
+after that the lane with the next most traffic goes.
+
+Given a topology (topology.py), the "lanes" are the topology's phases: counts
+and emergency flags are per phase (Topology.phase_demand / phase_flags) and
+the lamps light every approach of the phase.
+
+    python signal_fsm.py --steps 1000000   # transition throughput benchmark
+"""
+
+import math
+from signal_policies import BucketedPolicy
+from topology import Topology
+
+ALL_RED, GREEN, YELLOW, EMERGENCY, IDLE = "ALL_RED", "GREEN", "YELLOW", "EMERGENCY", "IDLE"
+STATES = (ALL_RED, GREEN, YELLOW, EMERGENCY, IDLE)
+# (from states, condition, to state, action)
+TRANSITIONS = (
+    ((GREEN,), "emergency_here", EMERGENCY, "enter_emergency"),
+    ((GREEN,), "emergency_raised", YELLOW, "enter_preempt_yellow"),
+    ((YELLOW,), "emergency_not_next", YELLOW, "retarget_yellow"),
+    ((ALL_RED,), "cleared_for_emergency", EMERGENCY, "enter_emergency"),
+    ((IDLE,), "emergency_raised", EMERGENCY, "enter_emergency"),
+    ((EMERGENCY,), "emergency_continues", EMERGENCY, "enter_emergency"),
+    ((EMERGENCY,), "emergency_moved", YELLOW, "enter_preempt_yellow"),
+    ((EMERGENCY,), "expired", YELLOW, "enter_yellow"),
+    ((GREEN,), "should_extend", GREEN, "extend_green"),
+    ((GREEN,), "expired", YELLOW, "enter_yellow"),
+    ((YELLOW,), "expired", ALL_RED, "enter_all_red"),
+    ((ALL_RED,), "cleared_without_demand", IDLE, "enter_idle"),
+    ((ALL_RED,), "expired", GREEN, "enter_green"),
+    ((IDLE,), "demand", GREEN, "enter_green"),
+)
+
+class SignalFSM:
+    def __init__(self, n_approaches=4, yellow_time=3, all_red_time=0, min_green=5, policy=None, topology=None):
+        self.topology = topology or Topology.single(n_approaches)
+        self.n = self.topology.n_phases
+        self.policy = policy or BucketedPolicy()
+        self.yellow_time = yellow_time
+        self.all_red_time = all_red_time
+        self.min_green = min_green
+        self.state = ALL_RED
+        self.lane = None       # approach (0-based) showing green / yellow / emergency green
+        self.next_lane = None  # approach chosen to go next at the start of the yellow
+        self.extended = False
+        self.green_start = 0.0 # when the current green began
+        self.deadline = 0.0    # when the current state's time is up (None: no timer)
+        self.countdown = 0     # seconds of the current phase, published as C
+        self.transitions = 0
+        self.now = 0.0
+        self.counts = [0] * self.n
+        self.emergencies = [False] * self.n
+        self.lamps = {}
+        self._update_lamps()
+        # TRANSITIONS resolved to bound methods, per source state
+        self._rules = {state: [(getattr(self, "_" + condition), target, getattr(self, "_" + action))
+                               for states, condition, target, action in TRANSITIONS if state in states]
+                       for state in STATES}
+
+    ############ conditions ############
+    def _expired(self):
+        return self.deadline is not None and self.now >= self.deadline
+
+    def _emergency_lane(self):
+        """Approach the emergency green is for: the one being held while its flag stays up, else the lowest-numbered one flagged"""
+        if self.state == EMERGENCY and self.emergencies[self.lane]:
+            return self.lane
+        for lane, flag in enumerate(self.emergencies):
+            if flag:
+                return lane
+        return None
+
+    def _emergency_raised(self):
+        return any(self.emergencies)
+
+    def _emergency_here(self):
+        return bool(self.emergencies[self.lane])
+
+    def _emergency_not_next(self):
+        return any(self.emergencies) and self.next_lane != self._emergency_lane()
+
+    def _cleared_for_emergency(self):
+        return self._expired() and any(self.emergencies)
+
+    def _emergency_continues(self):
+        return self._expired() and bool(self.emergencies[self.lane])
+
+    def _emergency_moved(self):
+        return not self.emergencies[self.lane] and any(self.emergencies)
+
+    def _demand(self):
+        return max(self.counts) > 0
+
+    def _cleared_without_demand(self):
+        return self._expired() and not self._demand()
+
+    def _should_extend(self):
+        return self._expired() and self.policy.should_extend(self)
+
+    ############ actions ############
+    def _enter_green(self):
+        lane = self.next_lane if self.next_lane is not None else self.policy.choose(self)
+        self.lane = lane
+        self.next_lane = None
+        self.extended = False
+        self.green_start = self.now
+        self.countdown = max(self.policy.green_time(self, lane), self.min_green)
+        self.deadline = self.now + self.countdown - self.yellow_time
+
+    def _extend_green(self):
+        self.extended = True
+        self.countdown = max(self.policy.green_time(self, self.lane), self.min_green) + self.yellow_time
+        self.deadline = self.now + self.countdown - self.yellow_time
+
+    def _enter_yellow(self):
+        self.next_lane = self.policy.choose(self) if self._demand() else None
+        self.deadline = self.now + self.yellow_time
+
+    def _enter_preempt_yellow(self):
+        self.next_lane = self._emergency_lane()
+        self.deadline = self.now + self.yellow_time
+
+    def _retarget_yellow(self):
+        self.next_lane = self._emergency_lane()
+
+    def _enter_all_red(self):
+        self.lane = None
+        self.deadline = self.now + self.all_red_time
+
+    def _enter_idle(self):
+        self.lane = None
+        self.next_lane = None
+        self.deadline = None
+
+    def _enter_emergency(self):
+        lane = self._emergency_lane()
+        self.lane = lane
+        self.next_lane = None
+        self.extended = False
+        self.green_start = self.now
+        self.countdown = max(self.policy.green_time(self, lane), self.min_green)
+        self.deadline = self.now + self.countdown
+
+    ############ outputs ############
+    def _update_lamps(self):
+        yellow = self.state == YELLOW
+        lamps = self.topology.lamps(self.lane, yellow, self.next_lane if yellow else None)
+        lamps["C"] = self.countdown
+        self.lamps = lamps
+
+    def step(self, now, counts, emergencies):
+        """Advance to time `now` with the latest lane counts and emergency flags; returns True if the lamps changed"""
+        self.now = now
+        self.counts = counts
+        self.emergencies = emergencies
+        self.policy.observe(now, counts)
+        changed = False
+        for _ in range(len(TRANSITIONS)): # zero-length states (no all-red clearance) chain within one step
+            for condition, target, action in self._rules[self.state]:
+                if condition():
+                    action()
+                    self.state = target
+                    self.transitions += 1
+                    changed = True
+                    break
+            else:
+                break
+        if changed:
+            self._update_lamps()
+        return changed
+
+    def next_deadline(self):
+        """Time of the next timed transition, or None while idle"""
+        return self.deadline
+
+    def remaining(self):
+        """Whole seconds left in the current state"""
+        if self.deadline is None:
+            return 0
+        return max(0, math.ceil(self.deadline - self.now))
+
+def _drive(fsm, steps, seed, on_step=None):
+    import random
+    rng = random.Random(seed)
+    n = fsm.n
+    counts = [0] * n
+    emergencies = [False] * n
+    now = 0.0
+    for k in range(steps):
+        lane = rng.randrange(n)
+        counts[lane] = max(0, counts[lane] + rng.choice((-1, 0, 1)))
+        if rng.random() < 0.0005:
+            emergencies[lane] = not emergencies[lane]
+        deadline = fsm.next_deadline()
+        # half the steps jump straight to the next deadline, the rest are 250 ms ticks
+        now = deadline if deadline is not None and rng.random() < 0.5 else now + 0.25
+        fsm.step(now, counts, emergencies)
+        if on_step is not None:
+            on_step(k)
+    return now
+
+def benchmark(steps=1000000, n_approaches=4, seed=0):
+    """Drive the FSM through `steps` steps of simulated time with random traffic and emergencies"""
+    import time
+    import tracemalloc
+    fsm = SignalFSM(n_approaches)
+    t = time.perf_counter()
+    now = _drive(fsm, steps, seed)
+    elapsed = time.perf_counter() - t
+    print(f"{steps} steps, {fsm.transitions} transitions, {now / 86400:.1f} simulated days in {elapsed:.2f} s "
+          f"({steps / elapsed:.0f} steps/s, {fsm.transitions / elapsed:.0f} transitions/s)")
+
+    # constant memory: nothing may accumulate once every state has been visited
+    check = min(steps, 200000)
+    marks = {}
+    tracemalloc.start()
+    _drive(SignalFSM(n_approaches), check, seed + 1,
+           lambda k: marks.setdefault(k, tracemalloc.get_traced_memory()[0]) if k in (check // 10, check - 1) else None)
+    tracemalloc.stop()
+    print(f"memory growth from step {check // 10} to {check}: {marks[check - 1] - marks[check // 10]} bytes")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--steps', help='Number of steps to run', type=int, default=1000000)
+    parser.add_argument('--approaches', help='Number of approaches', type=int, default=4)
+    args = parser.parse_args()
+    benchmark(args.steps, args.approaches)
@@ -0,0 +1,252 @@
+"""
+Green-time policies for the signal controller
+
+SignalFSM handles the safety side (yellow, all-red, emergency preemption);
+which approach goes next and for how long is asked of a policy object:
+
+    choose(fsm)             approach to go next (fsm.lane is the one ending, None at the start)
+    green_time(fsm, lane)   seconds of green for that approach
+    should_extend(fsm)      keep the current green for another green_time()
+    observe(now, counts)    called on every step, for policies that learn the demand
+
+Policies:
+
+    bucketed        the original find_max() rule: 5/10/15/20 s by the lane count,
+                    most traffic first, one extension if it still has the most
+    max_pressure    fixed slots; each slot goes to the approach with the largest queue
+                    (pressure, with no downstream queues at an isolated junction; ties
+                    to the one waiting longest), the current green keeps going while it
+                    still has it, up to max_green
+    webster         Webster's optimal cycle from the flow ratios, effective green split
+                    in proportion to them, approaches with traffic served in turn
+    longest_queue   longest queue first, green long enough to clear it
+
+    python signal_policies.py --hours 24                     # benchmark on the synthetic scenarios
+    python signal_policies.py --trace ../local_data/events.jsonl --policies bucketed,webster
+"""
+
+import math
+
+GREEN_TIMES = ((3, 5), (5, 10), (7, 15)) # (up to this many vehicles, seconds of green)
+LONGEST_GREEN = 20
+
+def green_time(count, table=GREEN_TIMES, longest=LONGEST_GREEN):
+    for limit, seconds in table:
+        if count <= limit:
+            return seconds
+    return longest
+
+def _argmax(values, skip=None):
+    best = None
+    for lane, value in enumerate(values):
+        if lane != skip and (best is None or value > values[best]):
+            best = lane
+    return best
+
+class Policy:
+    name = "policy"
+
+    def choose(self, fsm):
+        best = _argmax(fsm.counts)
+        if best == fsm.lane:
+            best = _argmax(fsm.counts, skip=fsm.lane)
+        return best
+
+    def green_time(self, fsm, lane):
+        raise NotImplementedError
+
+    def should_extend(self, fsm):
+        return False
+
+    def observe(self, now, counts):
+        pass
+
+class BucketedPolicy(Policy):
+    name = "bucketed"
+
+    def green_time(self, fsm, lane):
+        return green_time(fsm.counts[lane])
+
+    def should_extend(self, fsm):
+        return not fsm.extended and fsm.counts[fsm.lane] > 0 and _argmax(fsm.counts) == fsm.lane
+
+class MaxPressurePolicy(Policy):
+    name = "max_pressure"
+
+    def __init__(self, slot=5, max_green=60):
+        self.slot = slot
+        self.max_green = max_green
+        self.last_green = {} # lane -> when it last went green; ties go to the lane waiting longest
+
+    def choose(self, fsm):
+        skip = None
+        if fsm.lane is not None and fsm.now - fsm.green_start >= self.max_green:
+            skip = fsm.lane # capped: the lane may not take the next green as well
+        lanes = [lane for lane in range(len(fsm.counts)) if lane != skip]
+        return max(lanes, key=lambda lane: (fsm.counts[lane], -self.last_green.get(lane, float("-inf"))))
+
+    def green_time(self, fsm, lane):
+        self.last_green[lane] = fsm.now
+        return self.slot
+
+    def should_extend(self, fsm):
+        pressure = fsm.counts[fsm.lane]
+        return pressure > 0 and pressure >= max(fsm.counts) and fsm.now - fsm.green_start < self.max_green
+
+class WebsterPolicy(Policy):
+    """Flow ratios y = q / s from the arrivals seen in the lane counts (EWMA over `time_constant` seconds)"""
+    name = "webster"
+
+    def __init__(self, n_approaches=4, saturation_flow=0.5, lost_time_per_phase=2.0, time_constant=900.0,
+                 min_green=5, max_cycle=120):
+        self.saturation_flow = saturation_flow # vehicles / s of green
+        self.lost_time_per_phase = lost_time_per_phase
+        self.time_constant = time_constant
+        self.min_green = min_green
+        self.max_cycle = max_cycle
+        self.flows = [0.0] * n_approaches # vehicles / s
+        self.arrivals = [0] * n_approaches
+        self.last_counts = None
+        self.last_time = None
+
+    def observe(self, now, counts):
+        if self.last_counts is not None:
+            for lane, (new, old) in enumerate(zip(counts, self.last_counts)):
+                if new > old:
+                    self.arrivals[lane] += new - old
+            dt = now - self.last_time
+            if dt >= 1.0:
+                alpha = 1.0 - math.exp(-dt / self.time_constant)
+                for lane, arrivals in enumerate(self.arrivals):
+                    self.flows[lane] += alpha * (arrivals / dt - self.flows[lane])
+                    self.arrivals[lane] = 0
+                self.last_time = now
+        else:
+            self.last_time = now
+        self.last_counts = list(counts)
+
+    def choose(self, fsm):
+        n = len(fsm.counts)
+        start = -1 if fsm.lane is None else fsm.lane
+        for k in range(1, n + 1): # next approach in turn that has traffic waiting
+            lane = (start + k) % n
+            if fsm.counts[lane] > 0:
+                return lane
+        return (start + 1) % n
+
+    def cycle(self):
+        ratios = [q / self.saturation_flow for q in self.flows]
+        total_lost = self.lost_time_per_phase * len(ratios)
+        y = min(sum(ratios), 0.9)
+        return min((1.5 * total_lost + 5) / (1 - y), self.max_cycle), ratios, y
+
+    def green_time(self, fsm, lane):
+        cycle, ratios, y = self.cycle()
+        total = sum(ratios)
+        if total <= 0:
+            return self.min_green
+        effective = cycle - self.lost_time_per_phase * len(ratios)
+        return max(self.min_green, math.ceil(self.lost_time_per_phase + effective * ratios[lane] / total))
+
+class LongestQueuePolicy(Policy):
+    name = "longest_queue"
+
+    def __init__(self, headway=2.0, lost_time=2.0, max_green=40):
+        self.headway = headway
+        self.lost_time = lost_time
+        self.max_green = max_green
+
+    def green_time(self, fsm, lane):
+        return min(self.max_green, math.ceil(self.lost_time + fsm.counts[lane] * self.headway))
+
+POLICIES = {
+    "bucketed": BucketedPolicy,
+    "max_pressure": MaxPressurePolicy,
+    "webster": WebsterPolicy,
+    "longest_queue": LongestQueuePolicy,
+}
+
+def make_policy(name, n_approaches=4):
+    cls = POLICIES[name]
+    return cls(n_approaches) if cls is WebsterPolicy else cls()
+
+############ benchmark ############
+SCENARIOS = { # arrivals per minute per approach
+    "light": (1, 1, 1, 1),
+    "balanced": (5, 5, 5, 5),
+    "unbalanced": (10, 2, 6, 1),
+    "one_heavy": (14, 2, 2, 2),
+    "peak": (8, 8, 8, 8),
+}
+
+def jain_fairness(values):
+    """Jain's index of the per-approach average waits: 1 = all equal, 1/n = one approach takes it all"""
+    values = [v for v in values if v > 0]
+    if not values:
+        return 1.0
+    return sum(values) ** 2 / (len(values) * sum(v * v for v in values))
+
+def evaluate(policy_name, rates=None, trace=None, hours=24, seed=0, emergencies_per_day=0):
+    from des_simulation import JunctionSimulation
+    from signal_fsm import SignalFSM
+    n = len(rates) if rates is not None else 4
+    fsm = SignalFSM(n, policy=make_policy(policy_name, n))
+    sim = JunctionSimulation(rates or (0.0,) * n, trace, emergencies_per_day, seed=seed, fsm=fsm)
+    seconds = hours * 3600
+    if trace:
+        seconds = min(seconds, math.ceil(trace[-1][0]) + 60)
+    report = sim.run(seconds)
+    waits = [lane["avg_delay"] for lane in report["lanes"]]
+    return {
+        "throughput_per_hour": report["throughput_per_hour"],
+        "avg_wait": report["avg_delay"],
+        "worst_lane_wait": max(waits),
+        "fairness": jain_fairness(waits),
+        "phase_switches": report["green_changes"],
+        "max_queue": report["max_queue"],
+        "left_waiting": sum(lane["queue_at_end"] for lane in report["lanes"]),
+    }
+
+def benchmark(policies, scenarios, hours=24, seed=0):
+    """{scenario: {policy: results}} over the same arrivals (same seed / trace) for every policy"""
+    results = {}
+    for scenario, demand in scenarios.items():
+        results[scenario] = {}
+        for policy in policies:
+            if isinstance(demand, list): # recorded trace
+                results[scenario][policy] = evaluate(policy, trace=demand, hours=hours, seed=seed)
+            else:
+                rates = tuple(r / 60.0 for r in demand)
+                results[scenario][policy] = evaluate(policy, rates=rates, hours=hours, seed=seed)
+    return results
+
+def print_results(results):
+    print(f"{'scenario':<12} {'policy':<14} {'veh/h':>7} {'avg wait':>9} {'worst lane':>10} {'fairness':>8} "
+          f"{'switches':>8} {'max queue':>9} {'left':>6}")
+    for scenario, by_policy in results.items():
+        for policy, r in by_policy.items():
+            print(f"{scenario:<12} {policy:<14} {r['throughput_per_hour']:>7.0f} {r['avg_wait']:>8.1f}s "
+                  f"{r['worst_lane_wait']:>9.1f}s {r['fairness']:>8.3f} {r['phase_switches']:>8} "
+                  f"{r['max_queue']:>9} {r['left_waiting']:>6}")
+
+if __name__ == "__main__":
+    import os
+    import json
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--policies', help='Comma-separated policies to compare', default=",".join(POLICIES))
+    parser.add_argument('--scenarios', help='Comma-separated synthetic scenarios (empty for none)', default=",".join(SCENARIOS))
+    parser.add_argument('--trace', help='Recorded traces (event journal or traffic.json snapshots) to add as scenarios', nargs='*', default=[])
+    parser.add_argument('--hours', help='Simulated hours per run', type=float, default=24)
+    parser.add_argument('--seed', help='Random seed', type=int, default=0)
+    parser.add_argument('--json', help='Print the results as JSON', action='store_true')
+    args = parser.parse_args()
+    from des_simulation import load_trace
+    scenarios = {name: SCENARIOS[name] for name in args.scenarios.split(',') if name}
+    for path in args.trace:
+        scenarios[os.path.basename(path)] = load_trace(path)
+    results = benchmark([p for p in args.policies.split(',') if p], scenarios, args.hours, args.seed)
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_results(results)
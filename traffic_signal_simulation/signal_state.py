@@ -0,0 +1,134 @@
+"""
+Compact versioned signal state
+
+The controller publishes the signal state as one 26-byte record in its own
+file (signal_state.bin), written once per phase change:
+
+    version   uint32   bumps on every write; readers skip a record they have seen
+    phase     uint8    index into PHASES (the SignalFSM state)
+    lane      int8     approach, or phase with a topology (1-based), 0 for none
+    mask      uint64   lamp bitmask, bit i = traffic_lights[i] in watch_signals.py:
+                       R1..Rn, then G1..Gn, then Y1..Yn (up to 21 approaches)
+    deadline  float64  wall-clock time (time.time()) the phase ends, 0 while idle
+    duration  float32  length of the phase in seconds (C)
+
+Displays compute the remaining seconds themselves from the deadline, so
+nothing has to be rewritten every second. A reader stats the file, and only
+reads the 26 bytes when the mtime changed and only decodes them when the
+version did.
+
+    python signal_state.py                     # print the record whenever it changes
+"""
+
+import os
+import math
+import time
+import struct
+from collections import namedtuple
+
+PHASES = ("ALL_RED", "GREEN", "YELLOW", "EMERGENCY", "IDLE")
+RECORD = struct.Struct("<IBbQdf")
+COLORS = "RGY" # mask order
+
+SignalState = namedtuple("SignalState", "version phase lane mask deadline duration")
+
+def encode_mask(lamps, n_approaches=4):
+    mask = 0
+    for c, color in enumerate(COLORS):
+        for k in range(n_approaches):
+            if lamps.get(f"{color}{k+1}"):
+                mask |= 1 << (c * n_approaches + k)
+    return mask
+
+def decode_mask(mask, n_approaches=4):
+    """Lamp dict R1..Rn, G1..Gn, Y1..Yn from a mask"""
+    return {f"{color}{k+1}": bool(mask >> (c * n_approaches + k) & 1)
+            for c, color in enumerate(COLORS) for k in range(n_approaches)}
+
+def remaining(state, now=None):
+    """Whole seconds left in the phase (0 when idle or over)"""
+    if not state.deadline:
+        return 0
+    now = time.time() if now is None else now
+    return max(0, math.ceil(state.deadline - now))
+
+def pack(state):
+    return RECORD.pack(state.version, PHASES.index(state.phase), state.lane, state.mask, state.deadline, state.duration)
+
+def unpack(data):
+    version, phase, lane, mask, deadline, duration = RECORD.unpack(data)
+    return SignalState(version, PHASES[phase], lane, mask, deadline, duration)
+
+class SignalStateWriter:
+    def __init__(self, path="signal_state.bin", n_approaches=4):
+        self.path = path
+        self.n_approaches = n_approaches
+        self.version = 0
+        self.last = None
+        self.writes = 0
+
+    def publish(self, fsm, now=None):
+        """Write the FSM's phase if it changed; `now` is the monotonic time the FSM was stepped at"""
+        now = time.monotonic() if now is None else now
+        deadline = fsm.next_deadline()
+        if deadline is not None and fsm.state == "GREEN":
+            deadline += fsm.yellow_time # the countdown runs to the end of the yellow, like C
+        wall_deadline = 0.0 if deadline is None else time.time() + (deadline - now)
+        lane = fsm.lane + 1 if fsm.lane is not None else 0
+        key = (fsm.state, lane, encode_mask(fsm.lamps, self.n_approaches), round(wall_deadline, 2), float(fsm.countdown))
+        if key == self.last:
+            return None
+        self.last = key
+        self.version += 1
+        state = SignalState(self.version, fsm.state, lane, key[2], wall_deadline, float(fsm.countdown))
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(pack(state))
+        os.replace(temp_path, self.path)
+        self.writes += 1
+        return state
+
+class SignalStateReader:
+    def __init__(self, path="signal_state.bin"):
+        self.path = path
+        self.signature = None
+        self.state = None
+
+    def poll(self):
+        """The new record if there is one, else None"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        signature = (st.st_mtime_ns, st.st_size)
+        if signature == self.signature:
+            return None
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read(RECORD.size)
+            state = unpack(data)
+        except (FileNotFoundError, struct.error):
+            return None
+        self.signature = signature
+        if self.state is not None and state.version == self.state.version:
+            return None
+        self.state = state
+        return state
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--path', help='Signal state file', default="signal_state.bin")
+    parser.add_argument('--approaches', help='Number of approaches (for decoding the lamp mask)', type=int, default=4)
+    args = parser.parse_args()
+    reader = SignalStateReader(args.path)
+    try:
+        while True:
+            state = reader.poll()
+            if state is not None:
+                on = [lamp for lamp, lit in decode_mask(state.mask, args.approaches).items() if lit and not lamp.startswith("R")]
+                print(f"v{state.version} {state.phase} approach {state.lane or '-'} {' '.join(on) or 'all red'} "
+                      f"{remaining(state)}/{state.duration:g} s")
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
@@ -1,22 +1,43 @@
-import json
+import re
 import time
-import sys
-import lgpio
+import argparse
+from traffic_state import TrafficStateWatcher, TimerHeap
+from signal_fsm import SignalFSM, IDLE
+from preemption import PreemptionServer, DEFAULT_PORT
+from signal_state import SignalStateWriter
+from topology import load_topology, TopologyPolicy, PRESETS
 FILE_PATH = "traffic.json"
-# Load existing dictionary (if available)
+STATE_PATH = "signal_state.bin" # compact lamp mask + phase deadline for the displays, see signal_state.py
+SIGNAL_KEY = re.compile(r"^([RYG]\d+|C)$") # keys owned by the controller; the detectors own the rest
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--topology', help='Junction layout: ' + ", ".join(PRESETS) + ' or a JSON file (see topology.py); '
+                    'phases are then chosen by demand and waiting time. Default: four approaches, original rule', default=None)
+parser.add_argument('--preempt-host', help='Address for the emergency preemption channel (use 0.0.0.0 for detectors on other hosts)',
+                    default="127.0.0.1")
+parser.add_argument('--preempt-port', help='UDP port for the emergency preemption channel (0 to disable)', type=int, default=DEFAULT_PORT)
+parser.add_argument('--preempt-log', help='Log every preemption with its latency to this file', default="preemption_log.jsonl")
+args = parser.parse_args()
+
+topology=load_topology(args.topology) if args.topology else None
+N_APPROACHES = topology.n_approaches if topology else 4
+
+# traffic.json is re-read only when it changes; everything below reads the in-memory copy
+watcher=TrafficStateWatcher(FILE_PATH)
+
 def load_data():
-    try:
-        with open(FILE_PATH, "r") as file:
-            return json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}  # Default to empty dict if file doesn't exist or is corrupted
+    return watcher.get()
 
-# Save dictionary to file
+# Save the lamp and countdown keys to file (detector counts written meanwhile are kept)
 def save_data(data):
-    with open(FILE_PATH, "w") as file:
-        json.dump(data, file, indent=4)
+    watcher.update({key: value for key, value in data.items() if SIGNAL_KEY.match(key)})
 
-traffic=load_data()
+def lane_counts(traffic):
+    """Smoothed queue per lane (Q1..Qn) when the detectors publish it, otherwise the raw count (T1..Tn)"""
+    return [traffic.get(f"Q{i}", traffic.get(f"T{i}", 0)) for i in range(1,N_APPROACHES+1)]
+
+def emergency_flags(traffic):
+    return [bool(traffic.get(f"A{i}")) for i in range(1,N_APPROACHES+1)]
 #####################################
 
 ##################### raspberry pi #########################
@@ -45,194 +66,54 @@ traffic=load_data()
 
 ###############################################################
 
-try:
-    def start():
+if topology is not None:
+    fsm=SignalFSM(topology=topology, policy=TopologyPolicy(topology), min_green=min(topology.min_green))
+else:
+    fsm=SignalFSM(N_APPROACHES)
+timers=TimerHeap() # console countdown ticks; the FSM keeps its own phase deadline
+signal_state=SignalStateWriter(STATE_PATH, N_APPROACHES)
+
+def preempt(lane, active):
+    watcher.update({f"A{lane}": active})
+
+preemption=None
+if args.preempt_port:
+    preemption=PreemptionServer(preempt, args.preempt_host, args.preempt_port, args.preempt_log, N_APPROACHES,
+                                wake=watcher.poke) # wakes the loop below once the request is pending
+
+def run():
+    """Single controller loop: step the state machine, publish lamp changes, sleep until the next deadline or event"""
+    timers.schedule("print", delay=1)
+    while True:
+        seen=watcher.version # an update or poke after this wakes the wait below, even if it comes before it
+        answered=len(preemption.pending) if preemption is not None else 0 # requests whose flags this read sees
         traffic=load_data()
-        traffic[f'R1']=True
-        traffic[f'R2']=True
-        traffic[f'R3']=True
-        traffic[f'R4']=True
-
-        traffic[f'G1']=False
-        traffic[f'G2']=False
-        traffic[f'G3']=False
-        traffic[f'G4']=False
-
-        traffic[f'Y1']=False
-        traffic[f'Y2']=False
-        traffic[f'Y3']=False
-        traffic[f'Y4']=False
-
-        save_data(traffic)
-
-        def find_max():
-            traffic=load_data()
-            traffic_list=[traffic["T1"],traffic[f"T2"],traffic[f"T3"],traffic[f"T4"]]
-            tmax=max(traffic_list)
-            tmaxlan=traffic_list.index(tmax)+1
-            traffic_list.pop(tmaxlan-1)
-            tmaxlan2=(traffic_list.index(max(traffic_list)))+1
-            if(tmaxlan2>=tmaxlan):
-                tmaxlan2+=1
-            if(tmax==0):                
-                return [tmaxlan,0,tmaxlan2,True]
-            elif(tmax<=3):
-                return [tmaxlan,5,tmaxlan2,False]
-            elif(tmax<=5):
-                return [tmaxlan,10,tmaxlan2,False]
-            elif(tmax<=7):
-                return [tmaxlan,15,tmaxlan2,False]
-            return [tmaxlan,20,tmaxlan2,False]
-        
-        ###################### check any lane have traffic ##################
-        def check():
-            traffic=load_data()
-            traffic[f'R1']=True
-            traffic[f'R2']=True
-            traffic[f'R3']=True
-            traffic[f'R4']=True
-            traffic[f'Y1']=False
-            traffic[f'Y2']=False
-            traffic[f'Y3']=False
-            traffic[f'Y4']=False
-            traffic[f'G1']=False
-            traffic[f'G2']=False
-            traffic[f'G3']=False
-            traffic[f'G4']=False
-            save_data(traffic)
-            # for i in range(sys.maxsize):
-            #     traffic=load_data()
-            #     traffic_list=[traffic["T1"],traffic[f"T2"],traffic[f"T3"],traffic[f"T4"]]
-            #     if(max(traffic_list)!=0):
-            #         break
-            #     time.sleep(1)
-            traffic=load_data()
-            while(traffic["T1"]==0 and traffic["T2"]==0 and traffic["T3"]==0 and traffic["T4"]==0):
-                time.sleep(1)
-                traffic=load_data()
-            return start()
-        ##################### Ambulance ############################
-        def emergency():
-            traffic=load_data()
-            lane=-1
-            for i in range(4):
-                if(traffic[f'A{(i+1)}']):
-                    lane=i+1
-                    break
-            if(lane==-1): return start()    
-
-            traffic[f'R1']=True
-            traffic[f'R2']=True
-            traffic[f'R3']=True
-            traffic[f'R4']=True
-            traffic[f'Y1']=False
-            traffic[f'Y2']=False
-            traffic[f'Y3']=False
-            traffic[f'Y4']=False
-            traffic[f'G1']=False
-            traffic[f'G2']=False
-            traffic[f'G3']=False
-            traffic[f'G4']=False
-
-            traffic[f'R{lane}']=False
-            traffic[f'G{lane}']=True
-            save_data(traffic)
-            i=20
-            if(traffic[f'T{lane}']<=3):
-                i=5
-            elif(traffic[f'T{lane}']<=5):
-                i=10
-            elif(traffic[f'T{lane}']<=7):
-                i=15
-            traffic=load_data() ############
-            traffic["C"]=i ############
-            save_data(traffic) ############
-            while(i>=0):
-                print(i)
-                i-=1
-                time.sleep(1)
-            traffic=load_data()
-            if(traffic["A1"] or traffic["A2"] or traffic["A3"] or traffic["A4"]): return emergency()
-            return start()
-        ##############################################################
-
-        if(traffic["A1"] or traffic["A2"] or traffic["A3"] or traffic["A4"]): return emergency()
-
-        max_data=find_max()  
-        if(max_data[3]):
-            check()  
-        i=max_data[1]
-        traffic=load_data() ################
-        traffic["C"]=i ####################
-        save_data(traffic) ###########
-        j=max_data[0]
-        j1=0
-        j2=0
-        i1=0
-        repeat=0
-
-        traffic[f'R{j}']=False
-        traffic[f'G{j}']=True
-        save_data(traffic)
-        while(i>=0):
-            data=load_data()
-            print(i)
-            if(data["A1"] or data["A2"] or data["A3"] or data["A4"]): return emergency()
-            
-            if(i==3):
-                max_data=find_max()
-                # if(max_data[3]):
-                #     check()
-                i1=max_data[1]
-                j1=max_data[0]
-                j2=max_data[2]
-                data[f'Y{j}']=True
-                data[f'G{j}']=False
-                if(repeat!=0 and j1==repeat and j1==j and j2!=0):
-                    data[f'Y{(j2)}']=True
-                    data[f'R{(j2)}']=False
-                else:
-                    data[f'Y{(j1)}']=True
-                    data[f'R{(j1)}']=False
-                save_data(data)
-            if(i==0):
-                max_data=find_max()
-                if(max_data[3]):
-                    check()
-                # data[f'R{j}']=True
-                # data[f'Y{j}']=False
-                if(repeat!=0 and j1==repeat and j1==j and j2!=0):
-                    data[f'R{j}']=True
-                    data[f'Y{j}']=False
-                    j1=j2
-                    j=j1
-                    data[f'G{j}']=True
-                    data[f'Y{j}']=False
-
-                elif(repeat!=j and j1==j ):
-                    # data[f'R{j}']=True
-                    data[f'Y{j}']=False
-                    repeat=j
-                    # j=j1
-                    data[f'G{j}']=True
-                    # data[f'Y{j}']=False
-                else:
-                    data[f'R{j}']=True
-                    data[f'Y{j}']=False
-                    repeat=j
-                    j=j1
-                    data[f'G{j}']=True
-                    data[f'Y{j}']=False
-
-                # data[f'G{j}']=True
-                # data[f'Y{j}']=False
-                i=i1
-                data["C"]=i ###############
-                save_data(data)
-                # print(data)
-            else:
-                i-=1
-            time.sleep(1)
-    start()
+        flags=emergency_flags(traffic)
+        now=time.monotonic()
+        # the FSM works on phases; with the default layout every approach is its own phase
+        if fsm.step(now, fsm.topology.phase_demand(lane_counts(traffic)), fsm.topology.phase_flags(flags)):
+            signal_state.publish(fsm, now)
+            save_data(fsm.lamps) # R/Y/G/C stay in traffic.json for the dashboard and metrics
+            phase=fsm.topology.phase_names[fsm.lane] if fsm.lane is not None else "-"
+            print(f"{fsm.state} {phase}, C={fsm.countdown}")
+        if answered:
+            preemption.complete(fsm.state, fsm.lane+1 if fsm.lane is not None else None, answered)
+        for name in timers.pop_due(now):
+            if fsm.state != IDLE:
+                print(fsm.remaining())
+            timers.schedule("print", delay=1)
+        wake=timers.next_deadline()
+        if fsm.next_deadline() is not None:
+            wake=min(wake, fsm.next_deadline())
+        # an emergency flag changing, a preemption request, or traffic showing up while idle wakes the loop immediately
+        watcher.wait_until(wake, lambda traffic: emergency_flags(traffic)!=flags or
+                           (preemption is not None and len(preemption.pending)>0) or
+                           (fsm.state==IDLE and max(lane_counts(traffic))>0), since=seen)
+
+try:
+    run()
 except KeyboardInterrupt:
+    if preemption is not None:
+        preemption.stop()
+    watcher.stop()
     print("Simulation is stop")
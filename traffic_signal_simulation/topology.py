@@ -0,0 +1,261 @@
+"""
+Intersection topology and priority phase scheduling
+
+A topology lists the approaches of a junction (approach k reads T<k>/Q<k>/A<k>
+and drives lamps R<k>/Y<k>/G<k>), the phases (groups of approaches that go
+green together, with their minimum and maximum green) and the conflicting
+approach pairs no phase may combine. It is loaded from JSON or one of PRESETS:
+
+    {
+        "name": "t_junction",
+        "approaches": ["main west", "main east", "side"],
+        "phases": [
+            {"name": "main", "approaches": [1, 2], "min_green": 8, "max_green": 40},
+            {"name": "side", "approaches": [3], "min_green": 5, "max_green": 20}
+        ],
+        "conflicts": [[1, 3], [2, 3]],
+        "pins": {"R": [17, 27, 5], "G": [13, 19, 26], "Y": [23, 24, 25]}
+    }
+
+"pins" is optional and only used by watch_signals.py. With a topology the
+SignalFSM works on phases: its lane counts are phase demands (the sum of the
+phase's approach counts) and its lamps light every approach of the phase.
+
+PhaseScheduler picks the next phase from a heap keyed by demand and waiting
+time, priority = demand + wait_weight * (now - waiting_since). The now term is
+the same for every phase, so the key demand - wait_weight * waiting_since only
+changes when a phase's demand or waiting start changes: updates and selection
+are O(log N) heap operations, stale entries are skipped lazily.
+
+    python topology.py --topology five_way     # check a topology and time the scheduler
+"""
+
+import json
+import heapq
+import math
+from signal_policies import Policy, green_time
+
+def _single_phases(n):
+    return [{"name": f"approach {k+1}", "approaches": [k + 1]} for k in range(n)]
+
+PRESETS = {
+    # the original junction: every approach on its own
+    "four_way": {"approaches": ["1", "2", "3", "4"], "phases": _single_phases(4)},
+    # opposite approaches together
+    "four_way_paired": {
+        "approaches": ["north", "east", "south", "west"],
+        "phases": [{"name": "north-south", "approaches": [1, 3], "min_green": 8, "max_green": 40},
+                   {"name": "east-west", "approaches": [2, 4], "min_green": 8, "max_green": 40}],
+        "conflicts": [[1, 2], [1, 4], [3, 2], [3, 4]],
+    },
+    "t_junction": {
+        "approaches": ["main west", "main east", "side"],
+        "phases": [{"name": "main", "approaches": [1, 2], "min_green": 8, "max_green": 40},
+                   {"name": "side", "approaches": [3], "min_green": 5, "max_green": 20}],
+        "conflicts": [[1, 3], [2, 3]],
+    },
+    "five_way": {"approaches": ["1", "2", "3", "4", "5"], "phases": _single_phases(5)},
+}
+
+class Topology:
+    def __init__(self, approaches, phases, conflicts=(), name="junction", pins=None,
+                 min_green=5, max_green=60):
+        self.name = name
+        self.approach_names = list(approaches)
+        self.n_approaches = len(self.approach_names)
+        self.phase_names = [phase.get("name", f"phase {p+1}") for p, phase in enumerate(phases)]
+        self.phase_approaches = [tuple(a - 1 for a in phase["approaches"]) for phase in phases]
+        self.min_green = [phase.get("min_green", min_green) for phase in phases]
+        self.max_green = [phase.get("max_green", max_green) for phase in phases]
+        self.n_phases = len(self.phase_approaches)
+        self.conflicts = {frozenset((a - 1, b - 1)) for a, b in conflicts}
+        self.pins = pins
+        self.approach_phases = [[p for p, group in enumerate(self.phase_approaches) if a in group]
+                                for a in range(self.n_approaches)]
+        self._validate()
+
+    def _validate(self):
+        if not self.n_phases:
+            raise ValueError(f"{self.name}: no phases")
+        for p, group in enumerate(self.phase_approaches):
+            for a in group:
+                if not 0 <= a < self.n_approaches:
+                    raise ValueError(f"{self.name}: phase {self.phase_names[p]} has unknown approach {a+1}")
+            for i, a in enumerate(group):
+                for b in group[i + 1:]:
+                    if frozenset((a, b)) in self.conflicts:
+                        raise ValueError(f"{self.name}: phase {self.phase_names[p]} combines conflicting approaches {a+1} and {b+1}")
+            if self.min_green[p] > self.max_green[p]:
+                raise ValueError(f"{self.name}: phase {self.phase_names[p]} min_green > max_green")
+        for a, phases in enumerate(self.approach_phases):
+            if not phases:
+                raise ValueError(f"{self.name}: approach {a+1} is in no phase")
+        if self.pins is not None:
+            for color in "RGY":
+                if len(self.pins.get(color, ())) != self.n_approaches:
+                    raise ValueError(f"{self.name}: need one {color} pin per approach")
+
+    @classmethod
+    def from_dict(cls, config, name=None):
+        return cls(config["approaches"], config["phases"], config.get("conflicts", ()),
+                   name or config.get("name", "junction"), config.get("pins"))
+
+    @classmethod
+    def single(cls, n_approaches):
+        """Every approach its own phase (the original four-way behaviour for n=4)"""
+        return cls([str(k + 1) for k in range(n_approaches)], _single_phases(n_approaches), name=f"{n_approaches}_way")
+
+    def phase_demand(self, counts):
+        """Per-approach counts -> per-phase demand"""
+        return [sum(counts[a] for a in group) for group in self.phase_approaches]
+
+    def phase_flags(self, flags):
+        """Per-approach emergency flags -> per-phase flags"""
+        return [any(flags[a] for a in group) for group in self.phase_approaches]
+
+    def lamps(self, phase=None, yellow=False, next_phase=None):
+        """Lamp dict R1..Rn / Y / G for the phase showing green (or yellow, with the next phase preparing)"""
+        lamps = {}
+        for k in range(self.n_approaches):
+            lamps[f"R{k+1}"] = True
+            lamps[f"Y{k+1}"] = False
+            lamps[f"G{k+1}"] = False
+        if phase is not None:
+            following = self.phase_approaches[next_phase] if yellow and next_phase not in (None, phase) else ()
+            for a in self.phase_approaches[phase]:
+                on = "Y" if yellow and a not in following else "G" # an approach in both phases keeps its green
+                lamps[f"R{a+1}"] = False
+                lamps[f"{on}{a+1}"] = True
+            for a in following:
+                if a not in self.phase_approaches[phase]:
+                    lamps[f"R{a+1}"] = False
+                    lamps[f"Y{a+1}"] = True
+        return lamps
+
+    def light_pins(self):
+        """watch_signals.py pin order: R1..Rn, G1..Gn, Y1..Yn"""
+        return list(self.pins["R"]) + list(self.pins["G"]) + list(self.pins["Y"])
+
+def load_topology(spec):
+    """Preset name or path to a JSON topology"""
+    if spec in PRESETS:
+        return Topology.from_dict(PRESETS[spec], spec)
+    with open(spec, "r") as file:
+        return Topology.from_dict(json.load(file))
+
+class PhaseScheduler:
+    """Max-priority queue of phases with demand: priority = demand + wait_weight * seconds waiting"""
+
+    def __init__(self, n_phases, wait_weight=0.5):
+        self.n = n_phases
+        self.wait_weight = wait_weight
+        self.heap = []
+        self.demand = [0] * n_phases
+        self.since = [0.0] * n_phases   # start of the current wait (demand appeared, or last green)
+        self.version = [0] * n_phases   # heap entries with an older version are stale
+
+    def _push(self, phase):
+        self.version[phase] += 1
+        if self.demand[phase] > 0:
+            key = -(self.demand[phase] - self.wait_weight * self.since[phase])
+            heapq.heappush(self.heap, (key, phase, self.version[phase]))
+            if len(self.heap) > 4 * self.n + 64: # too many stale entries: rebuild from the live ones
+                self.heap = [entry for entry in self.heap if entry[2] == self.version[entry[1]]]
+                heapq.heapify(self.heap)
+
+    def _drop_stale(self):
+        heap = self.heap
+        while heap and heap[0][2] != self.version[heap[0][1]]:
+            heapq.heappop(heap)
+
+    def update(self, phase, demand, now):
+        if demand == self.demand[phase]:
+            return
+        if self.demand[phase] <= 0 < demand:
+            self.since[phase] = now
+        self.demand[phase] = demand
+        self._push(phase)
+
+    def served(self, phase, now):
+        """The phase went green: its wait starts again"""
+        self.since[phase] = now
+        self._push(phase)
+
+    def priority(self, phase, now):
+        return self.demand[phase] + self.wait_weight * (now - self.since[phase])
+
+    def select(self, exclude=None):
+        """Phase with the highest priority (other than `exclude`), or None if no other phase has demand"""
+        self._drop_stale()
+        if not self.heap:
+            return None
+        if self.heap[0][1] != exclude:
+            return self.heap[0][1]
+        top = heapq.heappop(self.heap)
+        self._drop_stale()
+        best = self.heap[0][1] if self.heap else None
+        heapq.heappush(self.heap, top)
+        return best
+
+class TopologyPolicy(Policy):
+    """Phase choice from PhaseScheduler, green time from the bucketed rule clamped to the phase's min/max green"""
+    name = "priority"
+
+    def __init__(self, topology, wait_weight=0.5):
+        self.topology = topology
+        self.scheduler = PhaseScheduler(topology.n_phases, wait_weight)
+
+    def observe(self, now, counts):
+        update = self.scheduler.update
+        for phase, demand in enumerate(counts):
+            update(phase, demand, now)
+
+    def choose(self, fsm):
+        phase = self.scheduler.select(exclude=fsm.lane)
+        if phase is None: # only the phase going off has traffic
+            phase = fsm.lane if fsm.lane is not None else self.scheduler.select()
+        return phase if phase is not None else 0
+
+    def green_time(self, fsm, phase):
+        self.scheduler.served(phase, fsm.now)
+        per_approach = math.ceil(fsm.counts[phase] / len(self.topology.phase_approaches[phase]))
+        return min(max(green_time(per_approach), self.topology.min_green[phase]), self.topology.max_green[phase])
+
+    def should_extend(self, fsm):
+        phase = fsm.lane
+        if fsm.counts[phase] <= 0 or fsm.now - fsm.green_start >= self.topology.max_green[phase]:
+            return False
+        other = self.scheduler.select(exclude=phase)
+        return other is None or fsm.counts[phase] >= self.scheduler.priority(other, fsm.now)
+
+def benchmark(n_phases=1000, updates=200000, seed=0):
+    """Time scheduler updates and selections for a junction with many phases"""
+    import time
+    import random
+    rng = random.Random(seed)
+    scheduler = PhaseScheduler(n_phases)
+    now = 0.0
+    t = time.perf_counter()
+    for k in range(updates):
+        now += 0.01
+        scheduler.update(rng.randrange(n_phases), rng.randrange(20), now)
+        if k % 10 == 0:
+            phase = scheduler.select()
+            if phase is not None:
+                scheduler.served(phase, now)
+    elapsed = time.perf_counter() - t
+    print(f"{n_phases} phases: {updates / elapsed:.0f} updates/s with a selection every 10, heap size {len(scheduler.heap)}")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--topology', help='Preset name (' + ", ".join(PRESETS) + ') or JSON file', default="four_way")
+    parser.add_argument('--phases', help='Phases for the scheduler benchmark', type=int, nargs='*', default=[4, 100, 10000])
+    args = parser.parse_args()
+    topology = load_topology(args.topology)
+    print(f"{topology.name}: {topology.n_approaches} approaches")
+    for p, group in enumerate(topology.phase_approaches):
+        print(f"  {topology.phase_names[p]}: approaches {[a + 1 for a in group]}, "
+              f"green {topology.min_green[p]}-{topology.max_green[p]} s")
+    for n in args.phases:
+        benchmark(n)
@@ -0,0 +1,170 @@
+"""
+Change-driven access to traffic.json for the signal controller
+
+TrafficStateWatcher keeps the last parsed traffic.json in memory and reloads
+it only when the file actually changes (watchdog/inotify event, confirmed by
+mtime and size), so the controller reads its state from memory and can block
+until a condition holds instead of re-parsing the file every second. A cheap
+os.stat() every `poll_interval` seconds covers filesystems that drop events.
+
+TimerHeap is a monotonic min-heap of named deadlines: the controller waits
+for "the next deadline or a relevant state change", whichever comes first.
+"""
+
+import os
+import json
+import heapq
+import time
+import threading
+from filelock import FileLock
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+class _file_handler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if os.path.abspath(getattr(event, "dest_path", "") or event.src_path) == self.watcher.path or \
+           os.path.abspath(event.src_path) == self.watcher.path:
+            self.watcher.reload()
+
+class TrafficStateWatcher:
+    def __init__(self, path, poll_interval=1.0):
+        self.path = os.path.abspath(path)
+        self.lock_path = self.path + ".lock"
+        self.poll_interval = poll_interval
+        self.cond = threading.Condition()
+        self.state = {}
+        self.version = 0
+        self.signature = None
+        self.reloads = 0
+        self.reload()
+        self.observer = Observer()
+        self.observer.schedule(_file_handler(self), os.path.dirname(self.path), recursive=False)
+        self.observer.daemon = True
+        self.observer.start()
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def reload(self):
+        """Re-read the file if it changed since the last load; returns True if the state changed"""
+        signature = self._signature()
+        if signature is None or signature == self.signature:
+            return False
+        try:
+            with open(self.path, "r") as file:
+                state = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False # half-written; the writer's next event brings the complete file
+        with self.cond:
+            self.signature = signature
+            self.reloads += 1
+            if state != self.state:
+                self.state = state
+                self.version += 1
+                self.cond.notify_all()
+        return True
+
+    def get(self):
+        """Latest state (a copy, so callers may modify it)"""
+        with self.cond:
+            return dict(self.state)
+
+    def wait_until(self, deadline, predicate=None, since=None):
+        """Block until the monotonic deadline, or until a state change satisfies predicate(state).
+
+        Returns the state that satisfied the predicate, or None at the deadline.
+        deadline=None waits for the predicate only. `since` is the version the
+        caller last looked at: changes after it count even if they came before
+        this call.
+        """
+        with self.cond:
+            seen = self.version if since is None else since
+            while True:
+                if predicate is not None and self.version != seen:
+                    seen = self.version
+                    if predicate(self.state):
+                        return dict(self.state)
+                remaining = self.poll_interval if deadline is None else deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                if not self.cond.wait(min(remaining, self.poll_interval)):
+                    self.cond.release()
+                    try:
+                        self.reload() # no event within poll_interval: check the file ourselves
+                    finally:
+                        self.cond.acquire()
+
+    def wait_for(self, predicate):
+        """Block until predicate(state) holds and return that state"""
+        with self.cond:
+            if predicate(self.state):
+                return dict(self.state)
+        return self.wait_until(None, predicate)
+
+    def update(self, changes):
+        """Write the given keys into traffic.json, keeping everything other writers put there"""
+        with FileLock(self.lock_path):
+            try:
+                with open(self.path, "r") as file:
+                    state = json.load(file)
+            except (FileNotFoundError, json.JSONDecodeError):
+                state = self.get()
+            state.update(changes)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as file:
+                json.dump(state, file, indent=4)
+            os.replace(temp_path, self.path)
+        with self.cond:
+            self.signature = self._signature()
+            if state != self.state:
+                self.state = state
+                self.version += 1
+                self.cond.notify_all()
+
+    def poke(self):
+        """Make waiting wait_until() calls check their predicate again without a file change"""
+        with self.cond:
+            self.version += 1
+            self.cond.notify_all()
+
+    def stop(self):
+        self.observer.stop()
+        self.observer.join(timeout=2)
+
+class TimerHeap:
+    """Named deadlines on the monotonic clock, earliest first"""
+
+    def __init__(self):
+        self.heap = []
+        self.seq = 0
+        self.cancelled = set()
+
+    def schedule(self, name, delay=None, at=None):
+        """Add a deadline `delay` seconds from now (or at monotonic time `at`); returns its handle"""
+        deadline = at if at is not None else time.monotonic() + delay
+        self.seq += 1
+        heapq.heappush(self.heap, (deadline, self.seq, name))
+        return self.seq
+
+    def cancel(self, handle):
+        self.cancelled.add(handle)
+
+    def next_deadline(self):
+        while self.heap and self.heap[0][1] in self.cancelled:
+            self.cancelled.discard(heapq.heappop(self.heap)[1])
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now=None):
+        """Names of all deadlines that have passed, in order"""
+        now = time.monotonic() if now is None else now
+        due = []
+        while self.next_deadline() is not None and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap)[2])
+        return due
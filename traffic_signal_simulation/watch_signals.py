@@ -1,27 +1,31 @@
+import os
+import math
 import time
-import sys
-import lgpio
-import json
+import threading
+from gpio_hal import open_gpio
+from signal_state import SignalStateReader
+from topology import load_topology
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 # from google.cloud import vision
 
-########## Load traffic.json to access data ################
-FILE_PATH ="/home/pi/Desktop/stcnss/Smart-Traffic-Control-and-Surveillance-System/demo/traffic.json"
-
-# Load existing dictionary (if available)
-def load_data():
-    try:
-        with open(FILE_PATH, "r") as file:
-            return json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}  # Default to empty dict if file doesn't exist or is corrupted
-
 ############# Raspberry Pi #####################
 
-H=lgpio.gpiochip_open(0)
+gpio=open_gpio() # lgpio; GPIO_BACKEND=sim keeps the pins in memory (see gpio_hal.py)
+
+# folder with signal_state.bin (and topology.json); SIGNAL_FOLDER overrides it off the Pi
+WATCH_FOLDER=os.environ.get("SIGNAL_FOLDER","/home/pi/Desktop/stcnss/Smart-Traffic-Control-and-Surveillance-System/demo")
 
 traffic_lights=[17,27,5,6,13,19,26,18,23,24,25,9] # R1,R2...Y4
+
+# a junction other than the default four approaches: the same topology file simulation.py runs with (--topology),
+# with its "pins" in R1..Rn, G1..Gn, Y1..Yn order
+TOPOLOGY_PATH=os.path.join(WATCH_FOLDER,"topology.json")
+if os.path.exists(TOPOLOGY_PATH):
+    topology=load_topology(TOPOLOGY_PATH)
+    if topology.pins:
+        traffic_lights=topology.light_pins()
+
 segments=[2,3,22,11,10,21,12]
 numbers=[
     [0,0,0,0,0,0,1],
@@ -37,142 +41,110 @@ numbers=[
 ]
 digits=[16,20]
 
-for light in traffic_lights:
-    lgpio.gpio_claim_output(H,light)
-
-lgpio.gpio_claim_output(H,digits[0])
-lgpio.gpio_claim_output(H,digits[1])
-
-for segment in segments:
-    lgpio.gpio_claim_output(H,segment)
-
-############## Watch traffic.json ####################
-
-WATCH_FOLDER="/home/pi/Desktop/stcnss/Smart-Traffic-Control-and-Surveillance-System/demo"
-
-def countdown(k,i):
-    while True:
-        ####################################################
-        traffic=load_data()
-
-        for light in traffic_lights:
-            lgpio.gpio_write(H,light,0) # off all lights
-
-        X="R"
-        for w in range (12):
-            if(traffic.get(X+f"{(((w)%4)+1)}")):
-                lgpio.gpio_write(H,traffic_lights[w],1)
-            if(w==3):
-                X="G"
-            if(w==7):
-                X="Y"
-        ###########################################################
-        if i<=3 and k==0:
-            lgpio.gpio_write(H,digits[0],0)
-            lgpio.gpio_write(H,digits[1],0)
-            time.sleep(0.3)
-            lgpio.gpio_write(H,digits[0],1)
-            lgpio.gpio_write(H,digits[1],1)
-
-        for n in range (49): # countdown speed  
-            for j in range(7):
-                lgpio.gpio_write(H,segments[j], numbers[i][j])
-            lgpio.gpio_write(H,digits[0], 1)
-            lgpio.gpio_write(H,digits[1], 0)
-            time.sleep(0.01)
-
-            for j in range(7):
-                lgpio.gpio_write(H,segments[j], numbers[k][j])
-            lgpio.gpio_write(H,digits[0], 0)
-            lgpio.gpio_write(H,digits[1], 1)
-            time.sleep(0.01)
-
-
-        i-=1
-        if k==0 and i==-1:
-            lgpio.gpio_write(H,digits[0],0)
-            lgpio.gpio_write(H,digits[1],0)
-            break
-        if i==-1:
-            i = 9
-            k-=1
-            if k==-1:
-                lgpio.gpio_write(H,digits[0],0)
-                lgpio.gpio_write(H,digits[1],0)
+# two pin groups, each set with a single write: the lamps, and the segments together with the digit selects
+SEGMENT_GROUP=segments+digits
+gpio.group_claim_output(traffic_lights)
+gpio.group_claim_output(SEGMENT_GROUP)
+
+############## Watch the signal state ####################
+
+STATE_PATH=os.path.join(WATCH_FOLDER,"signal_state.bin") # written by simulation.py once per phase change
+
+signal_state=SignalStateReader(STATE_PATH)
+
+def show_lamps(mask):
+    gpio.group_write(traffic_lights[0],mask) # bit w of the mask is traffic_lights[w]
+
+############## Seven-segment display ####################
+
+def digit_word(value,position):
+    """SEGMENT_GROUP bits showing `value` on one digit (position 0: ones, 1: tens)"""
+    word=0
+    for j in range(7):
+        word|=numbers[value][j]<<j
+    return word|(1<<(7+position))
+
+DIGIT_WORDS=[[digit_word(value,position) for value in range(10)] for position in range(2)]
+BLANK_WORD=(1<<7)-1 # segments off, no digit selected
+
+class SegmentDisplay(threading.Thread):
+    """Multiplexes the two digits at a steady rate; the number shown is the time left to the phase deadline"""
+
+    def __init__(self, rate=100):
+        super().__init__(daemon=True)
+        self.period=1.0/rate # one digit per period, like the old 10 ms sleeps
+        self.deadline=0.0    # wall-clock end of the phase from the signal state; 0 blanks the display
+        self.running=True
+
+    def run(self):
+        next_tick=time.perf_counter()
+        position=0
+        while self.running:
+            deadline=self.deadline
+            left=deadline-time.time() if deadline else 0
+            if left<=0 or (left<=3 and left%1>0.7): # blank; the last 3 s blink like the old countdown
+                word=BLANK_WORD
+            else:
+                num=min(math.ceil(left),99)
+                word=DIGIT_WORDS[position][num//10 if position else num%10]
+            gpio.group_write(SEGMENT_GROUP[0],word)
+            position^=1
+            next_tick+=self.period
+            delay=next_tick-time.perf_counter()
+            if delay>0:
+                time.sleep(delay)
+            else:
+                next_tick=time.perf_counter() # fell behind: carry on from now instead of catching up
+
+display=SegmentDisplay()
+apply_lock=threading.Lock()
+
+def apply_signal_state():
+    """Show a new signal state record, if there is one: lamps now, countdown through the display thread"""
+    with apply_lock:
+        state=signal_state.poll()
+        if state is None: # same version as on the lamps already
+            return
+        show_lamps(state.mask)
+        display.deadline=state.deadline
+    print(f"TRAFFIC SIGNALS ARE UPDATED")
 
 ###################################################################
 
 class detected_image_Handler(FileSystemEventHandler):
-    def on_modified(self, event):
+    def on_any_event(self, event):
         if event.is_directory:
             return
-        
-        file_path = event.src_path
-        
-        if file_path.lower().endswith(('.json')):
-            traffic=load_data()
-            for light in traffic_lights:
-                lgpio.gpio_write(H,light,0) # off all lights
-
-            X="R"
-            for i in range (12):
-                if(traffic.get(X+f"{(((i)%4)+1)}")):
-                    lgpio.gpio_write(H,traffic_lights[i],1)
-                if(i==3):
-                    X="G"
-                if(i==7):
-                    X="Y"
-
-            print(f"TRAFFIC SIGNALS ARE UPDATED")
-
-        #################################################################
-            traffic=load_data()
-            
-            ##########################################
-            for light in traffic_lights:
-                lgpio.gpio_write(H,light,0) # off all lights
-
-            X="R"
-            for i in range (12):
-                if(traffic.get(X+f"{(((i)%4)+1)}")):
-                    lgpio.gpio_write(H,traffic_lights[i],1)
-                if(i==3):
-                    X="G"
-                if(i==7):
-                    X="Y"
-            #########################################
-
-            num=traffic['C']
-            lgpio.gpio_write(H,digits[0],1)
-            lgpio.gpio_write(H,digits[1],1)
-            if(traffic['C']>9):
-
-                digit1=int(traffic['C']%10)
-                num=int(num/10)
-                # for i in range(7):
-                #     lgpio.gpio_write(H,segments[i],0)
-                countdown(num,digit1)
 
-            else:
-                # for i in range(7):
-                #     lgpio.gpio_write(H,segments[i],0)
-                countdown(0,num)
+        # the controller replaces the state file (a move event); traffic.json changes from the detectors are ignored
+        file_path = getattr(event, "dest_path", "") or event.src_path
+        if os.path.abspath(file_path) != os.path.abspath(STATE_PATH):
+            return
 
-        
-def start_monitoring():
-    """Start monitoring the folder for new images."""
+        apply_signal_state()
+
+def start_watching():
+    """Start the display thread and the folder observer; returns the observer"""
     event_handler = detected_image_Handler()
     observer = Observer()
     observer.schedule(event_handler, WATCH_FOLDER, recursive=True)
     observer.start()
+    display.start()
     print(f"Watching folder: {WATCH_FOLDER}")
-    
+    return observer
+
+def start_monitoring():
+    """Drive the lamps and the countdown display from the signal state until interrupted."""
+    observer = start_watching()
     try:
         while True:
-            time.sleep(1)
+            apply_signal_state() # also picks up a change whose file event was missed
+            time.sleep(0.5)
     except KeyboardInterrupt:
         observer.stop()
+        display.running=False
     observer.join()
+    gpio.close()
 
 if __name__ == "__main__":
     start_monitoring()
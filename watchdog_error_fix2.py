@@ -5,6 +5,8 @@ from google.cloud import vision
 import io
 import json
 from mongo_utils import save_license_plate_data  # Import MongoDB utility
+from event_log import EventLog
+import sqlite_utils
 
 client = vision.ImageAnnotatorClient.from_service_account_file('linen-marking-452309-e9-26175acd071a.json')
 
@@ -25,6 +27,8 @@ def save_dict(data):
         json.dump(data, file, indent=4)
 
 license_dict=load_dict()
+event_log=None # set with --event-log: plates are journaled and compacted into FILE_PATH by event_log.py
+use_sqlite=False # set with --sqlite
 ##################################################
 
 import os
@@ -59,12 +63,26 @@ def process_image(file_path, track_id):
         if texts:
             license_no = texts[0].description.strip()
             
-            # Save to MongoDB
-            save_license_plate_data(track_id, license_no)
+            # The detector names the crop <camera>_<run>_license_plate_<vehicle id>; older crops license_plate_<id>
+            key = sqlite_utils.parse_plate_file(track_id)
+            if key is None:
+                camera, run_id, vehicle_id, plate_id = None, None, track_id, track_id
+            else:
+                camera, run_id, vehicle_id = key
+                plate_id = f"license_plate_{vehicle_id}"
+
+            # Save to MongoDB, or to SQLite under the detector's (camera, run, vehicle id) with --sqlite
+            if use_sqlite:
+                sqlite_utils.save_license_plate_data(vehicle_id, license_no, camera=camera, run_id=run_id)
+            else:
+                save_license_plate_data(plate_id, license_no)
             
             # Also save to JSON file for backwards compatibility
-            license_dict[track_id] = license_no
-            save_dict(license_dict)
+            if event_log is not None:
+                event_log.append("plate", camera, plate_id, license_no)
+            else:
+                license_dict[plate_id] = license_no
+                save_dict(license_dict)
             
             print(f"Detected License No. [{license_no}]")
         else:
@@ -107,4 +125,14 @@ def start_monitoring():
     observer.join()
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--event-log', help='Append plates to this event journal instead of rewriting new_license_data.json', default=None)
+    parser.add_argument('--sqlite', help='Save plates to this SQLite file instead of MongoDB (sync later with sqlite_utils.py --sync)', default=None)
+    args = parser.parse_args()
+    if args.sqlite:
+        sqlite_utils.configure(args.sqlite)
+        use_sqlite = True
+    if args.event_log:
+        event_log = EventLog(args.event_log)
     start_monitoring()
\ No newline at end of file
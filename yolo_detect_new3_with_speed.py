@@ -4,6 +4,7 @@ from watchdog.events import FileSystemEventHandler
 from google.cloud import vision
 import io
 import json
+from sqlite_utils import parse_plate_file
 
 client = vision.ImageAnnotatorClient.from_service_account_file('linen-marking-452309-e9-26175acd071a.json')
 
@@ -57,6 +58,9 @@ def process_image(file_path, track_id):
 
         if texts:
             license_no = texts[0].description.strip()
+            key = parse_plate_file(track_id) # <camera>_<run>_license_plate_<vehicle id> from the detector
+            if key is not None:
+                track_id = f"license_plate_{key[2]}"
             license_dict[track_id] = license_no
             save_dict(license_dict)
             print(f"Detected License No. [{license_no}]")
@@ -0,0 +1,190 @@
+"""
+Line and polygon zone counting
+
+Zones are loaded per camera from a JSON config:
+
+    {
+        "R1": {
+            "lines": [
+                {"name": "stop_line", "points": [[0, 490], [1280, 490]], "directions": ["down", "up"]}
+            ],
+            "polygons": [
+                {"name": "queue", "points": [[300, 300], [900, 300], [1200, 700], [100, 700]]}
+            ]
+        }
+    }
+
+A track crosses a line when the segment from its previous to its current
+centroid intersects the line segment; the direction is the side it moved to
+(the first label when it moves to the right of A->B in image coordinates).
+A track enters or exits a polygon when its inside/outside state changes. All
+lines and polygon edges are tested against all tracks in one NumPy pass per
+frame. A track is counted once per line, in the direction it first crossed, so
+a centroid jittering across the line does not count again; for a polygon it
+is counted once entering and once leaving, and the polygon's class counts are
+its entries.
+"""
+
+import json
+import numpy as np
+
+# Old hard-coded counting line (line1_x1..line1_y2 in the R scripts)
+DEFAULT_ZONES = {
+    "lines": [{"name": "line1", "points": [[0, 490], [1280, 490]], "directions": ["down", "up"]}],
+    "polygons": [],
+}
+POLYGON_DIRECTIONS = ["in", "out"]
+
+def load_zone_config(path, camera):
+    """Load the zone definitions for one camera, falling back to the old single line"""
+    if not path:
+        return DEFAULT_ZONES
+    try:
+        with open(path, "r") as file:
+            return json.load(file)[camera]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+        print(f"[WARN] No zones for {camera} in {path} ({e}), using the default counting line")
+        return DEFAULT_ZONES
+
+def _cross(ax, ay, bx, by):
+    return ax * by - ay * bx
+
+class ZoneCounter:
+    def __init__(self, config, class_names, max_age=30):
+        self.class_names = list(class_names)
+        self.class_index = {name: i for i, name in enumerate(self.class_names)}
+        lines = config.get("lines", [])
+        polygons = config.get("polygons", [])
+        self.zone_names = [zone["name"] for zone in lines] + [zone["name"] for zone in polygons]
+        self.directions = [zone.get("directions", ["forward", "backward"]) for zone in lines] + \
+                          [zone.get("directions", POLYGON_DIRECTIONS) for zone in polygons]
+        self.lines = [tuple((int(x), int(y)) for x, y in zone["points"][:2]) for zone in lines]
+        self.polygons = [[(int(x), int(y)) for x, y in zone["points"]] for zone in polygons]
+        self.n_lines = len(lines)
+
+        # Line segments as (L,) coordinate arrays
+        seg = np.asarray([a + b for a, b in self.lines], dtype=np.float64).reshape(-1, 4)
+        self.ax, self.ay, self.bx, self.by = seg.T
+        # All polygon edges concatenated, with the start offset of each polygon for reduceat
+        edges = []
+        self.edge_starts = []
+        for poly in self.polygons:
+            self.edge_starts.append(len(edges))
+            edges.extend(p + poly[(i + 1) % len(poly)] for i, p in enumerate(poly))
+        edges = np.asarray(edges, dtype=np.float64).reshape(-1, 4)
+        self.ex1, self.ey1, self.ex2, self.ey2 = edges.T
+        self.edge_starts = np.asarray(self.edge_starts, dtype=np.int64)
+
+        # counts[zone, class, direction]
+        self.counts = np.zeros((len(self.zone_names), len(self.class_names), 2), dtype=np.int64)
+        self.occupancy = np.zeros((len(self.polygons), len(self.class_names)), dtype=np.int64)
+        self.prev = {}      # track_id -> (x, y, last frame)
+        self.counted = set()
+        self.frame_idx = 0
+        self.max_age = max_age
+
+    @classmethod
+    def from_config(cls, path, camera, class_names):
+        return cls(load_zone_config(path, camera), class_names)
+
+    def _inside(self, px, py):
+        """(N, P) point-in-polygon by ray casting over every polygon edge at once"""
+        if not len(self.polygons) or not len(px):
+            return np.zeros((len(px), len(self.polygons)), dtype=bool)
+        px = px[:, None]
+        py = py[:, None]
+        straddle = (self.ey1 > py) != (self.ey2 > py)
+        dy = np.where(self.ey2 != self.ey1, self.ey2 - self.ey1, 1.0)
+        x_at = (self.ex2 - self.ex1) * (py - self.ey1) / dy + self.ex1
+        hits = (straddle & (px < x_at)).astype(np.int64)
+        return np.add.reduceat(hits, self.edge_starts, axis=1) % 2 == 1
+
+    def update(self, track_ids, centres, classes):
+        """Process one frame of tracks; returns crossing events (zone, track_id, class, direction)"""
+        self.frame_idx += 1
+        n = len(track_ids)
+        centres = np.asarray(centres, dtype=np.float64).reshape(-1, 2)
+        classes = np.asarray(classes, dtype=np.int64).reshape(-1)
+        x1, y1 = centres[:, 0], centres[:, 1]
+        prev = [self.prev.get(track_id) for track_id in track_ids]
+        has_prev = np.fromiter((p is not None for p in prev), dtype=bool, count=n)
+        x0 = np.fromiter((p[0] if p else 0.0 for p in prev), dtype=np.float64, count=n)
+        y0 = np.fromiter((p[1] if p else 0.0 for p in prev), dtype=np.float64, count=n)
+        for track_id, x, y in zip(track_ids, x1.tolist(), y1.tolist()):
+            self.prev[track_id] = (x, y, self.frame_idx)
+
+        hit_track = []
+        hit_zone = []
+        hit_dir = []
+        if self.n_lines and n:
+            # (N, L) side of each line before and after, and whether the motion straddles the segment
+            dx, dy = self.bx - self.ax, self.by - self.ay
+            side0 = _cross(dx, dy, x0[:, None] - self.ax, y0[:, None] - self.ay)
+            side1 = _cross(dx, dy, x1[:, None] - self.ax, y1[:, None] - self.ay)
+            mx, my = (x1 - x0)[:, None], (y1 - y0)[:, None]
+            sa = _cross(mx, my, self.ax - x0[:, None], self.ay - y0[:, None])
+            sb = _cross(mx, my, self.bx - x0[:, None], self.by - y0[:, None])
+            within = (sa * sb <= 0) & has_prev[:, None]
+            forward = within & (side0 <= 0) & (side1 > 0)
+            backward = within & (side0 >= 0) & (side1 < 0)
+            for direction, mask in ((0, forward), (1, backward)):
+                t, z = np.nonzero(mask)
+                hit_track.append(t)
+                hit_zone.append(z)
+                hit_dir.append(np.full(len(t), direction))
+        if len(self.polygons):
+            inside1 = self._inside(x1, y1)
+            inside0 = self._inside(x0, y0) & has_prev[:, None]
+            self.occupancy[:] = 0
+            t, p = np.nonzero(inside1)
+            np.add.at(self.occupancy, (p, classes[t]), 1)
+            for direction, mask in ((0, ~inside0 & inside1 & has_prev[:, None]), (1, inside0 & ~inside1)):
+                t, p = np.nonzero(mask)
+                hit_track.append(t)
+                hit_zone.append(p + self.n_lines)
+                hit_dir.append(np.full(len(t), direction))
+
+        events = []
+        if hit_track:
+            t = np.concatenate(hit_track)
+            z = np.concatenate(hit_zone)
+            d = np.concatenate(hit_dir)
+            for ti, zi, di in zip(t.tolist(), z.tolist(), d.tolist()):
+                # lines: one count per track whichever way it jitters; polygons: one entry and one exit
+                key = (zi, track_ids[ti], di if zi >= self.n_lines else None)
+                if key in self.counted:
+                    continue
+                self.counted.add(key)
+                self.counts[zi, classes[ti], di] += 1
+                events.append((self.zone_names[zi], track_ids[ti], self.class_names[classes[ti]], self.directions[zi][di]))
+
+        if self.frame_idx % self.max_age == 0:
+            self._expire()
+        return events
+
+    def _expire(self):
+        stale = {track_id for track_id, p in self.prev.items() if self.frame_idx - p[2] > self.max_age}
+        for track_id in stale:
+            del self.prev[track_id]
+        if stale:
+            self.counted = {key for key in self.counted if key[1] not in stale}
+
+    def crossed(self, zone, track_ids):
+        """(N,) bool: which tracks have been counted on a line zone (until they expire)"""
+        return np.fromiter(((zone, track_id, None) in self.counted for track_id in track_ids),
+                           dtype=bool, count=len(track_ids))
+
+    def class_counts(self, zone=0):
+        """{class name: vehicles counted} for one zone (line crossings, or polygon entries)"""
+        totals = self.counts[zone].sum(axis=1) if zone < self.n_lines else self.counts[zone, :, 0]
+        return dict(zip(self.class_names, totals.tolist()))
+
+    def zone_counts(self):
+        """{zone: {direction: {class: count}}} for every zone"""
+        return {
+            name: {
+                self.directions[z][d]: dict(zip(self.class_names, self.counts[z, :, d].tolist()))
+                for d in range(2)
+            }
+            for z, name in enumerate(self.zone_names)
+        }